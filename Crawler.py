@@ -1,288 +1,890 @@
+import argparse
 import asyncio
+import contextlib
+import dataclasses
+import itertools
 import logging
+import multiprocessing
 import os
-import json
+import queue
 import random
 import time
 import re
+import threading
+import zlib
 from datetime import datetime
-from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
+from urllib.parse import urlsplit
 import aiofiles
+from se_crawler.crawl_state import CrawlState, CRAWL_STATE_DB, normalize_url, QUEUED, NAVIGATING, CLICKING, DONE, FAILED
+from se_crawler.page_waiter import (ActivityTracker, QUIET_WINDOW_MS, REDIRECT_WAIT_CAP_MS, CLICK_SETTLE_CAP_MS,
+                                    FINAL_QUIET_WINDOW_MS, FINAL_WAIT_CAP_MS)
+from se_crawler.change_recorder import ChangeRecorder, split_records
+from se_crawler.url_source import iter_urls, dedup_urls, feed_queue
+from se_crawler.screenshot_store import ScreenshotStore, SiteScreenshots, SCREENSHOT_MODES_FILE, load_site_modes
+from se_crawler.network_policy import NetworkPolicy, HttpCache, HTTP_CACHE_DIR
+from se_crawler.results_sink import ResultsSink, RESULTS_DIR
+from se_crawler.metrics import (MetricsExporter, instrumented, timed, start_trace, active_pages, queue_depth,
+                                sites_total, clicks_total, screenshots_total)
+from se_crawler.click_planner import ClickPlanner
+from se_crawler.browser_pool import BrowserPool, BROWSER_POOL_SIZE, CONTEXTS_PER_BROWSER, SITES_PER_CONTEXT
+from se_crawler.concurrency import ConcurrencyController, MAX_ACTIVE_SITES, MAX_ACTIVE_SCREENSHOTS
+from se_crawler.host_scheduler import HostScheduler, classify_failure, MAX_SITES_PER_HOST, HOST_MIN_INTERVAL
+from se_crawler.preflight import Preflight, PreflightCache, PREFLIGHT_CACHE_DB, HOST_LEVEL_REASONS
+from se_crawler.fingerprint_index import FingerprintIndex, FINGERPRINT_DB
+from se_crawler.recrawl import take_baseline, diverged, next_interval, STRUCTURE_MAX_DEPTH
+from se_crawler.navigation_tracker import NavigationTracker
+from se_crawler.blob_store import BlobStore, SiteCapture
+from se_crawler.crawl_service import ControlServer, SERVICE_PORT
+from se_crawler.visual_diff import VisualDiffer
+# Playwright is imported when the first browser is needed, so importing this module stays cheap
 
-print("Hello!")
-print("Welcome to Web Crawler!")
-print("By: tkFlash!")
-
-# Configure logging
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
-
-# Stream handler for console output
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-console_handler.setFormatter(formatter)
-
-# Adding the console handler to the logger
-logger.addHandler(console_handler)
-
-# Error logger for file output
 error_logger = logging.getLogger('error_logger')
-file_handler = logging.FileHandler('errors.log')
-file_handler.setLevel(logging.ERROR)
-file_handler.setFormatter(formatter)
-error_logger.addHandler(file_handler)
+
+# File receiving errors once configure_logging() has been called
+ERRORS_LOG_FILE = 'errors.log'
 
 # Base directory for screenshots
 BASE_SCREENSHOTS_DIR = 'screenshots'
-os.makedirs(BASE_SCREENSHOTS_DIR, exist_ok=True)
 
 # File to log inaccessible URLs
 INACCESSIBLE_URLS_FILE = 'inaccessible_urls.txt'
-# File to log monitored URLs
+# Legacy file of monitored URLs, imported into the crawl state database on startup
 MONITORED_URLS_FILE = 'monitored_websites.txt'
 
-# Semaphore to limit the number of concurrent tasks
-SEMAPHORE_LIMIT = 10  # Adjust based on system resources
-semaphore = asyncio.Semaphore(SEMAPHORE_LIMIT)
+NAVIGATION_TIMEOUT_MS = 30000
+
+# Ceilings for the adaptive concurrency controller; the sites ceiling is also capped by the browser pool's capacity
+MAX_SITES = MAX_ACTIVE_SITES
+MAX_SCREENSHOTS = MAX_ACTIVE_SCREENSHOTS
+# Maximum number of URLs waiting to be picked up by a worker
+URL_QUEUE_SIZE = 100
+# How long the coordinator waits on a worker's full queue before checking that the worker is still alive
+WORKER_PUT_TIMEOUT = 5
+
+
+@dataclasses.dataclass
+class CrawlerConfig:
+    """Inputs, outputs and limits of a crawl. Defaults come from the module constants."""
+    screenshots_dir: str = BASE_SCREENSHOTS_DIR
+    results_dir: str = RESULTS_DIR
+    state_db: str = CRAWL_STATE_DB
+    inaccessible_file: str = INACCESSIBLE_URLS_FILE
+    monitored_file: str = MONITORED_URLS_FILE
+    error_log: str = ERRORS_LOG_FILE
+    # Caches and indexes shared across runs
+    fingerprint_db: str = FINGERPRINT_DB
+    preflight_db: str = PREFLIGHT_CACHE_DB
+    http_cache_dir: str = HTTP_CACHE_DIR
+    # Optional JSON file mapping hosts to a screenshot mode
+    screenshot_modes_file: str = SCREENSHOT_MODES_FILE
+    # Ceilings for the adaptive concurrency controller
+    max_sites: int = MAX_SITES
+    max_screenshots: int = MAX_SCREENSHOTS
+    browsers: int = BROWSER_POOL_SIZE
+    contexts_per_browser: int = CONTEXTS_PER_BROWSER
+    # Per-host politeness: sites of one host monitored at once, and seconds between two navigations to it
+    max_sites_per_host: int = MAX_SITES_PER_HOST
+    host_min_interval: float = HOST_MIN_INTERVAL
+    # Worker processes the crawl is sharded across
+    workers: int = 1
+    # Metrics export: Prometheus text on metrics_port and/or a periodic JSON file
+    metrics_port: int = None
+    metrics_file: str = None
+    # Append a per-site trace of phase timings to each site's change records
+    trace: bool = False
+    # Seed for click simulation; None means unseeded
+    seed: int = None
+    # Redo the URLs an interrupted run left in flight first, and skip the ones it finished
+    resume: bool = False
+    # Revisit monitored sites whose baseline is due instead of skipping them
+    recrawl: bool = False
+
+def configure_logging(error_log: str = ERRORS_LOG_FILE):
+    """Sends the crawler's messages to the console and errors to error_log. Done by the CLI, not on import."""
+    if logger.handlers:
+        return
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    logger.setLevel(logging.DEBUG)
+
+    # Stream handler for console output
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(formatter)
+    logger.addHandler(console_handler)
+
+    # Error logger for file output
+    file_handler = logging.FileHandler(error_log)
+    file_handler.setLevel(logging.ERROR)
+    file_handler.setFormatter(formatter)
+    error_logger.addHandler(file_handler)
 
 def sanitize_filename(filename):
     """Sanitizes a string to be a valid filename by removing or replacing invalid characters."""
     return re.sub(r'[<>:"/\\|?*\x00-\x1F]', '_', filename)
 
-async def take_screenshot(page, screenshot_path: str):
-    """Takes a screenshot of the current page with a longer timeout."""
+@instrumented('screenshot')
+async def take_screenshot(page, shots: SiteScreenshots, name: str):
+    """Takes a screenshot of the current page, storing it only if it differs from the previous frame."""
     try:
-        await page.screenshot(path=screenshot_path, full_page=True, timeout=60000)
-        logger.info(f"Screenshot saved: {screenshot_path}")
-    except PlaywrightTimeoutError:
-        error_logger.error("Failed to take screenshot: Timeout exceeded while waiting for fonts or other resources to load.")
+        screenshot_path = await shots.capture(page, name)
+        screenshots_total.inc(outcome='saved' if screenshot_path else 'unchanged')
+        if screenshot_path:
+            logger.info(f"Screenshot saved: {screenshot_path}")
+        else:
+            logging.info(f"Screenshot {name} unchanged since the previous frame. Skipped.")
     except Exception as e:
-        error_logger.error(f"Failed to take screenshot: {e}")
-
-async def monitor_changes(page, click_description):
-    """Monitors and logs changes on the page after a click."""
+        if classify_failure(e) == 'timeout':
+            error_logger.error("Failed to take screenshot: Timeout exceeded while waiting for fonts or other resources to load.")
+        else:
+            error_logger.error(f"Failed to take screenshot: {e}")
+
+@instrumented('monitor_changes')
+async def monitor_changes(click_description, recorder: ChangeRecorder, html: bool = False):
+    """Logs the DOM changes, new scripts and stylesheets, iframes and cookie and storage changes recorded on the
+    page since the last call, collected in a single snapshot. With html, the page's HTML is included too,
+    spilled to the blob store when it is large."""
     changes = {}
     try:
-        html_content = await page.content()
-        js_content = await page.evaluate('Array.from(document.scripts).map(s => s.outerHTML).join("\\n")')
-        css_content = await page.evaluate('Array.from(document.styleSheets).map(s => s.ownerNode.outerHTML).join("\\n")')
-        current_url = page.url
+        snapshot = await recorder.snapshot(html=html)
+        records = snapshot["records"]
 
         now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         changes = {
             "timestamp": now,
             "click_description": click_description,
-            "url": current_url,
-            "html_snippet": html_content[:200],
-            "js_snippet": js_content[:200],
-            "css_snippet": css_content[:200]
+            "url": snapshot["url"],
+            **split_records(records),
+            "frames": snapshot["frames"],
+            "cookies": snapshot["cookies"],
+            "storage": snapshot["storage"]
         }
-        logging.info("Changes detected and logged.")
+        if html:
+            changes["html"] = snapshot.get("html")
+            if recorder.capture is not None:
+                changes["html"] = await recorder.capture.spill(changes["html"])
+        logging.info(f"{len(records)} changes detected and logged.")
     except Exception as e:
         error_logger.error(f"Error while monitoring changes: {e}")
     
     return changes
 
-async def handle_redirection_or_new_tab(page, element_text, screenshots_dir, changes_list):
-    """Handles possible redirection or new tabs after a click."""
+async def handle_redirection(page, element_text, shots: SiteScreenshots, changes_list, tracker: ActivityTracker,
+                             recorder: ChangeRecorder):
+    """Handles a possible redirection of the page after a click. New tabs are captured by the navigation tracker."""
     initial_url = page.url
     try:
-        # Increase the timeout for waiting on redirections or new tabs
-        await page.wait_for_timeout(10000)  # Wait for up to 10 seconds
-
-        pages = [page]
-        for context_page in page.context.pages:
-            if context_page.url != initial_url and context_page not in pages:
-                pages.append(context_page)
-
-        for p in pages:
-            if p.url != initial_url:
-                if p != page:
-                    logging.info(f"New tab detected: {p.url}")
-                    await p.wait_for_load_state()
-                    redirected_changes = await monitor_changes(p, f"New tab after click: {element_text}")
-                    changes_list.append(redirected_changes)
-                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    redirected_screenshot_path = f"{screenshots_dir}/{timestamp}_new_tab_screenshot.png"
-                    await take_screenshot(p, redirected_screenshot_path)
-                    await p.close()
-                else:
-                    logging.info(f"Redirection detected: {p.url}")
-                    redirected_changes = await monitor_changes(p, f"Redirection after click: {element_text}")
-                    changes_list.append(redirected_changes)
-                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    redirected_screenshot_path = f"{screenshots_dir}/{timestamp}_redirected_screenshot.png"
-                    await take_screenshot(p, redirected_screenshot_path)
-                    await p.go_back()
-
-    except asyncio.TimeoutError:
-        logging.info("No redirection or new tab detected within the timeout period.")
+        # Wait until the page settles, for up to 10 seconds
+        with timed('redirect_wait'):
+            waited = await tracker.wait_for_quiet(QUIET_WINDOW_MS, REDIRECT_WAIT_CAP_MS)
+        logging.info(f"Page settled after {waited:.2f} seconds.")
+
+        if page.url != initial_url:
+            logging.info(f"Redirection detected: {page.url}")
+            redirected_changes = await monitor_changes(f"Redirection after click: {element_text}", recorder, html=True)
+            changes_list.append(redirected_changes)
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            await take_screenshot(page, shots, f"{timestamp}_redirected_screenshot")
+            await page.go_back()
+
     except Exception as e:
-        error_logger.error(f"Error handling redirection or new tab: {e}")
+        error_logger.error(f"Error handling redirection: {e}")
 
-async def simulate_clicks(page, screenshots_dir, changes_list):
-    """Simulates random clicks on a webpage and monitors for changes."""
-    num_clicks = random.randint(5, 10)
+async def capture_new_tab(tab, element_text, shots: SiteScreenshots, changes_list, capture: SiteCapture = None,
+                          fingerprints: FingerprintIndex = None):
+    """Captures the changes and a screenshot of a tab opened by a click, then closes it."""
+    try:
+        await tab.wait_for_load_state(timeout=REDIRECT_WAIT_CAP_MS)
+        tab_recorder = await ChangeRecorder.attach(tab, capture, fingerprints)
+        tab_changes = await monitor_changes(f"New tab after click: {element_text}", tab_recorder, html=True)
+        changes_list.append(tab_changes)
+        # Tabs are captured concurrently, so the name needs more than second resolution
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        await take_screenshot(tab, shots, f"{timestamp}_new_tab_screenshot")
+    except Exception as e:
+        logging.info(f"New tab could not be captured (it may have closed itself): {e}")
+    finally:
+        try:
+            await tab.close()
+        except Exception:
+            pass
+
+def site_random(url, seed=None):
+    """Returns the random generator for a site, seeded per URL when a seed is given so runs are repeatable."""
+    if seed is None:
+        return random
+    return random.Random(f"{seed}:{url}")
+
+async def simulate_clicks(page, shots: SiteScreenshots, changes_list, recorder: ChangeRecorder, seed=None):
+    """Simulates clicks on the most promising elements of a webpage and monitors for changes."""
+    rng = site_random(page.url, seed)
+    num_clicks = rng.randint(5, 10)
     logging.info(f"Will attempt to perform up to {num_clicks} clicks on this webpage.")
 
     start_time = time.time()  # Track the start time
     click_duration = 120  # Time in seconds for which clicks will be performed
-    total_wait_duration = 120  # Total duration in seconds to wait after clicks
 
+    tracker = await ActivityTracker.attach(page)
+    planner = ClickPlanner(page, tracker, rng)
+    navigation = NavigationTracker(page, on_new_tab=lambda tab, label: capture_new_tab(tab, label, shots, changes_list,
+                                                                                  recorder.capture,
+                                                                                  recorder.fingerprints))
     try:
         for i in range(num_clicks):
             if time.time() - start_time > click_duration:
                 break  # Stop clicking if the time exceeds the allowed click duration
 
-            clickable_elements = await page.query_selector_all('a, button, input[type="button"], input[type="submit"], [onclick]')
-            
-            logging.info(f"Found {len(clickable_elements)} clickable elements on the page.")
-
-            if not clickable_elements:
-                logging.info("No clickable elements found on this page. Ending click simulation.")
+            target = await planner.next_target()
+            if target is None:
+                logging.info("No clickable elements left to try on this page. Ending click simulation.")
                 break
 
-            element = random.choice(clickable_elements)
+            element_text = target['text']
+            logging.info(f"Clicking on element: {element_text} (score {target['score']}, click {i + 1}/{num_clicks})")
+            navigation.begin_click(element_text)
+            try:
+                with timed('click'):
+                    clicked = await planner.click(target)
+            except Exception as e:
+                logging.info(f"Could not click element: {e}")
+                continue
+            if not clicked:
+                logging.info("Element is no longer in the page.")
+                continue
+            clicks_total.inc()
 
-            if await element.is_visible() and await element.is_enabled():
-                element_text = await page.evaluate('(element) => element.innerText || element.outerHTML', element)
-                logging.info(f"Clicking on element: {element_text} (click {i + 1}/{num_clicks})")
-                await element.click()
+            await handle_redirection(page, element_text, shots, changes_list, tracker, recorder)
 
-                await handle_redirection_or_new_tab(page, element_text, screenshots_dir, changes_list)
+            click_description = f"Clicked on element: {element_text}"
+            changes = await monitor_changes(click_description, recorder)
 
-                click_description = f"Clicked on element: {element_text}"
-                changes = await monitor_changes(page, click_description)
-                changes_list.append(changes)
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            await take_screenshot(page, shots, f"{timestamp}_click_{i+1}")
 
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                screenshot_path = f"{screenshots_dir}/{timestamp}_click_{i+1}.png"
-                await take_screenshot(page, screenshot_path)
+            with timed('settle_wait'):
+                await tracker.wait_for_quiet(QUIET_WINDOW_MS, CLICK_SETTLE_CAP_MS)
 
-                await page.wait_for_timeout(2000)  # Reduced wait time to 2 seconds
+            # Taken after settling so late hops of this click's redirect chains are included
+            changes["navigation"] = navigation.take_graph()
+            changes_list.append(changes)
 
-            else:
-                logging.info(f"Element not visible or not enabled: {await page.evaluate('(element) => element.outerHTML', element)}")
-
-        # Wait for the rest of the total wait duration if clicks were done in less time
+        # Keep observing for late ads until the page stays quiet, capped at the final wait duration
         elapsed_time = time.time() - start_time
-        remaining_time = total_wait_duration - elapsed_time
-        if remaining_time > 0:
-            logging.info(f"Waiting for the remaining {remaining_time:.2f} seconds.")
-            await page.wait_for_timeout(int(remaining_time * 1000))  # Convert seconds to milliseconds
+        remaining_ms = FINAL_WAIT_CAP_MS - elapsed_time * 1000
+        if remaining_ms > 0:
+            with timed('final_wait'):
+                waited = await tracker.wait_for_quiet(FINAL_QUIET_WINDOW_MS, int(remaining_ms))
+            logging.info(f"Page stayed quiet after a final wait of {waited:.2f} seconds.")
 
     except Exception as e:
         error_logger.error(f"Error during click simulation: {e}")
-
-async def is_site_accessible(page, url):
-    """Checks if a site is accessible by navigating to it."""
+    finally:
+        await navigation.drain()
+        late = navigation.take_graph()
+        if late["edges"] or late["pages"]:
+            changes_list.append({"timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'), "navigation": late})
+        navigation.detach()
+        tracker.detach()
+
+@instrumented('navigation')
+async def navigate_to_site(page, url, controller: ConcurrencyController = None):
+    """Navigates to a site. Returns (response, None) on success, otherwise (None, classified failure reason)."""
     try:
-        await page.goto(url, timeout=30000)
-        return True
-    except PlaywrightTimeoutError:
-        logging.warning(f"Timeout while trying to access {url}. Site may not be accessible.")
-        return False
+        start = time.monotonic()
+        response = await page.goto(url, timeout=NAVIGATION_TIMEOUT_MS)
+        if controller is not None:
+            controller.observe_navigation(time.monotonic() - start)
+        return response, None
     except Exception as e:
-        logging.warning(f"Error while trying to access {url}: {e}")
-        return False
-
-async def monitor_website(browser, url: str):
-    """Monitors a single website by navigating to it and simulating clicks."""
-    async with semaphore:
-        page = await browser.new_page()
-
-        changes_list = []  # Store changes for this URL
-
+        failure = classify_failure(e)
+        if failure == 'timeout':
+            logging.warning(f"Timeout while trying to access {url}. Site may not be accessible.")
+        else:
+            logging.warning(f"Error while trying to access {url}: {e}")
+        return None, failure
+
+async def log_inaccessible(crawler: 'Crawler', url, reason, reporter=None):
+    """Records a URL that could not be reached and will not be retried."""
+    filename = crawler.config.inaccessible_file
+    logging.info(f"Site {url} is not accessible ({reason}). Logging to {filename}.")
+    async with aiofiles.open(filename, 'a') as f:
+        await f.write(url + '\n')
+    crawler.state.set_state(url, FAILED, reason)
+    report_result(reporter, url, 'inaccessible')
+
+@instrumented('site')
+async def monitor_website(crawler: 'Crawler', url: str, reporter=None, slot_held: bool = False):
+    """Monitors a single website by navigating to it and simulating clicks.
+
+    Runs within the host's politeness limits and the controller's site budget. A URL whose host is busy or rate
+    limited is handed to the scheduler, which runs it again with slot_held once the host has a slot, so the worker
+    can take the next URL meanwhile. URLs of hosts that are down, and URLs the pre-flight check (run in the
+    host's slot) rejects, are skipped before a browser page is opened. Transient navigation failures are retried
+    later through the scheduler. A site with a stored baseline only gets the full click and screenshot session
+    if the freshly loaded page diverges from it. Large bodies are spilled to the blob store as they are
+    captured.
+    """
+    state, scheduler, controller = crawler.state, crawler.scheduler, crawler.controller
+    # Check if the URL has already been monitored, unless it is due for a revisit
+    if is_already_monitored(state, url) and not (crawler.config.recrawl and state.is_due(url)):
+        logging.info(f"URL {url} has already been monitored. Skipping.")
+        report_result(reporter, url, 'skipped')
+        return
+    dead_reason = scheduler.dead_reason(url)
+    if dead_reason is not None:
+        await log_inaccessible(crawler, url, f"host_down:{dead_reason}", reporter)
+        return
+    if not slot_held and not scheduler.available(url):
+        if scheduler.defer(url, lambda: monitor_or_fail(crawler, url, reporter, slot_held=True)):
+            logging.debug(f"Host of {url} is busy; deferring it.")
+            return
+
+    async with contextlib.AsyncExitStack() as held:
+        if not slot_held:
+            await held.enter_async_context(scheduler.slot(url))
+        # The host may have been found down while this URL waited for its slot
+        dead_reason = scheduler.dead_reason(url)
+        if dead_reason is not None:
+            await log_inaccessible(crawler, url, f"host_down:{dead_reason}", reporter)
+            return
+        # Pre-flight requests hit the site too, so they count against the host's politeness limits
+        verdict = await crawler.preflight.check(url)
+        if not verdict["viable"]:
+            if verdict["reason"] in HOST_LEVEL_REASONS:
+                scheduler.mark_dead(url, verdict["reason"])
+            await log_inaccessible(crawler, url, f"preflight:{verdict['reason']}", reporter)
+            return
+        await held.enter_async_context(controller.sites)
+
+        trace = start_trace() if crawler.config.trace else None
+        # The browsers are launched when the first site gets this far
+        async with crawler.lease() as lease:
+            crawler.policy.take_log(lease.context)  # Drop anything left over from the previous site
+            active_pages.inc()
+
+            try:
+                # Inside the try: a crashed browser fails this URL instead of leaving it in flight
+                page = await lease.new_page()
+                logging.info(f"Checking accessibility of {url}...")
+                state.set_state(url, NAVIGATING)
+                response, failure = await navigate_to_site(page, url, controller)
+                if failure is not None:
+                    delay = scheduler.record_failure(url, failure)
+                    if delay is None:
+                        await log_inaccessible(crawler, url, failure, reporter)
+                        return
+                    logging.info(f"Navigation to {url} failed ({failure}). Retrying in {delay:.0f}s.")
+                    state.set_state(url, QUEUED, f"retry:{failure}")
+                    report_result(reporter, url, 'retrying')
+                    # Looked up at call time so wrappers of monitor_website see the retry too
+                    scheduler.retry_later(delay, lambda: monitor_or_fail(crawler, url, reporter))
+                    return
+                scheduler.record_success(url)
+
+                logging.info(f"Successfully navigated to {url}")
+
+                # The initial state comes from the recorder's first snapshot, in one round trip. The HTML is only
+                # serialized up front when there is no baseline that could make the site's session unnecessary
+                capture = SiteCapture(crawler.blobs, url)
+                recorder = await ChangeRecorder.attach(page, capture, crawler.fingerprints)
+                stored = state.get_baseline(url)
+                initial = await recorder.snapshot(html=stored is None, structure_depth=STRUCTURE_MAX_DEPTH)
+                initial_resources = split_records(initial["records"])
+
+                # Compare the cheap load against the site's baseline before spending a full session on it
+                baseline = take_baseline(initial, response, initial_resources)
+                interval = stored[1] if stored else None
+                change = diverged(stored[0], baseline) if stored else 'new'
+                if change is None:
+                    interval = next_interval(interval, changed=False)
+                    state.save_baseline(url, baseline, interval, changed=False)
+                    logging.info(f"{url} matches its baseline. Next visit in {interval / 3600:.1f}h.")
+                    state.set_state(url, DONE, 'unchanged')
+                    report_result(reporter, url, 'unchanged')
+                    return
+
+                # Only create directories and start monitoring if the site is accessible
+                sanitized_url = sanitize_filename(url)
+                screenshots_dir = os.path.join(crawler.config.screenshots_dir, sanitized_url)
+                os.makedirs(screenshots_dir, exist_ok=True)
+
+                # Changes for this URL are streamed to the results sink as they are appended,
+                # and their scripts and stylesheets are fingerprinted on the way
+                changes_list = crawler.fingerprints.open_site(url, crawler.sink.open_site(url, attempt=state.get_state(url)[2]))
+
+                # Capture initial state
+                initial_state = {
+                    "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    "initial_url": url,
+                    "preflight": verdict,
+                    "baseline_change": change,
+                    "redirect_chain": baseline["chain"],
+                    "initial_html": await capture.spill(initial.get("html") or await page.content()),
+                    "initial_js": initial_resources["new_scripts"],
+                    "initial_css": initial_resources["new_stylesheets"],
+                    "initial_frames": initial["frames"],
+                    "initial_cookies": initial["cookies"],
+                    "initial_storage": initial["storage"]
+                }
+                changes_list.append(initial_state)  # Save initial state
+
+                shots = crawler.store.for_site(url, screenshots_dir)
+                state.set_state(url, CLICKING)
+                await simulate_clicks(page, shots, changes_list, recorder, crawler.config.seed)
+
+                # Diffs of consecutive frames and against the last run run in a process pool during the clicks
+                visual_changes = await shots.visual_changes()
+                if visual_changes is not None:
+                    changes_list.append({
+                        "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                        "visual_changes": visual_changes
+                    })
+
+                # Record what the network policy kept from the page so the analysis knows what it did not see
+                changes_list.append({
+                    "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    "blocked_requests": crawler.policy.take_log(lease.context)
+                })
+                changes_list.append({"capture": capture.summary()})
+                if trace is not None:
+                    changes_list.append({"trace": list(trace), "seconds": round(time.monotonic() - trace.started, 3)})
+
+                logging.info(f"Finished monitoring {url}. {len(changes_list)} change records streamed to {crawler.config.results_dir}, screenshots saved to {screenshots_dir}")
+
+                changes_list.commit()
+                state.save_baseline(url, baseline, next_interval(interval, changed=stored is not None), changed=True)
+
+                # Log the monitored URL
+                log_monitored_url(state, url)
+                state.set_state(url, DONE)
+                report_result(reporter, url, 'monitored')
+
+            except Exception as e:
+                error_logger.error(f"Error while monitoring {url}: {e}")
+                state.set_state(url, FAILED, str(e)[:500])
+                report_result(reporter, url, 'failed')
+
+            finally:
+                active_pages.dec()
+
+async def monitor_or_fail(crawler: 'Crawler', url: str, reporter=None, slot_held: bool = False):
+    """Runs monitor_website, recording an unexpected error as the URL's failure.
+
+    Workers, deferred URLs and retries all go through here, so every URL ends with an outcome.
+    """
+    try:
+        await monitor_website(crawler, url, reporter, slot_held)
+    except Exception as e:
+        error_logger.error(f"Error while monitoring {url}: {e}")
+        crawler.state.set_state(url, FAILED, str(e)[:500])
+        report_result(reporter, url, 'failed')
+
+def report_result(reporter, url, status):
+    """Counts the outcome for a URL and passes it to the progress reporter, if there is one."""
+    sites_total.inc(status=status)
+    if reporter is not None:
         try:
-            # Check if the URL has already been monitored
-            if await is_already_monitored(url):
-                logging.info(f"URL {url} has already been monitored. Skipping.")
-                return
-
-            logging.info(f"Checking accessibility of {url}...")
-            if not await is_site_accessible(page, url):
-                logging.info(f"Site {url} is not accessible. Logging to {INACCESSIBLE_URLS_FILE}.")
-                async with aiofiles.open(INACCESSIBLE_URLS_FILE, 'a') as f:
-                    await f.write(url + '\n')
-                return
-
-            logging.info(f"Successfully navigated to {url}")
-
-            # Only create directories and start monitoring if the site is accessible
-            sanitized_url = sanitize_filename(url)
-            screenshots_dir = os.path.join(BASE_SCREENSHOTS_DIR, sanitized_url)
-            os.makedirs(screenshots_dir, exist_ok=True)
-
-            # Capture initial state
-            initial_state = {
-                "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                "initial_url": url,
-                "initial_html": await page.content(),
-                "initial_js": await page.evaluate('Array.from(document.scripts).map(s => s.outerHTML).join("\\n")'),
-                "initial_css": await page.evaluate('Array.from(document.styleSheets).map(s => s.ownerNode.outerHTML).join("\\n")')
-            }
-            changes_list.append(initial_state)  # Save initial state
-
-            await simulate_clicks(page, screenshots_dir, changes_list)
-
-            # Save the changes to a JSON file
-            json_filename = os.path.join(screenshots_dir, "changes.json")
-            async with aiofiles.open(json_filename, 'w') as json_file:
-                await json_file.write(json.dumps(changes_list, indent=4))
-
-            logging.info(f"Finished monitoring {url}. Results saved to {screenshots_dir}")
-
-            # Log the monitored URL
-            await log_monitored_url(url)
-
+            reporter(url, status)
         except Exception as e:
-            error_logger.error(f"Error while monitoring {url}: {e}")
-
-        finally:
-            await page.close()
+            error_logger.error(f"Error while reporting progress for {url}: {e}")
+
+def is_already_monitored(state: CrawlState, url):
+    """Checks if the URL has already been monitored using the in-memory crawl state index."""
+    return state.is_monitored(url)
+
+def log_monitored_url(state: CrawlState, url):
+    """Records the URL in the crawl state after successful monitoring."""
+    state.mark_monitored(url)
+
+class Crawler:
+    """Monitors websites on a shared browser pool that stays up between batches.
+
+    Use it as a library (`async with Crawler(config) as crawler: await crawler.crawl(urls)`), from the CLI,
+    or as a long-running service taking URLs over a local HTTP API (serve). Playwright is imported and the
+    browsers are launched only when the first site needs a page.
+    context_setup, if given, is awaited with every new browser context after the network policy is installed.
+    """
+
+    def __init__(self, config: CrawlerConfig = None, reporter=None, context_setup=None):
+        self.config = config or CrawlerConfig()
+        self.reporter = reporter
+        self.context_setup = context_setup
+        self.outcomes = {}
+        self.playwright = None
+        self.pool = None
+        self.url_queue = None
+
+    async def start(self):
+        """Opens the crawl state, caches and stores. Cheap: no browser is launched yet."""
+        config = self.config
+        self.state = CrawlState(config.state_db)
+        self.state.migrate_text_file(config.monitored_file)
+        self.scheduler = HostScheduler(config.max_sites_per_host, config.host_min_interval)
+        self.preflight = Preflight(PreflightCache(config.preflight_db))
+        self.fingerprints = FingerprintIndex(config.fingerprint_db)
+        # The sites ceiling is also capped by the browser pool's capacity
+        self.controller = ConcurrencyController(max_sites=min(config.max_sites, config.browsers * config.contexts_per_browser),
+                                                max_screenshots=config.max_screenshots)
+        self.differ = VisualDiffer()
+        self.store = ScreenshotStore(config.screenshots_dir, site_modes=load_site_modes(config.screenshot_modes_file),
+                                     limiter=self.controller.screenshots, differ=self.differ)
+        self.policy = NetworkPolicy(cache=HttpCache(config.http_cache_dir))
+        await asyncio.to_thread(self.policy.cache.prune)
+        self.sink = ResultsSink(config.results_dir)
+        self.blobs = BlobStore(os.path.join(config.results_dir, 'blobs'))
+        self.exporter = MetricsExporter(config.metrics_port, config.metrics_file)
+        self.launch_lock = asyncio.Lock()
+        await self.exporter.start()
+        self.controller.start()
+        return self
+
+    async def browsers(self) -> BrowserPool:
+        """Returns the browser pool, importing Playwright and launching the browsers on first use."""
+        async with self.launch_lock:
+            if self.pool is None:
+                from playwright.async_api import async_playwright
+                self.playwright = await async_playwright().start()
+                # Each site gets its own isolated context; the controller decides how many are in use at once
+                pool = BrowserPool(self.playwright, browsers=self.config.browsers,
+                                   contexts_per_browser=self.config.contexts_per_browser,
+                                   sites_per_context=SITES_PER_CONTEXT, on_new_context=self._setup_context)
+                await pool.start()
+                self.pool = pool
+        return self.pool
+
+    @contextlib.asynccontextmanager
+    async def lease(self):
+        """Leases a browser context for one site."""
+        pool = await self.browsers()
+        async with pool.lease() as lease:
+            yield lease
+
+    async def _setup_context(self, context):
+        await self.policy.attach(context)
+        if self.context_setup is not None:
+            await self.context_setup(context)
+
+    def _report(self, url, status):
+        self.outcomes[status] = self.outcomes.get(status, 0) + 1
+        if self.reporter is not None:
+            self.reporter(url, status)
+
+    async def _worker(self, url_queue: asyncio.Queue):
+        while (url := await url_queue.get()) is not None:
+            await monitor_or_fail(self, url, self._report)
+
+    def _start_workers(self):
+        self.url_queue = asyncio.Queue(maxsize=URL_QUEUE_SIZE)
+        queue_depth.callback = self.url_queue.qsize
+        # One worker per slot the controller may ever grant
+        return [asyncio.create_task(self._worker(self.url_queue)) for _ in range(self.controller.sites.ceiling)]
+
+    async def crawl(self, urls):
+        """Monitors the URLs from an iterable through a bounded queue, returning once they and their retries are done.
+
+        With config.resume, URLs the previous run left in flight are monitored first and finished ones are skipped.
+        With config.recrawl, monitored sites that are due for a revisit are let through.
+        """
+        workers = self._start_workers()
+        await feed_queue(dedup_urls(urls, self.state, self.config.resume, self.config.recrawl), self.url_queue,
+                         len(workers))
+        await asyncio.gather(*workers)
+        # Retries are scheduled outside the worker loop and may still be waiting out their backoff
+        await self.scheduler.drain()
+
+    async def submit(self, urls) -> int:
+        """Queues new URLs for the running service, waiting while the queue is full. Returns how many were queued.
+
+        The service is one long run, so URLs that failed earlier in it may be posted again.
+        """
+        queued = 0
+        for url in dedup_urls(urls, self.state, recrawl=self.config.recrawl, retry_failed=True):
+            await self.url_queue.put(url)
+            queued += 1
+        return queued
+
+    def status(self) -> dict:
+        """Returns the queue depth, outcomes so far and concurrency limits."""
+        return {
+            "queued": self.url_queue.qsize() if self.url_queue is not None else 0,
+            "outcomes": dict(self.outcomes),
+            "limits": self.controller.limits(),
+            "browsers_running": self.pool is not None,
+        }
 
-async def is_already_monitored(url):
-    """Checks if the URL has already been monitored by checking the monitored_websites.txt file."""
-    try:
-        async with aiofiles.open(MONITORED_URLS_FILE, 'r') as file:
-            async for line in file:
-                if url in line:
-                    return True
-    except FileNotFoundError:
-        # If the file does not exist, assume no URLs have been monitored yet
-        return False
-    return False
-
-async def log_monitored_url(url):
-    """Logs the URL to monitored_websites.txt after successful monitoring."""
-    async with aiofiles.open(MONITORED_URLS_FILE, 'a') as file:
-        await file.write(url + '\n')
-
-async def monitor_websites(urls):
-    """Monitors multiple websites concurrently."""
-    async with async_playwright() as playwright:
-        browser = await playwright.chromium.launch(headless=True)
+    async def serve(self, port: int = SERVICE_PORT):
+        """Runs as a service: URLs posted to the local API are monitored on warm browsers until /shutdown."""
+        await self.browsers()
+        workers = self._start_workers()
+        server = ControlServer(self.submit, self.status, port)
+        await server.start()
         try:
-            tasks = [monitor_website(browser, url) for url in urls]
-            await asyncio.gather(*tasks)
+            await server.wait_for_shutdown()
         finally:
-            await browser.close()
+            await server.stop()
+            logging.info("Shutting down once the queued URLs are done.")
+            for _ in workers:
+                await self.url_queue.put(None)
+            await asyncio.gather(*workers)
+            await self.scheduler.drain()
+
+    async def close(self):
+        await self.controller.stop()
+        await self.preflight.close()
+        if self.pool is not None:
+            await self.pool.close()
+        if self.playwright is not None:
+            await self.playwright.stop()
+        await self.exporter.stop()
+        self.store.close()
+        self.differ.close()
+        self.sink.close()
+        self.fingerprints.close()
+        self.state.close()
+        logging.info(f"Screenshots saved: {self.store.saved}, skipped as unchanged: {self.store.skipped}")
+        logging.info(f"HTTP cache hits: {self.policy.cache.hits}, misses: {self.policy.cache.misses}")
+        logging.info(f"Change records written: {self.sink.written}")
+        logging.info(f"Final concurrency limits: {self.controller.limits()}")
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+async def monitor_websites(urls, reporter=None, context_setup=None, config: CrawlerConfig = None):
+    """Monitors websites from an iterable of URLs with a fresh Crawler, closing it when they are done."""
+    async with Crawler(config, reporter, context_setup) as crawler:
+        await crawler.crawl(urls)
 
 def load_urls(filename):
-    """Loads URLs from a text file."""
-    with open(filename, 'r') as file:
-        urls = [line.strip() for line in file.readlines()]
-    return urls
+    """Loads all URLs from a text file into a list."""
+    return list(iter_urls(filename))
+
+def shard_index(url, num_shards):
+    """Picks the shard for a URL by host so all pages of a site land on the same worker."""
+    host = urlsplit(normalize_url(url)).hostname or ''
+    return zlib.crc32(host.encode()) % num_shards
+
+def worker_inaccessible_file(filename, index):
+    """Returns the per-worker inaccessible URL file merged by the coordinator."""
+    return f"{filename}.worker{index}"
+
+def worker_config(config: CrawlerConfig, index) -> CrawlerConfig:
+    """Returns the configuration of a worker process. The coordinator already dedups and resumes."""
+    return dataclasses.replace(
+        config,
+        # Each worker appends to its own file so concurrent writes never interleave
+        inaccessible_file=worker_inaccessible_file(config.inaccessible_file, index),
+        # Every worker exports its own metrics
+        metrics_port=config.metrics_port + index if config.metrics_port else None,
+        metrics_file=f"{config.metrics_file}.worker{index}" if config.metrics_file else None,
+        resume=False,
+    )
+
+def run_worker(index, input_queue, progress_queue, config: CrawlerConfig):
+    """Entry point of a worker process: runs its own event loop and browser pool over the URLs it is sent."""
+    configure_logging(config.error_log)
+    reporter = lambda url, status: progress_queue.put((index, url, status))
+    try:
+        asyncio.run(monitor_websites(iter(input_queue.get, None), reporter, config=worker_config(config, index)))
+    finally:
+        progress_queue.put((index, None, 'exit'))
+
+def merge_worker_files(filename, num_workers):
+    """Appends the per-worker inaccessible URL files to the main file and removes them."""
+    with open(filename, 'a') as merged:
+        for index in range(num_workers):
+            worker_file = worker_inaccessible_file(filename, index)
+            if not os.path.exists(worker_file):
+                continue
+            with open(worker_file, 'r') as f:
+                merged.write(f.read())
+            os.remove(worker_file)
+
+def put_to_worker(item, index, input_queues, processes, dead) -> bool:
+    """Puts an item on a worker's queue, waiting while it is full. Returns False, and adds the worker to dead,
+    if the worker exits meanwhile."""
+    while True:
+        try:
+            input_queues[index].put(item, timeout=WORKER_PUT_TIMEOUT)
+            return True
+        except queue.Full:
+            if processes is not None and not processes[index].is_alive():
+                error_logger.error(f"Worker {processes[index].name} is gone; its shard moves to the other workers. "
+                                   f"URLs it had queued stay queued in the journal for --resume.")
+                dead.add(index)
+                return False
+
+def distribute_urls(urls, input_queues, config: CrawlerConfig, processes=None):
+    """Streams deduplicated URLs to the worker input queues, then tells every worker to stop.
+
+    A worker found dead while its queue is full loses its shard: its URLs are sharded over the remaining workers.
+    """
+    state = CrawlState(config.state_db)
+    state.migrate_text_file(config.monitored_file)
+    dead = set()
+    try:
+        for url in dedup_urls(urls, state, config.resume, config.recrawl):
+            try:
+                while True:
+                    live = [index for index in range(len(input_queues)) if index not in dead]
+                    if not live:
+                        error_logger.error("Every worker is gone; no more URLs are queued.")
+                        return
+                    if put_to_worker(url, live[shard_index(url, len(live))], input_queues, processes, dead):
+                        break
+            except Exception as e:
+                # One bad entry must not stop the feed for the rest of the URLs
+                error_logger.error(f"Could not queue {url[:100]}: {e}")
+    except Exception as e:
+        error_logger.error(f"Error while reading URLs: {e}")
+    finally:
+        state.close()
+        for index in range(len(input_queues)):
+            if index not in dead:
+                put_to_worker(None, index, input_queues, processes, dead)
+
+def run_sharded(urls, config: CrawlerConfig):
+    """Coordinates config.workers worker processes over sharded URLs, aggregating their progress."""
+    num_workers = config.workers
+    progress_queue = multiprocessing.Queue()
+    input_queues = [multiprocessing.Queue(maxsize=URL_QUEUE_SIZE) for _ in range(num_workers)]
+    processes = []
+    for index, input_queue in enumerate(input_queues):
+        process = multiprocessing.Process(target=run_worker, args=(index, input_queue, progress_queue, config), name=f"crawler-worker-{index}")
+        process.start()
+        processes.append(process)
+    logger.info(f"Started {num_workers} workers.")
+
+    # Dedup against the crawl state and feed the workers in the background while we aggregate progress
+    distributor = threading.Thread(target=distribute_urls, args=(urls, input_queues, config, processes), daemon=True)
+    distributor.start()
+
+    counts = {}
+    running = len(processes)
+    while running:
+        try:
+            index, url, status = progress_queue.get(timeout=5)
+        except queue.Empty:
+            if not any(p.is_alive() for p in processes):
+                break
+            continue
+        if status == 'exit':
+            running -= 1
+            continue
+        counts[status] = counts.get(status, 0) + 1
+        done = sum(counts.values())
+        logger.info(f"[{done}] worker {index}: {status} {url}")
+
+    for process in processes:
+        process.join()
+        if process.exitcode:
+            error_logger.error(f"Worker {process.name} exited with code {process.exitcode}")
+    merge_worker_files(config.inaccessible_file, num_workers)
+    logger.info(f"Worker summary: {counts}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Monitor websites for social engineering ads.")
+    parser.add_argument('--input', default='websites.txt', help="File of URLs to monitor, one per line (.gz supported, '-' for stdin)")
+    parser.add_argument('--shuffle', action='store_true', help="Load all URLs into memory and monitor them in random order")
+    parser.add_argument('--workers', type=int, default=1, help="Number of worker processes to shard the crawl across")
+    parser.add_argument('--serve', type=int, nargs='?', const=SERVICE_PORT, metavar='PORT',
+                        help=f"Run as a service taking URLs over a local HTTP API (default port {SERVICE_PORT}) instead of reading --input")
+    parser.add_argument('--screenshots-dir', default=BASE_SCREENSHOTS_DIR, help="Directory for the screenshots of each site")
+    parser.add_argument('--results-dir', default=RESULTS_DIR, help="Directory for the change record segments and blobs")
+    parser.add_argument('--state-db', default=CRAWL_STATE_DB, help="SQLite database of the crawl state")
+    parser.add_argument('--inaccessible-file', default=INACCESSIBLE_URLS_FILE, help="File listing the URLs that could not be reached")
+    parser.add_argument('--monitored-file', default=MONITORED_URLS_FILE, help="Legacy list of monitored URLs, imported into the state once")
+    parser.add_argument('--error-log', default=ERRORS_LOG_FILE, help="File receiving error messages")
+    parser.add_argument('--fingerprint-db', default=FINGERPRINT_DB, help="SQLite index of script and stylesheet fingerprints")
+    parser.add_argument('--preflight-db', default=PREFLIGHT_CACHE_DB, help="SQLite cache of pre-flight verdicts")
+    parser.add_argument('--http-cache-dir', default=HTTP_CACHE_DIR, help="Directory of the on-disk HTTP cache")
+    parser.add_argument('--screenshot-modes', default=SCREENSHOT_MODES_FILE, help="JSON file mapping hosts to a screenshot mode")
+    parser.add_argument('--max-sites', type=int, default=MAX_SITES, help="Ceiling for the number of sites monitored at once")
+    parser.add_argument('--max-screenshots', type=int, default=MAX_SCREENSHOTS, help="Ceiling for the number of screenshots taken at once")
+    parser.add_argument('--browsers', type=int, default=BROWSER_POOL_SIZE, help="Browser processes per worker")
+    parser.add_argument('--contexts-per-browser', type=int, default=CONTEXTS_PER_BROWSER, help="Isolated contexts per browser")
+    parser.add_argument('--max-sites-per-host', type=int, default=MAX_SITES_PER_HOST, help="Sites of the same host monitored at once")
+    parser.add_argument('--host-min-interval', type=float, default=HOST_MIN_INTERVAL, help="Minimum seconds between two navigations to the same host")
+    parser.add_argument('--metrics-port', type=int, help="Serve Prometheus metrics on this local port (workers use port + index)")
+    parser.add_argument('--metrics-file', help="Periodically write a JSON metrics snapshot to this file")
+    parser.add_argument('--trace', action='store_true', help="Record a per-site trace of phase timings")
+    parser.add_argument('--seed', type=int, help="Seed the click simulation so runs are repeatable")
+    parser.add_argument('--resume', action='store_true', help="Continue an interrupted run: redo its in-flight URLs first and skip finished ones")
+    parser.add_argument('--recrawl', action='store_true', help="Also revisit monitored sites that are due, re-monitoring those that changed")
+    args = parser.parse_args(argv)
+    if args.serve is not None and args.workers > 1:
+        parser.error("--serve runs in a single process; it cannot be combined with --workers")
+    return args
+
+def config_from_args(args) -> CrawlerConfig:
+    return CrawlerConfig(
+        screenshots_dir=args.screenshots_dir,
+        results_dir=args.results_dir,
+        state_db=args.state_db,
+        inaccessible_file=args.inaccessible_file,
+        monitored_file=args.monitored_file,
+        error_log=args.error_log,
+        fingerprint_db=args.fingerprint_db,
+        preflight_db=args.preflight_db,
+        http_cache_dir=args.http_cache_dir,
+        screenshot_modes_file=args.screenshot_modes,
+        max_sites=args.max_sites,
+        max_screenshots=args.max_screenshots,
+        browsers=args.browsers,
+        contexts_per_browser=args.contexts_per_browser,
+        max_sites_per_host=args.max_sites_per_host,
+        host_min_interval=args.host_min_interval,
+        workers=args.workers,
+        metrics_port=args.metrics_port,
+        metrics_file=args.metrics_file,
+        trace=args.trace,
+        seed=args.seed,
+        resume=args.resume,
+        recrawl=args.recrawl,
+    )
+
+async def serve(config: CrawlerConfig, port: int):
+    async with Crawler(config) as crawler:
+        await crawler.serve(port)
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = config_from_args(args)
+    configure_logging(config.error_log)
+
+    print("Hello!")
+    print("Welcome to Web Crawler!")
+    print("By: tkFlash!")
 
-if __name__ == "__main__":
     start_time = time.time()
 
-    # Load the list of URLs
-    urls = load_urls('websites.txt')
-    random.shuffle(urls)
-
-    asyncio.run(monitor_websites(urls))
+    if args.serve is not None:
+        asyncio.run(serve(config, args.serve))
+        return
+
+    # Stream the URLs unless they have to be shuffled first
+    if args.shuffle:
+        urls = load_urls(args.input)
+        random.shuffle(urls)
+    else:
+        urls = iter_urls(args.input)
+    if config.recrawl:
+        # Due sites are revisited first, then any new URLs from the input
+        state = CrawlState(config.state_db)
+        due_urls = state.due_urls()
+        state.close()
+        logging.info(f"{len(due_urls)} monitored sites are due for a revisit.")
+        urls = itertools.chain(due_urls, urls)
+
+    if config.workers > 1:
+        run_sharded(urls, config)
+    else:
+        asyncio.run(monitor_websites(urls, config=config))
 
     elapsed_time = time.time() - start_time
     logging.info(f"Completed monitoring of all websites. Total time taken: {elapsed_time:.2f} seconds.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""Offline benchmark: runs the crawler against the bundled Flask fixtures and a synthetic site farm.
+
+Usage:
+    python benchmark.py --sites 20 --seed 1 --output bench.json
+    python benchmark.py --sites 20 --seed 1 --baseline bench.json
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+from flask import Flask, abort
+from werkzeug.serving import make_server
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, REPO_DIR)
+
+import Crawler
+
+LOCAL_HOSTS = {'127.0.0.1', 'localhost'}
+
+# Served in place of jQuery and other third-party scripts the fixtures load
+STUB_SCRIPT = b"window.jQuery = window.$ = window.$ || function () { return {}; };"
+# 1x1 transparent PNG served in place of placeholder images
+STUB_PNG = bytes.fromhex(
+    '89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c489'
+    '0000000d49444154789c63000100000500010d0a2db40000000049454e44ae426082'
+)
+STUB_LANDING = """<!doctype html><html><head><title>Landing</title></head>
+<body><h1>Stand-in landing page</h1><p>%s</p><a href="#">Continue</a></body></html>"""
+
+def load_fixture(filename: str, module_name: str):
+    """Imports one of the Flask fixture scripts (their file names are not valid module names)."""
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(REPO_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.app
+
+def build_site_farm(num_sites: int, seed: int, popup_rate: float, redirect_rate: float, mutation_rate: float):
+    """Builds a Flask app serving num_sites synthetic ad pages with seeded popup/redirect/mutation behaviour."""
+    farm = Flask('site_farm')
+
+    def page_config(index: int):
+        rng = random.Random(f"{seed}:{index}")
+        return {
+            "links": rng.randint(3, 12),
+            "popup": rng.random() < popup_rate,
+            "redirect": rng.random() < redirect_rate,
+            "mutation_ms": rng.choice([500, 1000, 2000, 5000]) if rng.random() < mutation_rate else None,
+        }
+
+    @farm.route('/site/<int:index>')
+    def site(index):
+        if index >= num_sites:
+            abort(404)
+        config = page_config(index)
+        elements = []
+        for i in range(config["links"]):
+            elements.append(f'<a href="#section-{i}">Section {i}</a>')
+        if config["popup"]:
+            elements.append(f'<button onclick="window.open(\'/landing/{index}\', \'_blank\')">Download now</button>')
+        if config["redirect"]:
+            elements.append(f'<a href="/landing/{index}">Claim your prize</a>')
+        script = ''
+        if config["mutation_ms"]:
+            script = f"""<script>
+                let count = 0;
+                const timer = setInterval(() => {{
+                    const ad = document.createElement('div');
+                    ad.className = 'ad';
+                    ad.textContent = 'Ad ' + (++count);
+                    document.body.appendChild(ad);
+                    if (count >= 5) clearInterval(timer);
+                }}, {config["mutation_ms"]});
+            </script>"""
+        return f"""<!doctype html><html><head><title>Site {index}</title></head>
+            <body><h1>Synthetic site {index}</h1>{''.join(elements)}{script}</body></html>"""
+
+    @farm.route('/landing/<int:index>')
+    def landing(index):
+        return STUB_LANDING % f"Landing for site {index}"
+
+    return farm
+
+class ServerThread:
+    """Runs a WSGI app on an ephemeral local port in a background thread."""
+
+    def __init__(self, app):
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.server.shutdown()
+
+    def url(self, path: str = '/') -> str:
+        return f"http://127.0.0.1:{self.port}{path}"
+
+async def use_local_stand_ins(context):
+    """Answers every request to a non-local host with a local stand-in so the run never touches the network."""
+    async def serve_stand_in(route, request):
+        if request.resource_type == 'script':
+            await route.fulfill(status=200, content_type='application/javascript', body=STUB_SCRIPT)
+        elif request.resource_type == 'image':
+            await route.fulfill(status=200, content_type='image/png', body=STUB_PNG)
+        elif request.resource_type == 'document':
+            await route.fulfill(status=200, content_type='text/html', body=STUB_LANDING % request.url)
+        else:
+            await route.fulfill(status=204, body=b'')
+
+    await context.route(lambda url: urlsplit(url).hostname not in LOCAL_HOSTS, serve_stand_in)
+
+class ProcessSampler:
+    """Samples the RSS and number of browser processes descended from this process (Linux /proc)."""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_browsers = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stopped.set()
+        self.thread.join()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.sample()
+            except OSError:
+                return
+
+    def sample(self):
+        parents, names, rss = {}, {}, {}
+        for pid in filter(str.isdigit, os.listdir('/proc')):
+            try:
+                with open(f'/proc/{pid}/status') as f:
+                    for line in f:
+                        key, _, value = line.partition(':')
+                        if key == 'Name':
+                            names[int(pid)] = value.strip()
+                        elif key == 'PPid':
+                            parents[int(pid)] = int(value)
+                        elif key == 'VmRSS':
+                            rss[int(pid)] = int(value.split()[0]) * 1024
+            except OSError:
+                continue
+        root = os.getpid()
+        descendants = set()
+        for pid in parents:
+            current = pid
+            while current in parents and current not in (0, 1):
+                if current == root or current in descendants:
+                    descendants.add(pid)
+                    break
+                current = parents[current]
+        total = rss.get(root, 0) + sum(rss.get(pid, 0) for pid in descendants)
+        browsers = sum(1 for pid in descendants if 'chrom' in names.get(pid, '').lower())
+        self.peak_rss = max(self.peak_rss, total)
+        self.peak_browsers = max(self.peak_browsers, browsers)
+
+# Outcomes of sites that were actually loaded and observed; only these count towards throughput and latency
+COMPLETED_OUTCOMES = ('monitored', 'unchanged')
+
+def percentile(values, q: float):
+    """Returns the q-th percentile (0-100) using linear interpolation."""
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[int(q) - 1]
+
+def run_benchmark(args) -> dict:
+    """Starts the fixtures, crawls them and returns the report."""
+    random.seed(args.seed)
+    if args.final_wait_cap is not None:
+        Crawler.FINAL_WAIT_CAP_MS = args.final_wait_cap
+
+    latencies = {}
+    outcomes = {}
+    final_outcomes = {}
+    original_monitor_website = Crawler.monitor_website
+
+    async def timed_monitor_website(*call_args, **call_kwargs):
+        start = time.monotonic()
+        try:
+            return await original_monitor_website(*call_args, **call_kwargs)
+        finally:
+            latencies[call_args[1]] = time.monotonic() - start
+
+    def reporter(url, status):
+        outcomes[status] = outcomes.get(status, 0) + 1
+        final_outcomes[url] = status
+
+    farm = build_site_farm(args.sites, args.seed, args.popup_rate, args.redirect_rate, args.mutation_rate)
+    with ServerThread(load_fixture('Server.py', 'fixture_server')) as dynamic_server, \
+            ServerThread(load_fixture('Test Server.py', 'fixture_test_server')) as ad_server, \
+            ServerThread(farm) as farm_server:
+        urls = [dynamic_server.url(), ad_server.url()] + [farm_server.url(f'/site/{i}') for i in range(args.sites)]
+
+        # Crawl in a scratch directory so state and results from earlier runs never skip sites
+        previous_dir = os.getcwd()
+        work_dir = tempfile.mkdtemp(prefix='crawler-bench-')
+        os.chdir(work_dir)
+        # After the chdir, so errors.log lands in the scratch directory too
+        Crawler.configure_logging()
+        Crawler.monitor_website = timed_monitor_website
+        start = time.monotonic()
+        try:
+            with ProcessSampler() as sampler:
+                # Every fixture is served from 127.0.0.1, so per-host politeness would serialize the whole farm
+                config = Crawler.CrawlerConfig(seed=args.seed, max_sites_per_host=len(urls), host_min_interval=0)
+                asyncio.run(Crawler.monitor_websites(urls, reporter, context_setup=use_local_stand_ins, config=config))
+        finally:
+            elapsed = time.monotonic() - start
+            Crawler.monitor_website = original_monitor_website
+            os.chdir(previous_dir)
+
+    # A URL's latency is that of its last call, i.e. the attempt that produced its final outcome
+    per_site = sorted(latency for url, latency in latencies.items() if final_outcomes.get(url) in COMPLETED_OUTCOMES)
+    peak_rss = sampler.peak_rss or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return {
+        "seed": args.seed,
+        "sites": len(urls),
+        "outcomes": outcomes,
+        "completed": len(per_site),
+        "elapsed_seconds": round(elapsed, 2),
+        "sites_per_minute": round(len(per_site) / elapsed * 60, 2) if elapsed else None,
+        "site_latency_p50": round(percentile(per_site, 50), 2) if per_site else None,
+        "site_latency_p95": round(percentile(per_site, 95), 2) if per_site else None,
+        "peak_rss_mb": round(peak_rss / 1048576, 1),
+        "peak_browser_processes": sampler.peak_browsers,
+        "work_dir": work_dir,
+    }
+
+def compare(report: dict, baseline: dict) -> dict:
+    """Returns the relative change of each numeric metric against the baseline."""
+    deltas = {}
+    for key in ("sites_per_minute", "site_latency_p50", "site_latency_p95", "peak_rss_mb", "peak_browser_processes"):
+        old, new = baseline.get(key), report.get(key)
+        if isinstance(old, (int, float)) and isinstance(new, (int, float)) and old:
+            deltas[key] = f"{(new - old) / old * 100:+.1f}%"
+    return deltas
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the crawler against local fixtures.")
+    parser.add_argument('--sites', type=int, default=20, help="Number of synthetic farm pages")
+    parser.add_argument('--seed', type=int, default=1, help="Seed for the site farm and click simulation")
+    parser.add_argument('--popup-rate', type=float, default=0.3, help="Share of farm pages with a popup button")
+    parser.add_argument('--redirect-rate', type=float, default=0.3, help="Share of farm pages with a redirecting link")
+    parser.add_argument('--mutation-rate', type=float, default=0.5, help="Share of farm pages that keep injecting content")
+    parser.add_argument('--final-wait-cap', type=int, help="Override the final observation cap per site, in ms")
+    parser.add_argument('--output', help="Write the report to this JSON file")
+    parser.add_argument('--baseline', help="Compare against a report written earlier with --output")
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            report["vs_baseline"] = compare(report, json.load(f))
+    print(json.dumps(report, indent=4))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    if not report["completed"]:
+        print("No site was monitored; the numbers above are meaningless.", file=sys.stderr)
+        sys.exit(1)
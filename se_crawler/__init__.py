@@ -0,0 +1,2 @@
+"""Building blocks of the website monitoring crawler: crawl state, browser pool, network policy, change
+recording, storage and metrics. Crawler.py ties them together."""
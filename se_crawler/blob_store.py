@@ -0,0 +1,105 @@
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+import sys
+
+from se_crawler.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Directory of the content-addressed blobs, next to the results segments
+BLOBS_DIR = os.path.join('results', 'blobs')
+# Bodies larger than this are moved to the blob store and replaced by a reference
+INLINE_MAX_BYTES = 4096
+# Inline body bytes a site may keep in its records; past it, every body larger than SPILL_MIN_BYTES is spilled
+SITE_INLINE_BUDGET = 1024 * 1024
+SPILL_MIN_BYTES = 256
+# Keys of change records that can hold large bodies
+SPILLABLE_KEYS = ('content', 'html', 'initial_html')
+BLOB_COMPRESSION_LEVEL = 6
+
+capture_bytes = metrics.counter('crawler_capture_bytes_total', "Body bytes captured, kept inline, and written to the blob store")
+capture_blobs = metrics.counter('crawler_capture_blobs_total', "Bodies spilled to the blob store, by whether the blob already existed")
+
+class BlobStore:
+    """Content-addressed store of gzip-compressed bodies, deduplicated by SHA-256."""
+
+    def __init__(self, blobs_dir: str = BLOBS_DIR):
+        self.blobs_dir = blobs_dir
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.blobs_dir, digest[:2], f"{digest}.gz")
+
+    def put(self, data: bytes):
+        """Stores data unless an identical blob exists. Returns (digest, compressed bytes written)."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if os.path.exists(path):
+            return digest, 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        compressed = gzip.compress(data, compresslevel=BLOB_COMPRESSION_LEVEL)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(compressed)
+        os.replace(tmp_path, path)
+        return digest, len(compressed)
+
+    def get(self, digest: str) -> bytes:
+        """Returns the original bytes of a blob."""
+        with open(self.path(digest), 'rb') as f:
+            return gzip.decompress(f.read())
+
+class SiteCapture:
+    """Per-site capture budget: keeps small bodies inline and spills the rest to the blob store.
+
+    Spilled values are replaced by {"blob": sha256, "bytes": original size}, so only references and
+    hashes stay in memory.
+    """
+
+    def __init__(self, store: BlobStore, url: str, inline_max: int = INLINE_MAX_BYTES,
+                 budget: int = SITE_INLINE_BUDGET):
+        self.store = store
+        self.url = url
+        self.inline_max = inline_max
+        self.budget = budget
+        self.captured = 0
+        self.inline = 0
+        self.stored = 0
+
+    async def spill(self, value):
+        """Returns the value itself if it may stay inline, otherwise a reference to its blob."""
+        if not isinstance(value, str):
+            return value
+        data = value.encode('utf-8', errors='replace')
+        size = len(data)
+        self.captured += size
+        capture_bytes.inc(size, kind='captured')
+        limit = self.inline_max if self.inline + size <= self.budget else SPILL_MIN_BYTES
+        if size <= limit:
+            self.inline += size
+            capture_bytes.inc(size, kind='inline')
+            return value
+        digest, written = await asyncio.to_thread(self.store.put, data)
+        self.stored += written
+        capture_bytes.inc(written, kind='stored')
+        capture_blobs.inc(outcome='new' if written else 'existing')
+        return {"blob": digest, "bytes": size}
+
+    async def spill_record(self, record: dict) -> dict:
+        """Spills the large bodies of a change record in place."""
+        for key in SPILLABLE_KEYS:
+            if key in record:
+                record[key] = await self.spill(record[key])
+        return record
+
+    def summary(self) -> dict:
+        return {"captured_bytes": self.captured, "inline_bytes": self.inline, "stored_bytes": self.stored}
+
+if __name__ == "__main__":
+    # Print a stored body: python -m se_crawler.blob_store <blobs dir> <sha256>
+    if len(sys.argv) != 3:
+        print("Usage: python -m se_crawler.blob_store <blobs dir> <sha256>")
+        sys.exit(1)
+    sys.stdout.buffer.write(BlobStore(sys.argv[1]).get(sys.argv[2]))
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+error_logger = logging.getLogger('error_logger')
+
+# Number of Chromium processes to run
+BROWSER_POOL_SIZE = 1
+# Number of isolated browser contexts handed out per browser
+CONTEXTS_PER_BROWSER = 10
+# Recycle a context after it has served this many sites
+SITES_PER_CONTEXT = 10
+# Recycle a context once one of its pages used more JS heap than this
+MAX_CONTEXT_HEAP_MB = 512
+
+HEAP_USAGE_JS = '() => (performance.memory ? performance.memory.usedJSHeapSize : 0)'
+
+class ContextLease:
+    """A browser context checked out of the pool for a single site."""
+
+    def __init__(self, slot):
+        self.slot = slot
+        self.context = slot.context
+        self.pages = []
+        # Origins the site's requests went to; their data is cleared before the context is reused
+        self.origins = set()
+
+    def _on_request(self, request):
+        parts = urlsplit(request.url)
+        if parts.scheme in ('http', 'https'):
+            self.origins.add(f"{parts.scheme}://{parts.netloc}")
+
+    async def new_page(self):
+        """Opens a page in the leased context. The pool closes it on release."""
+        page = await self.context.new_page()
+        self.pages.append(page)
+        return page
+
+class _Slot:
+    """One reusable context position belonging to a browser in the pool."""
+
+    def __init__(self, browser_index: int):
+        self.browser_index = browser_index
+        self.browser = None
+        self.context = None
+        self.sites_served = 0
+
+class BrowserPool:
+    """Manages N browser processes x M isolated contexts, recycling and relaunching them as needed."""
+
+    def __init__(self, playwright, browsers: int = BROWSER_POOL_SIZE, contexts_per_browser: int = CONTEXTS_PER_BROWSER,
+                 sites_per_context: int = SITES_PER_CONTEXT, max_context_heap_mb: int = MAX_CONTEXT_HEAP_MB,
+                 launch_options: dict = None, context_options: dict = None, on_new_context=None):
+        self.playwright = playwright
+        self.size = browsers
+        self.contexts_per_browser = contexts_per_browser
+        self.sites_per_context = sites_per_context
+        self.max_context_heap = max_context_heap_mb * 1024 * 1024
+        self.launch_options = launch_options or {'headless': True}
+        self.context_options = context_options or {}
+        # Awaited with every newly created context, e.g. to install request routing
+        self.on_new_context = on_new_context
+        self.browsers = [None] * browsers
+        self.launch_locks = [asyncio.Lock() for _ in range(browsers)]
+        self.idle = asyncio.Queue()
+        self.restarts = 0
+
+    @property
+    def capacity(self) -> int:
+        """Total number of contexts the pool can hand out at once."""
+        return self.size * self.contexts_per_browser
+
+    async def start(self):
+        """Launches the browsers and fills the pool with idle slots."""
+        for i in range(self.size):
+            await self._ensure_browser(i)
+            for _ in range(self.contexts_per_browser):
+                self.idle.put_nowait(_Slot(i))
+        logger.info(f"Browser pool started with {self.size} browser(s) x {self.contexts_per_browser} contexts.")
+
+    async def close(self):
+        """Closes every browser in the pool."""
+        for i, browser in enumerate(self.browsers):
+            if browser is not None and browser.is_connected():
+                try:
+                    await browser.close()
+                except Exception as e:
+                    error_logger.error(f"Error while closing browser {i}: {e}")
+            self.browsers[i] = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _ensure_browser(self, index: int):
+        """Returns a connected browser for the index, relaunching it if it crashed."""
+        async with self.launch_locks[index]:
+            browser = self.browsers[index]
+            if browser is not None and browser.is_connected():
+                return browser
+            if browser is not None:
+                self.restarts += 1
+                logger.warning(f"Browser {index} disconnected. Relaunching.")
+            browser = await self.playwright.chromium.launch(**self.launch_options)
+            browser.on('disconnected', lambda _: logger.warning(f"Browser {index} disconnected."))
+            self.browsers[index] = browser
+            return browser
+
+    async def _prepare(self, slot: _Slot):
+        """Makes sure the slot has a live context on a live browser."""
+        browser = await self._ensure_browser(slot.browser_index)
+        if slot.context is None or slot.browser is not browser:
+            slot.browser = browser
+            slot.context = await browser.new_context(**self.context_options)
+            slot.sites_served = 0
+            if self.on_new_context is not None:
+                await self.on_new_context(slot.context)
+
+    async def _discard_context(self, slot: _Slot):
+        """Closes the slot's context so the next lease gets a fresh one."""
+        if slot.context is not None and slot.browser is not None and slot.browser.is_connected():
+            try:
+                await slot.context.close()
+            except Exception as e:
+                error_logger.error(f"Error while closing browser context: {e}")
+        slot.context = None
+        slot.browser = None
+        slot.sites_served = 0
+
+    async def _clear_site_data(self, context, origins):
+        """Clears the storage, service workers and HTTP cache a site left in the context, through CDP."""
+        page = await context.new_page()
+        try:
+            session = await context.new_cdp_session(page)
+            await session.send('Network.clearBrowserCache')
+            # 'all' covers local and session storage, IndexedDB, Cache Storage, service workers and cookies
+            await asyncio.gather(*(session.send('Storage.clearDataForOrigin', {'origin': origin, 'storageTypes': 'all'})
+                                   for origin in origins))
+            await session.detach()
+        finally:
+            await page.close()
+
+    async def _release(self, lease: ContextLease):
+        """Closes the lease's pages and decides whether the context can be reused."""
+        slot = lease.slot
+        heap_used = 0
+        browser_alive = slot.browser is not None and slot.browser.is_connected()
+        if browser_alive:
+            slot.context.remove_listener('request', lease._on_request)
+            for page in lease.pages:
+                if page.is_closed():
+                    continue
+                try:
+                    heap_used = max(heap_used, await page.evaluate(HEAP_USAGE_JS))
+                except Exception:
+                    pass
+            for page in slot.context.pages:
+                try:
+                    await page.close()
+                except Exception:
+                    pass
+
+        slot.sites_served += 1
+        if not browser_alive:
+            slot.context = None
+            slot.browser = None
+        elif slot.sites_served >= self.sites_per_context or heap_used > self.max_context_heap:
+            logger.info(f"Recycling browser context after {slot.sites_served} site(s), heap {heap_used / 1048576:.1f} MB.")
+            await self._discard_context(slot)
+        else:
+            # Do not let cookies, storage, caches or permissions from one site leak into the next
+            try:
+                await self._clear_site_data(slot.context, lease.origins)
+                await slot.context.clear_cookies()
+                await slot.context.clear_permissions()
+            except Exception:
+                await self._discard_context(slot)
+
+    @asynccontextmanager
+    async def lease(self):
+        """Checks an isolated browser context out of the pool for the duration of the block."""
+        slot = await self.idle.get()
+        try:
+            await self._prepare(slot)
+            lease = ContextLease(slot)
+            slot.context.on('request', lease._on_request)
+            try:
+                yield lease
+            finally:
+                await self._release(lease)
+        finally:
+            self.idle.put_nowait(slot)
@@ -0,0 +1,356 @@
+import asyncio
+import logging
+from urllib.parse import urlsplit
+
+from se_crawler.fingerprint_index import fingerprint
+
+logger = logging.getLogger(__name__)
+
+CHANGES_BINDING = '__crawlerChanges'
+KNOWN_HASHES_BINDING = '__crawlerKnownHashes'
+# Longest outerHTML/attribute/text value recorded for a single DOM change
+MAX_NODE_HTML = 10000
+# How often the page streams buffered changes to Python
+FLUSH_INTERVAL_MS = 250
+# Buffered changes that force an immediate flush
+MAX_BUFFERED_CHANGES = 500
+
+DOM_CHANGE_TYPES = ('added', 'removed', 'attribute', 'text')
+
+# Records DOM mutations, new scripts and new stylesheets in the page. Script and stylesheet
+# bodies are hashed and only sent if neither this recorder nor Python (for earlier documents and
+# other frames of the page) has seen the hash. snapshot() returns everything Python needs about
+# the frame, and its same-origin iframes, in one call.
+CHANGE_RECORDER_JS = """
+(() => {
+    if (window.__crawlerRecorder) return;
+    const MAX_HTML = %(max_html)d;
+    const FLUSH_MS = %(flush_ms)d;
+    const MAX_BUFFER = %(max_buffer)d;
+    // Bodies are attached to their records when the records leave the page, so hashes Python
+    // reports in the meantime are not sent again
+    const sent = new Set();
+    const bodies = new WeakMap();
+    const known = (async () => {
+        try { (await window.%(known_binding)s()).forEach((h) => sent.add(h)); } catch (e) {}
+    })();
+    let buffer = [];
+    let timer = null;
+
+    const hash = (str) => {
+        let h1 = 0xdeadbeef, h2 = 0x41c6ce57;
+        for (let i = 0; i < str.length; i++) {
+            const ch = str.charCodeAt(i);
+            h1 = Math.imul(h1 ^ ch, 2654435761);
+            h2 = Math.imul(h2 ^ ch, 1597334677);
+        }
+        h1 = Math.imul(h1 ^ (h1 >>> 16), 2246822507) ^ Math.imul(h2 ^ (h2 >>> 13), 3266489909);
+        h2 = Math.imul(h2 ^ (h2 >>> 16), 2246822507) ^ Math.imul(h1 ^ (h1 >>> 13), 3266489909);
+        return (h2 >>> 0).toString(16).padStart(8, '0') + (h1 >>> 0).toString(16).padStart(8, '0');
+    };
+    const clip = (value) => (value == null ? value : String(value).slice(0, MAX_HTML));
+    const pathOf = (node) => {
+        const parts = [];
+        while (node && node.nodeType === 1 && parts.length < 8) {
+            if (node.id) { parts.unshift('#' + node.id); break; }
+            let index = 1, sibling = node;
+            while ((sibling = sibling.previousElementSibling)) index++;
+            parts.unshift(node.tagName.toLowerCase() + ':nth-child(' + index + ')');
+            node = node.parentElement;
+        }
+        return parts.join(' > ');
+    };
+    const resource = (node, initial) => {
+        let type, src = null, content = '';
+        if (node.tagName === 'SCRIPT') { type = 'script'; src = node.src || null; content = node.textContent; }
+        else if (node.tagName === 'STYLE') { type = 'stylesheet'; content = node.textContent; }
+        else if (node.tagName === 'LINK' && /stylesheet/i.test(node.rel)) { type = 'stylesheet'; src = node.href; }
+        else return null;
+        const h = hash((src || '') + '\\n' + content);
+        const record = {type, hash: h, src, path: pathOf(node), t: Date.now()};
+        if (initial) record.initial = true;
+        bodies.set(record, content);
+        return record;
+    };
+    const take = () => {
+        const batch = buffer;
+        buffer = [];
+        if (timer) { clearTimeout(timer); timer = null; }
+        for (const record of batch) {
+            if (!bodies.has(record)) continue;
+            if (!sent.has(record.hash)) { sent.add(record.hash); record.content = bodies.get(record); }
+            bodies.delete(record);
+        }
+        return batch;
+    };
+    // Cookie and storage changes are reported against what the previous snapshot saw
+    let lastCookies = new Map();
+    const lastStorage = {localStorage: new Map(), sessionStorage: new Map()};
+    const delta = (previous, current) => {
+        const set = {}, removed = [];
+        current.forEach((value, key) => { if (previous.get(key) !== value) set[key] = clip(value); });
+        previous.forEach((value, key) => { if (!current.has(key)) removed.push(key); });
+        return (Object.keys(set).length || removed.length) ? {set, removed} : null;
+    };
+    const cookieDelta = () => {
+        let current;
+        try {
+            current = new Map(document.cookie.split('; ').filter(Boolean).map((pair) => {
+                const i = pair.indexOf('=');
+                return i < 0 ? ['', pair] : [pair.slice(0, i), pair.slice(i + 1)];
+            }));
+        } catch (e) { return null; }
+        const changes = delta(lastCookies, current);
+        lastCookies = current;
+        return changes;
+    };
+    const storageDelta = () => {
+        const changes = {};
+        for (const name of ['localStorage', 'sessionStorage']) {
+            const current = new Map();
+            try {
+                const storage = window[name];
+                for (let i = 0; i < storage.length; i++) current.set(storage.key(i), storage.getItem(storage.key(i)));
+            } catch (e) { continue; }  // Blocked for third-party frames by some browser settings
+            const change = delta(lastStorage[name], current);
+            lastStorage[name] = current;
+            if (change) changes[name] = change;
+        }
+        return Object.keys(changes).length ? changes : null;
+    };
+    // Hashes the tag skeleton of the document down to maxDepth
+    const structureHash = (maxDepth) => {
+        const parts = [];
+        const walk = (node, depth) => {
+            if (depth > maxDepth) return;
+            for (let child = node.firstElementChild; child; child = child.nextElementSibling) {
+                if (child.tagName === 'SCRIPT' || child.tagName === 'STYLE' || child.tagName === 'NOSCRIPT') continue;
+                parts.push(depth + child.tagName);
+                walk(child, depth + 1);
+            }
+        };
+        if (document.documentElement) walk(document.documentElement, 0);
+        return hash(parts.join(','));
+    };
+    const serialize = () => {
+        let html = '';
+        if (document.doctype) html = new XMLSerializer().serializeToString(document.doctype);
+        if (document.documentElement) html += document.documentElement.outerHTML;
+        return html;
+    };
+    // Same-origin iframes are read through their own recorder; cross-origin ones only get their box here
+    const frameEntries = () => {
+        const entries = [];
+        document.querySelectorAll('iframe, frame').forEach((element) => {
+            const r = element.getBoundingClientRect();
+            const entry = {path: pathOf(element), src: element.src || null, name: element.name || null,
+                           box: [Math.round(r.left), Math.round(r.top), Math.round(r.width), Math.round(r.height)]};
+            let win = null;
+            try { win = element.contentWindow; void win.location.href; } catch (e) { entry.crossOrigin = true; }
+            if (!entry.crossOrigin && win && win.__crawlerRecorder) Object.assign(entry, win.__crawlerRecorder.snapshot({}));
+            else if (!entry.crossOrigin && win) entry.url = win.location.href;
+            entries.push(entry);
+        });
+        return entries;
+    };
+    const snapshot = (options) => {
+        const state = {url: location.href, records: take(), cookies: cookieDelta(), storage: storageDelta(),
+                       frames: frameEntries()};
+        if (options.html) state.html = serialize();
+        if (options.structureDepth != null) state.structure = structureHash(options.structureDepth);
+        return state;
+    };
+    const flush = () => known.then(() => {
+        const records = take();
+        if (!records.length) return;
+        try { window.%(binding)s({url: location.href, records}); } catch (e) {}
+    });
+    const push = (record) => {
+        if (!record) return;
+        buffer.push(record);
+        if (buffer.length >= MAX_BUFFER) flush();
+        else if (!timer) timer = setTimeout(flush, FLUSH_MS);
+    };
+    const RESOURCE_SELECTOR = 'script, style, link[rel~="stylesheet"]';
+    const added = (node) => {
+        if (node.nodeType === 3) {
+            push({type: 'text', path: pathOf(node.parentElement), value: clip(node.data), t: Date.now()});
+            return;
+        }
+        if (node.nodeType !== 1) return;
+        const own = resource(node, false);
+        if (own) { push(own); return; }
+        const html = node.outerHTML;
+        push({type: 'added', path: pathOf(node), tag: node.tagName.toLowerCase(), html: clip(html),
+              truncated: html.length > MAX_HTML, t: Date.now()});
+        node.querySelectorAll(RESOURCE_SELECTOR).forEach((child) => push(resource(child, false)));
+    };
+    const observe = () => {
+        document.querySelectorAll(RESOURCE_SELECTOR).forEach((node) => push(resource(node, true)));
+        new MutationObserver((mutations) => {
+            for (const m of mutations) {
+                if (m.type === 'childList') {
+                    m.addedNodes.forEach(added);
+                    m.removedNodes.forEach((node) => {
+                        if (node.nodeType !== 1) return;
+                        push({type: 'removed', path: pathOf(m.target), tag: node.tagName.toLowerCase(), t: Date.now()});
+                    });
+                } else if (m.type === 'attributes') {
+                    push({type: 'attribute', path: pathOf(m.target), name: m.attributeName,
+                          value: clip(m.target.getAttribute(m.attributeName)), t: Date.now()});
+                } else if (m.type === 'characterData') {
+                    push({type: 'text', path: pathOf(m.target.parentElement), value: clip(m.target.data), t: Date.now()});
+                }
+            }
+        }).observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+    };
+    window.__crawlerRecorder = {take, snapshot};
+    if (document.readyState === 'loading') document.addEventListener('DOMContentLoaded', observe);
+    else observe();
+})();
+""" % {'max_html': MAX_NODE_HTML, 'flush_ms': FLUSH_INTERVAL_MS, 'max_buffer': MAX_BUFFERED_CHANGES,
+       'binding': CHANGES_BINDING, 'known_binding': KNOWN_HASHES_BINDING}
+
+SNAPSHOT_JS = '''(options) => window.__crawlerRecorder ? window.__crawlerRecorder.snapshot(options)
+    : {url: location.href, records: [], cookies: null, storage: null, frames: []}'''
+
+def url_origin(url: str):
+    parts = urlsplit(url)
+    return parts.scheme, parts.netloc
+
+def effective_origin(frame):
+    """Returns the origin a frame's document runs in; about:blank and srcdoc frames inherit their parent's."""
+    while frame is not None:
+        if frame.url and not frame.url.startswith('about:'):
+            return url_origin(frame.url)
+        frame = frame.parent_frame
+    return None
+
+def needs_own_snapshot(frame) -> bool:
+    """Tells whether a frame is cross-origin to its parent, so the parent's snapshot cannot read it."""
+    parent = frame.parent_frame
+    return parent is not None and effective_origin(frame) != effective_origin(parent)
+
+def place_frame(state: dict, frame, frame_state: dict):
+    """Puts the snapshot of a cross-origin frame into the entry its parent recorded for the iframe element."""
+    unfilled = []
+    pending = [state]
+    while pending:
+        node = pending.pop()
+        for entry in node.get('frames', []):
+            if entry.get('crossOrigin') and 'url' not in entry:
+                unfilled.append(entry)
+            pending.append(entry)
+    for matches in (lambda e: frame.name and e['name'] == frame.name,
+                    lambda e: e['src'] == frame.url,
+                    lambda e: e['src'] and url_origin(e['src']) == effective_origin(frame)):
+        for entry in unfilled:
+            if matches(entry):
+                entry.update(frame_state)
+                return
+    # The element is gone or was not seen by its parent: keep the frame's state anyway
+    state['frames'].append({"path": None, "crossOrigin": True, **frame_state})
+
+def split_records(records):
+    """Groups recorded changes into DOM changes, new scripts and new stylesheets."""
+    return {
+        "dom_changes": [r for r in records if r.get('type') in DOM_CHANGE_TYPES],
+        "new_scripts": [r for r in records if r.get('type') == 'script'],
+        "new_stylesheets": [r for r in records if r.get('type') == 'stylesheet'],
+    }
+
+class ChangeRecorder:
+    """Receives incremental page changes streamed by an injected MutationObserver.
+
+    Scripts and stylesheets are fingerprinted as they arrive, large ones in the FingerprintIndex's worker
+    processes. Each body is received once per page: every new document and frame asks for the hashes already
+    received, and records of known bodies get the stored fingerprint instead. With a SiteCapture, large bodies
+    are spilled to the blob store straight away, so records only hold references to them.
+    """
+
+    def __init__(self, page, capture=None, fingerprints=None):
+        self.page = page
+        self.capture = capture
+        self.fingerprints = fingerprints
+        self.records = []
+        # Fingerprint of every script/stylesheet body received from the page, keyed by its in-page hash
+        self.resources = {}
+        # Batches from the binding still being ingested; a snapshot waits for them before taking the records
+        self.ingesting = set()
+
+    @classmethod
+    async def attach(cls, page, capture=None, fingerprints=None):
+        """Injects the change recorder into the current and all future documents of the page and its frames."""
+        recorder = cls(page, capture, fingerprints)
+        try:
+            await page.expose_binding(CHANGES_BINDING, recorder._on_batch)
+            await page.expose_binding(KNOWN_HASHES_BINDING, lambda source: list(recorder.resources))
+            await page.add_init_script(CHANGE_RECORDER_JS)
+            # Frames that are already loaded missed the init script
+            await asyncio.gather(*(frame.evaluate(CHANGE_RECORDER_JS) for frame in page.frames), return_exceptions=True)
+        except Exception as e:
+            logger.debug(f"Change recorder could not be fully installed: {e}")
+        return recorder
+
+    async def _on_batch(self, source, batch):
+        task = asyncio.ensure_future(self._ingest(batch))
+        self.ingesting.add(task)
+        task.add_done_callback(self.ingesting.discard)
+        await task
+
+    async def _ingest(self, batch):
+        url = batch.get('url')
+        for record in batch.get('records', []):
+            record['url'] = url
+            h = record.get('hash')
+            if h in self.resources:
+                # Sent again by a frame or document that had not heard of it yet
+                record.pop('content', None)
+                if self.resources[h] is not None:
+                    record['fingerprint'] = self.resources[h]
+            elif isinstance(record.get('content'), str):
+                self.resources[h] = None  # Claimed before awaiting, so concurrent batches do not redo it
+                if self.fingerprints is not None:
+                    record['fingerprint'] = await self.fingerprints.fingerprint(record['type'], record.get('src'),
+                                                                                record['content'])
+                else:
+                    record['fingerprint'] = fingerprint(record['type'], record.get('src'), record['content'])
+                self.resources[h] = record['fingerprint']
+            if self.capture is not None:
+                await self.capture.spill_record(record)
+            self.records.append(record)
+
+    async def _evaluate_snapshot(self, frame, options: dict):
+        try:
+            return await frame.evaluate(SNAPSHOT_JS, options)
+        except Exception as e:
+            logger.debug(f"Could not take a snapshot of frame {frame.url}: {e}")
+            return None
+
+    async def _ingest_tree(self, node: dict):
+        await self._ingest({"url": node.get('url'), "records": node.pop('records', None) or []})
+        for entry in node.get('frames', []):
+            await self._ingest_tree(entry)
+
+    async def snapshot(self, html: bool = False, structure_depth: int = None) -> dict:
+        """Collects the page's state: URL, iframe tree, cookie and storage changes since the last snapshot, and
+        every change recorded since then (records), optionally with the HTML and the DOM structure hash.
+
+        The main frame's call also reads all same-origin iframes. Cross-origin iframes, where most ads live,
+        can only be read from inside; they get their own calls, issued concurrently with the main one, so
+        the whole snapshot costs a single round trip of latency.
+        """
+        options = {"html": html, "structureDepth": structure_depth}
+        frames = [frame for frame in self.page.frames if needs_own_snapshot(frame)]
+        results = await asyncio.gather(self._evaluate_snapshot(self.page.main_frame, options),
+                                       *(self._evaluate_snapshot(frame, {}) for frame in frames))
+        state = results[0] or {"url": self.page.url, "records": [], "cookies": None, "storage": None, "frames": []}
+        for frame, frame_state in zip(frames, results[1:]):
+            if frame_state is not None:
+                place_frame(state, frame, frame_state)
+        await self._ingest_tree(state)
+        # Batches fingerprinted in worker processes may still be appending their records
+        if self.ingesting:
+            await asyncio.gather(*list(self.ingesting), return_exceptions=True)
+        state['records'], self.records = self.records, []
+        return state
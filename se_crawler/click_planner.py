@@ -0,0 +1,163 @@
+import logging
+import re
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+CLICKABLE_SELECTOR = 'a, button, input[type="button"], input[type="submit"], [onclick], [role="button"]'
+# Most candidates kept per enumeration, in document order
+MAX_CANDIDATES = 300
+CLICK_TIMEOUT_MS = 5000
+
+# Text that typically labels an ad, a fake download button or an overlay
+AD_TEXT_RE = re.compile(
+    r'download|play|watch|stream|claim|prize|winner|offer|free|allow|continue|close|skip|install|update|click here',
+    re.IGNORECASE
+)
+
+# Enumerates every clickable element once and keeps the element references in the page,
+# so the chosen one can be clicked without querying the DOM again.
+ENUMERATE_CANDIDATES_JS = """
+([selector, maxCandidates]) => {
+    const viewportWidth = window.innerWidth, viewportHeight = window.innerHeight;
+    const viewportArea = Math.max(1, viewportWidth * viewportHeight);
+    const pathOf = (node) => {
+        const parts = [];
+        while (node && node.nodeType === 1 && parts.length < 8) {
+            if (node.id) { parts.unshift('#' + node.id); break; }
+            let index = 1, sibling = node;
+            while ((sibling = sibling.previousElementSibling)) index++;
+            parts.unshift(node.tagName.toLowerCase() + ':nth-child(' + index + ')');
+            node = node.parentElement;
+        }
+        return parts.join(' > ');
+    };
+    const kept = [];
+    const candidates = [];
+    for (const el of document.querySelectorAll(selector)) {
+        if (candidates.length >= maxCandidates) break;
+        if (el.disabled) continue;
+        const rect = el.getBoundingClientRect();
+        if (rect.width < 1 || rect.height < 1) continue;
+        const style = getComputedStyle(el);
+        if (style.visibility === 'hidden' || style.display === 'none' || style.pointerEvents === 'none'
+            || parseFloat(style.opacity) === 0) continue;
+
+        let zIndex = 0, fixed = false, depth = 0;
+        for (let node = el; node && node !== document.body && depth < 6; node = node.parentElement, depth++) {
+            const nodeStyle = node === el ? style : getComputedStyle(node);
+            if (nodeStyle.position === 'fixed' || nodeStyle.position === 'sticky') fixed = true;
+            const z = parseInt(nodeStyle.zIndex, 10);
+            if (!isNaN(z)) zIndex = Math.max(zIndex, z);
+        }
+
+        const inViewport = rect.bottom > 0 && rect.right > 0 && rect.top < viewportHeight && rect.left < viewportWidth;
+        let occluded = false;
+        if (inViewport) {
+            const x = Math.min(Math.max(rect.left + rect.width / 2, 0), viewportWidth - 1);
+            const y = Math.min(Math.max(rect.top + rect.height / 2, 0), viewportHeight - 1);
+            const top = document.elementFromPoint(x, y);
+            occluded = !!top && top !== el && !el.contains(top) && !top.contains(el);
+        }
+        if (occluded) continue;
+
+        const text = (el.innerText || el.value || el.getAttribute('aria-label') || '').trim();
+        kept.push(el);
+        candidates.push({
+            index: kept.length - 1,
+            key: pathOf(el) + '|' + text.slice(0, 50),
+            tag: el.tagName.toLowerCase(),
+            text: (text || el.outerHTML).slice(0, 200),
+            href: el.href || null,
+            target: el.getAttribute('target'),
+            onclick: el.hasAttribute('onclick') || typeof el.onclick === 'function',
+            z_index: zIndex,
+            fixed,
+            area_ratio: (rect.width * rect.height) / viewportArea,
+            in_viewport: inViewport,
+        });
+    }
+    window.__crawlerCandidates = kept;
+    return candidates;
+}
+"""
+
+CANDIDATE_HANDLE_JS = '(index) => (window.__crawlerCandidates || [])[index] || null'
+
+def score_candidate(candidate: dict, page_url: str) -> float:
+    """Rates how likely clicking the candidate is to trigger an ad, popup or overlay."""
+    score = 0.0
+    if candidate['fixed'] or candidate['z_index'] >= 100:
+        score += 5  # Overlays and floating ad boxes
+    if candidate['area_ratio'] >= 0.25:
+        score += 3  # Full-screen click catchers
+    if candidate['target'] == '_blank':
+        score += 3
+    if candidate['onclick']:
+        score += 2
+    href = candidate['href']
+    if href and not href.startswith('javascript:'):
+        page_host = urlsplit(page_url).hostname
+        link_host = urlsplit(href).hostname
+        if link_host and link_host != page_host:
+            score += 3  # Leaves the site
+        elif '#' in href and href.split('#')[0] == page_url.split('#')[0]:
+            score -= 2  # In-page anchor
+    if AD_TEXT_RE.search(candidate['text'][:100]):
+        score += 2
+    if candidate['tag'] in ('button', 'input'):
+        score += 1
+    if candidate['in_viewport']:
+        score += 1
+    return score
+
+class ClickPlanner:
+    """Chooses click targets from a cached, scored list of candidates, never clicking the same target twice."""
+
+    def __init__(self, page, tracker, rng):
+        self.page = page
+        self.tracker = tracker
+        self.rng = rng
+        self.candidates = []
+        self.version = None
+        self.clicked = set()
+        self.enumerations = 0
+
+    def _is_stale(self) -> bool:
+        return self.version != self.tracker.dom_version
+
+    async def refresh(self):
+        """Enumerates the page's clickable elements in a single evaluate call and ranks them."""
+        self.version = self.tracker.dom_version
+        candidates = await self.page.evaluate(ENUMERATE_CANDIDATES_JS, [CLICKABLE_SELECTOR, MAX_CANDIDATES])
+        self.enumerations += 1
+        page_url = self.page.url
+        # Shuffle first so that equal scores are broken by the (seeded) generator
+        self.rng.shuffle(candidates)
+        for candidate in candidates:
+            candidate['score'] = score_candidate(candidate, page_url)
+        self.candidates = sorted(candidates, key=lambda c: c['score'], reverse=True)
+        logger.debug(f"Enumerated {len(candidates)} click candidates.")
+
+    async def next_target(self):
+        """Returns the best candidate not clicked yet, re-enumerating only if the DOM changed."""
+        if self._is_stale():
+            await self.refresh()
+        for candidate in self.candidates:
+            if candidate['key'] not in self.clicked:
+                return candidate
+        return None
+
+    async def click(self, candidate: dict) -> bool:
+        """Clicks the candidate through its cached element reference. Returns False if it is gone."""
+        self.clicked.add(candidate['key'])
+        handle = await self.page.evaluate_handle(CANDIDATE_HANDLE_JS, candidate['index'])
+        element = handle.as_element()
+        try:
+            if element is None:
+                self.version = None
+                return False
+            await element.click(timeout=CLICK_TIMEOUT_MS)
+            return True
+        finally:
+            await handle.dispose()
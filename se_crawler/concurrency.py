@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import os
+import time
+
+from se_crawler.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Sites monitored at once: the controller starts at the initial value and stays within the floor and ceiling
+MIN_ACTIVE_SITES = 1
+INITIAL_ACTIVE_SITES = 4
+MAX_ACTIVE_SITES = 32
+# Screenshots taken and encoded at once, across all sites
+MIN_ACTIVE_SCREENSHOTS = 1
+INITIAL_ACTIVE_SCREENSHOTS = 2
+MAX_ACTIVE_SCREENSHOTS = 8
+
+# How often the limits are adjusted, in seconds
+CONTROL_INTERVAL = 2.0
+# Limits are multiplied by this factor when any signal shows pressure, and raised by one otherwise
+DECREASE_FACTOR = 0.5
+# Pressure thresholds
+MIN_AVAILABLE_MEMORY_RATIO = 0.15
+MAX_LOAD_PER_CPU = 1.5
+MAX_LOOP_LAG_SECONDS = 0.25
+MAX_NAVIGATION_SECONDS = 15.0
+# Weight of the newest navigation in the moving average of navigation latency
+NAVIGATION_EWMA_WEIGHT = 0.2
+
+concurrency_limit = metrics.gauge('crawler_concurrency_limit', "Current concurrency limit per budget")
+concurrency_in_use = metrics.gauge('crawler_concurrency_in_use', "Slots currently held per budget")
+concurrency_adjustments = metrics.counter('crawler_concurrency_adjustments_total', "Limit changes by budget and reason")
+
+def available_memory_ratio():
+    """Returns MemAvailable / MemTotal from /proc/meminfo, or None where it cannot be read."""
+    values = {}
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('MemTotal', 'MemAvailable'):
+                    values[key] = int(value.split()[0])
+    except OSError:
+        return None
+    if not values.get('MemTotal') or 'MemAvailable' not in values:
+        return None
+    return values['MemAvailable'] / values['MemTotal']
+
+def load_per_cpu():
+    """Returns the one-minute load average per CPU, or None where it is not available."""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return None
+
+class AdaptiveLimiter:
+    """Semaphore whose limit can be changed while it is in use.
+
+    Lowering the limit never interrupts holders; new acquirers wait until enough slots are released.
+    """
+
+    def __init__(self, name: str, initial: int, floor: int, ceiling: int):
+        self.name = name
+        self.floor = floor
+        self.ceiling = max(floor, ceiling)
+        self.limit = min(max(initial, self.floor), self.ceiling)
+        self.in_use = 0
+        self.waiting = 0
+        self.condition = asyncio.Condition()
+        concurrency_limit.set(self.limit, budget=name)
+        concurrency_in_use.set(0, budget=name)
+
+    async def acquire(self):
+        async with self.condition:
+            self.waiting += 1
+            try:
+                await self.condition.wait_for(lambda: self.in_use < self.limit)
+            finally:
+                self.waiting -= 1
+            self.in_use += 1
+            concurrency_in_use.set(self.in_use, budget=self.name)
+
+    async def release(self):
+        async with self.condition:
+            self.in_use -= 1
+            concurrency_in_use.set(self.in_use, budget=self.name)
+            self.condition.notify()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.release()
+
+    @property
+    def saturated(self) -> bool:
+        """Whether work is waiting for, or using, every slot."""
+        return self.waiting > 0 or self.in_use >= self.limit
+
+    async def set_limit(self, limit: int, reason: str):
+        limit = min(max(limit, self.floor), self.ceiling)
+        if limit == self.limit:
+            return
+        logger.info(f"Concurrency limit for {self.name}: {self.limit} -> {limit} ({reason})")
+        concurrency_adjustments.inc(budget=self.name, reason=reason)
+        async with self.condition:
+            self.limit = limit
+            concurrency_limit.set(limit, budget=self.name)
+            self.condition.notify_all()
+
+    async def increase(self):
+        """Additive increase, only when the current limit is actually used."""
+        if self.saturated:
+            await self.set_limit(self.limit + 1, 'increase')
+
+    async def decrease(self, reason: str, factor: float = DECREASE_FACTOR):
+        """Multiplicative decrease."""
+        await self.set_limit(int(self.limit * factor), reason)
+
+class ConcurrencyController:
+    """Adjusts the site and screenshot budgets (AIMD) from memory, CPU load, event-loop lag and navigation latency."""
+
+    def __init__(self, max_sites: int = MAX_ACTIVE_SITES, max_screenshots: int = MAX_ACTIVE_SCREENSHOTS,
+                 min_sites: int = MIN_ACTIVE_SITES, min_screenshots: int = MIN_ACTIVE_SCREENSHOTS,
+                 interval: float = CONTROL_INTERVAL):
+        self.sites = AdaptiveLimiter('sites', INITIAL_ACTIVE_SITES, min_sites, max_sites)
+        self.screenshots = AdaptiveLimiter('screenshots', INITIAL_ACTIVE_SCREENSHOTS, min_screenshots, max_screenshots)
+        self.interval = interval
+        self.navigation_seconds = None
+        self.loop_lag = 0.0
+        self.task = None
+
+    def observe_navigation(self, seconds: float):
+        """Feeds the duration of a navigation into the moving average."""
+        if self.navigation_seconds is None:
+            self.navigation_seconds = seconds
+        else:
+            self.navigation_seconds += NAVIGATION_EWMA_WEIGHT * (seconds - self.navigation_seconds)
+
+    def pressure(self):
+        """Returns the name of the first signal over its threshold, or None."""
+        memory = available_memory_ratio()
+        if memory is not None and memory < MIN_AVAILABLE_MEMORY_RATIO:
+            return 'memory'
+        load = load_per_cpu()
+        if load is not None and load > MAX_LOAD_PER_CPU:
+            return 'cpu'
+        if self.loop_lag > MAX_LOOP_LAG_SECONDS:
+            return 'loop_lag'
+        if self.navigation_seconds is not None and self.navigation_seconds > MAX_NAVIGATION_SECONDS:
+            return 'navigation_latency'
+        return None
+
+    async def adjust(self):
+        """Runs one control step."""
+        reason = self.pressure()
+        if reason is None:
+            await self.sites.increase()
+            await self.screenshots.increase()
+        elif reason == 'navigation_latency':
+            # Slow navigations mean too many sites are loading at once; screenshots are not the cause
+            await self.sites.decrease(reason)
+        else:
+            await self.sites.decrease(reason)
+            await self.screenshots.decrease(reason)
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            # A busy loop wakes us late; the overshoot is the lag every other task sees too
+            self.loop_lag = max(0.0, time.monotonic() - started - self.interval)
+            try:
+                await self.adjust()
+            except Exception as e:
+                logger.debug(f"Concurrency adjustment failed: {e}")
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    def limits(self) -> dict:
+        """Returns the current limits and usage of both budgets."""
+        return {budget.name: {"limit": budget.limit, "in_use": budget.in_use, "waiting": budget.waiting}
+                for budget in (self.sites, self.screenshots)}
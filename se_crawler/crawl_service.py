@@ -0,0 +1,103 @@
+import asyncio
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+error_logger = logging.getLogger('error_logger')
+
+# Local port of the service API
+SERVICE_PORT = 8765
+# Largest request body accepted, in bytes
+SERVICE_MAX_BODY = 16 * 1024 * 1024
+
+STATUS_TEXT = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large',
+               500: 'Internal Server Error'}
+
+def parse_urls(body: bytes):
+    """Returns the URLs of a request body: one per line, skipping blank lines, comments and malformed entries."""
+    urls = []
+    for line in body.decode('utf-8', errors='replace').splitlines():
+        url = line.strip()
+        if not url or url.startswith('#') or any(c.isspace() for c in url):
+            continue
+        urls.append(url)
+    return urls
+
+class ControlServer:
+    """Local HTTP API of the crawl service.
+
+    POST /crawl with one URL per line queues the URLs and answers once they are queued, so a full queue
+    pushes back on the client. GET /status returns the service's status as JSON. POST /shutdown stops the
+    service after the queued URLs are done.
+    """
+
+    def __init__(self, submit, status, port: int = SERVICE_PORT, host: str = '127.0.0.1'):
+        # submit(urls) is awaited and returns how many URLs were queued; status() returns a JSON-able dict
+        self.submit = submit
+        self.status = status
+        self.port = port
+        self.host = host
+        self.server = None
+        self.shutdown = None
+
+    async def start(self):
+        self.shutdown = asyncio.Event()
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"Crawl service listening on http://{self.host}:{self.port}")
+
+    async def wait_for_shutdown(self):
+        """Returns once a client has asked the service to shut down."""
+        await self.shutdown.wait()
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            parts = request_line.split()
+            if len(parts) < 2:
+                return
+            method, path = parts[0].decode(), parts[1].decode().split('?')[0]
+            length = 0
+            while (line := (await reader.readline()).strip()):
+                name, _, value = line.partition(b':')
+                if name.strip().lower() == b'content-length':
+                    length = int(value.strip())
+            if length > SERVICE_MAX_BODY:
+                await self._respond(writer, 413, {"error": "request body too large"})
+                return
+            body = await reader.readexactly(length) if length else b''
+
+            if method == 'POST' and path == '/crawl':
+                urls = parse_urls(body)
+                accepted = await self.submit(urls)
+                await self._respond(writer, 202, {"received": len(urls), "queued": accepted})
+            elif method == 'GET' and path == '/status':
+                await self._respond(writer, 200, self.status())
+            elif method == 'POST' and path == '/shutdown':
+                self.shutdown.set()
+                await self._respond(writer, 202, {"shutting_down": True})
+            else:
+                await self._respond(writer, 404, {"error": f"no route for {method} {path}"})
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            await self._respond(writer, 400, {"error": str(e)})
+        except Exception as e:
+            error_logger.error(f"Crawl service request failed: {e}")
+            await self._respond(writer, 500, {"error": str(e)})
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        try:
+            writer.write(f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n".encode() +
+                         b'Content-Type: application/json\r\nContent-Length: ' + str(len(body)).encode() +
+                         b'\r\nConnection: close\r\n\r\n' + body)
+            await writer.drain()
+        except Exception as e:
+            logger.debug(f"Could not answer service request: {e}")
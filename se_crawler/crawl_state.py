@@ -0,0 +1,231 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from urllib.parse import urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+# SQLite database holding the persistent crawl state
+CRAWL_STATE_DB = 'crawl_state.db'
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Journal states of a URL within a crawl
+QUEUED = 'queued'
+NAVIGATING = 'navigating'
+CLICKING = 'clicking'
+DONE = 'done'
+FAILED = 'failed'
+# States a URL can be left in when a run is killed
+IN_FLIGHT_STATES = (QUEUED, NAVIGATING, CLICKING)
+
+def normalize_url(url: str) -> str:
+    """Normalizes a URL so that trivially different spellings compare equal. Returns '' for malformed URLs."""
+    url = url.strip()
+    if not url:
+        return ''
+    if '://' not in url:
+        url = 'http://' + url
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        # e.g. an unterminated IPv6 literal such as http://[oops
+        return ''
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if ':' in host:
+        host = f"[{host}]"  # IPv6 literal
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host
+    if port and DEFAULT_PORTS.get(scheme) != port:
+        netloc = f"{host}:{port}"
+    if parts.username:
+        userinfo = parts.username + (f":{parts.password}" if parts.password else '')
+        netloc = f"{userinfo}@{netloc}"
+    path = parts.path or '/'
+    return urlunsplit((scheme, netloc, path, parts.query, ''))
+
+class CrawlState:
+    """Persistent crawl state backed by SQLite with an in-memory index of monitored URLs."""
+
+    def __init__(self, db_path: str = CRAWL_STATE_DB):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS monitored ('
+            'url TEXT PRIMARY KEY, original_url TEXT, monitored_at REAL)'
+        )
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS journal ('
+            'url TEXT PRIMARY KEY, original_url TEXT, state TEXT, reason TEXT, attempts INTEGER DEFAULT 0, '
+            'updated_at REAL, run TEXT)'
+        )
+        if 'run' not in {row[1] for row in self.conn.execute('PRAGMA table_info(journal)')}:
+            self.conn.execute('ALTER TABLE journal ADD COLUMN run TEXT')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS journal_state ON journal (state, updated_at)')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS baselines ('
+            'url TEXT PRIMARY KEY, original_url TEXT, baseline TEXT, checked_at REAL, changed_at REAL, '
+            'interval REAL, next_visit REAL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS baselines_next_visit ON baselines (next_visit)')
+        # Loaded once so membership checks never touch the disk
+        self.monitored = {row[0] for row in self.conn.execute('SELECT url FROM monitored')}
+        logger.info(f"Loaded {len(self.monitored)} monitored URLs from {db_path}")
+        # Tags the journal entries this run queued, so the journal doubles as the run's dedup index
+        self.run = uuid.uuid4().hex
+        self.intake_conn = None
+
+    def is_monitored(self, url: str) -> bool:
+        """Checks whether the normalized URL has already been monitored."""
+        return normalize_url(url) in self.monitored
+
+    def mark_monitored(self, url: str) -> bool:
+        """Records the URL as monitored. Returns False if it was already recorded."""
+        key = normalize_url(url)
+        if not key:
+            return False
+        cursor = self.conn.execute(
+            'INSERT OR IGNORE INTO monitored (url, original_url, monitored_at) VALUES (?, ?, ?)',
+            (key, url, time.time())
+        )
+        self.monitored.add(key)
+        return cursor.rowcount == 1
+
+    def set_state(self, url: str, state: str, reason: str = None):
+        """Records the journal state of a URL. Entering NAVIGATING counts as a new attempt."""
+        key = normalize_url(url)
+        if not key:
+            return
+        self.conn.execute(
+            'INSERT INTO journal (url, original_url, state, reason, attempts, updated_at) VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT(url) DO UPDATE SET state = excluded.state, reason = excluded.reason, '
+            'attempts = journal.attempts + excluded.attempts, updated_at = excluded.updated_at',
+            (key, url, state, reason, 1 if state == NAVIGATING else 0, time.time())
+        )
+
+    def get_state(self, url: str):
+        """Returns (state, reason, attempts) for a URL, or None if it is not in the journal."""
+        return self.conn.execute(
+            'SELECT state, reason, attempts FROM journal WHERE url = ?', (normalize_url(url),)
+        ).fetchone()
+
+    def in_flight_urls(self):
+        """Returns the URLs a previous run left queued, navigating or clicking, oldest first."""
+        placeholders = ', '.join('?' * len(IN_FLIGHT_STATES))
+        rows = self.conn.execute(
+            f'SELECT original_url FROM journal WHERE state IN ({placeholders}) ORDER BY updated_at',
+            IN_FLIGHT_STATES
+        )
+        return [row[0] for row in rows]
+
+    def claim(self, url: str, requeue: bool = True, retry_failed: bool = False) -> bool:
+        """Queues a URL for this run in the journal. Returns False if this run already queued it or, without
+        requeue, if any run has journaled it before. With retry_failed, a URL this run gave up on is queued again.
+
+        Uses a connection of its own, so the URL reader may call it from another thread.
+        """
+        key = normalize_url(url)
+        if not key:
+            return False
+        if self.intake_conn is None:
+            self.intake_conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30, check_same_thread=False)
+        if requeue:
+            retry = f" OR journal.state = '{FAILED}'" if retry_failed else ''
+            conflict = ('DO UPDATE SET state = excluded.state, reason = NULL, run = excluded.run, '
+                        f'updated_at = excluded.updated_at WHERE journal.run IS NOT excluded.run{retry}')
+        else:
+            conflict = 'DO NOTHING'
+        cursor = self.intake_conn.execute(
+            'INSERT INTO journal (url, original_url, state, updated_at, run) VALUES (?, ?, ?, ?, ?) '
+            f'ON CONFLICT(url) {conflict}',
+            (key, url, QUEUED, time.time(), self.run)
+        )
+        return cursor.rowcount == 1
+
+    def get_baseline(self, url: str):
+        """Returns the stored baseline of a site as (baseline, interval), or None."""
+        row = self.conn.execute(
+            'SELECT baseline, interval FROM baselines WHERE url = ?', (normalize_url(url),)
+        ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def save_baseline(self, url: str, baseline: dict, interval: float, changed: bool):
+        """Stores the site's baseline and schedules its next visit after interval seconds."""
+        key = normalize_url(url)
+        if not key:
+            return
+        now = time.time()
+        self.conn.execute(
+            'INSERT INTO baselines (url, original_url, baseline, checked_at, changed_at, interval, next_visit) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(url) DO UPDATE SET baseline = excluded.baseline, '
+            'checked_at = excluded.checked_at, changed_at = COALESCE(excluded.changed_at, baselines.changed_at), '
+            'interval = excluded.interval, next_visit = excluded.next_visit',
+            (key, url, json.dumps(baseline), now, now if changed else None, interval, now + interval)
+        )
+
+    def is_due(self, url: str) -> bool:
+        """Checks whether a site has no baseline yet or its next visit is due."""
+        row = self.conn.execute('SELECT next_visit FROM baselines WHERE url = ?', (normalize_url(url),)).fetchone()
+        return row is None or row[0] <= time.time()
+
+    def due_urls(self):
+        """Returns the monitored sites due for a revisit, most overdue first; sites without a baseline come first."""
+        rows = self.conn.execute(
+            'SELECT m.original_url FROM monitored m LEFT JOIN baselines b ON b.url = m.url '
+            'WHERE b.next_visit IS NULL OR b.next_visit <= ? ORDER BY COALESCE(b.next_visit, 0)',
+            (time.time(),)
+        )
+        return [row[0] for row in rows]
+
+    def get_meta(self, key: str, default=None):
+        """Returns a value from the meta table."""
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key: str, value: str):
+        """Stores a value in the meta table."""
+        self.conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def migrate_text_file(self, filename: str) -> int:
+        """Imports URLs from a legacy monitored_websites.txt file. Runs once per file."""
+        meta_key = f"migrated:{os.path.abspath(filename)}"
+        if self.get_meta(meta_key) or not os.path.exists(filename):
+            return 0
+
+        imported = 0
+        now = time.time()
+        with open(filename, 'r') as file:
+            rows = []
+            for line in file:
+                key = normalize_url(line)
+                if key and key not in self.monitored:
+                    self.monitored.add(key)
+                    rows.append((key, line.strip(), now))
+        with self.conn:
+            self.conn.execute('BEGIN')
+            for row in rows:
+                cursor = self.conn.execute(
+                    'INSERT OR IGNORE INTO monitored (url, original_url, monitored_at) VALUES (?, ?, ?)',
+                    row
+                )
+                imported += cursor.rowcount
+            self.conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (meta_key, str(now)))
+
+        logger.info(f"Imported {imported} URLs from {filename} into {self.db_path}")
+        return imported
+
+    def close(self):
+        """Closes the underlying database connections."""
+        if self.intake_conn is not None:
+            self.intake_conn.close()
+        self.conn.close()
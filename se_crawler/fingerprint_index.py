@@ -0,0 +1,288 @@
+"""Cross-site index of script and stylesheet fingerprints.
+
+Usage:
+    python -m se_crawler.fingerprint_index sites <hash | src substring> [--fuzzy]
+    python -m se_crawler.fingerprint_index new <url>
+    python -m se_crawler.fingerprint_index top [--limit 20]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit
+
+from se_crawler.crawl_state import normalize_url
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+error_logger = logging.getLogger('error_logger')
+
+# SQLite database holding fingerprints and the sites they were seen on
+FINGERPRINT_DB = 'fingerprints.db'
+# Fingerprints whose simhashes differ in at most this many bits are near-duplicates.
+# Must stay below SIMHASH_BANDS so that near-duplicates always share a band.
+FUZZY_MAX_DISTANCE = 3
+SIMHASH_BANDS = 4
+# Tokens per shingle fed into the simhash
+SHINGLE_SIZE = 3
+# Shingles hashed per resource; larger bundles are compared by their first SIMHASH_MAX_SHINGLES shingles
+SIMHASH_MAX_SHINGLES = 20000
+# Bodies larger than this are fingerprinted in worker processes so they never stall the event loop
+FINGERPRINT_INLINE_MAX_BYTES = 32 * 1024
+FINGERPRINT_WORKERS = 2
+# Workers are not forked: the crawler has threads running by then whose locks a forked child could inherit
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+# Characters of content kept with each fingerprint for display
+SAMPLE_CHARS = 200
+
+RESOURCE_KEYS = ('initial_js', 'initial_css', 'new_scripts', 'new_stylesheets')
+
+COMMENT_RE = re.compile(r'/\*.*?\*/|(?<![:\'"\\])//[^\n]*|<!--|-->', re.DOTALL)
+WHITESPACE_RE = re.compile(r'\s+')
+# Values that differ per page view: long hex ids, timestamps, cache busters
+VOLATILE_RE = re.compile(r'\b[0-9a-f]{16,}\b|\b\d{6,}\b', re.IGNORECASE)
+TOKEN_RE = re.compile(r'[A-Za-z_$][\w$]*|\d+|[^\s\w]')
+
+def normalize_content(content: str) -> str:
+    """Strips comments, volatile values and whitespace differences from script or stylesheet text."""
+    content = COMMENT_RE.sub(' ', content or '')
+    content = VOLATILE_RE.sub('0', content)
+    return WHITESPACE_RE.sub(' ', content).strip()
+
+def normalize_src(src: str) -> str:
+    """Reduces a resource URL to host and path, without the query string or volatile path segments."""
+    if not src:
+        return ''
+    parts = urlsplit(src)
+    return VOLATILE_RE.sub('0', f"{(parts.hostname or '').lower()}{parts.path}")
+
+def simhash(tokens, size: int = SHINGLE_SIZE, max_shingles: int = SIMHASH_MAX_SHINGLES) -> int:
+    """Computes a 64-bit simhash over the token shingles."""
+    count = min(max(1, len(tokens) - size + 1), max_shingles)
+    digests = b''.join(hashlib.blake2b(' '.join(tokens[i:i + size]).encode(), digest_size=8).digest()
+                       for i in range(count))
+    # Per bit, most significant first: how many shingle hashes have it set
+    if np is not None:
+        ones = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(count, 8), axis=1).sum(axis=0).tolist()
+    else:
+        rows = (format(int.from_bytes(digests[i:i + 8], 'big'), '064b') for i in range(0, len(digests), 8))
+        ones = [column.count('1') for column in zip(*rows)]
+    return int(''.join('1' if 2 * n > count else '0' for n in ones), 2)
+
+def bands(value: int):
+    """Splits a simhash into SIMHASH_BANDS integers used to look up near-duplicates."""
+    width = 64 // SIMHASH_BANDS
+    return [value >> (i * width) & ((1 << width) - 1) for i in range(SIMHASH_BANDS)]
+
+def to_signed(value: int) -> int:
+    """SQLite integers are signed 64-bit."""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def fingerprint(kind: str, src: str, content: str) -> dict:
+    """Returns the exact hash, simhash and display sample of a script or stylesheet."""
+    src_key = normalize_src(src)
+    body = normalize_content(content)
+    exact = hashlib.sha256(f"{kind}\n{src_key}\n{body}".encode()).hexdigest()[:32]
+    tokens = TOKEN_RE.findall(body) if body else re.split(r'[/.?=&_-]+', src_key)
+    return {
+        "hash": exact,
+        "kind": kind,
+        "src": src_key or None,
+        "simhash": simhash(tokens),
+        "sample": (content or src or '')[:SAMPLE_CHARS],
+    }
+
+class FingerprintIndex:
+    """Persistent index of script/stylesheet fingerprints and the sites (and runs) they were seen on."""
+
+    def __init__(self, db_path: str = FINGERPRINT_DB, run_id: str = None):
+        self.conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        band_columns = ''.join(f', band{i} INTEGER' for i in range(SIMHASH_BANDS))
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS fingerprints ('
+            f'hash TEXT PRIMARY KEY, kind TEXT, src TEXT, simhash INTEGER{band_columns}, sample TEXT, first_seen REAL)'
+        )
+        for i in range(SIMHASH_BANDS):
+            self.conn.execute(f'CREATE INDEX IF NOT EXISTS fingerprints_band{i} ON fingerprints (band{i})')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS fingerprints_src ON fingerprints (src)')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS occurrences ('
+            'site TEXT, hash TEXT, first_run TEXT, last_run TEXT, first_seen REAL, last_seen REAL, '
+            'PRIMARY KEY (site, hash))'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS occurrences_hash ON occurrences (hash)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS runs (site TEXT, run TEXT, seen_at REAL, PRIMARY KEY (site, run))')
+        self.run_id = run_id or f"{time.strftime('%Y%m%d_%H%M%S')}-{os.getpid()}"
+        # Started on the first large resource
+        self.executor = None
+
+    async def fingerprint(self, kind: str, src: str, content: str) -> dict:
+        """Fingerprints a resource, in a worker process when it is large enough to stall the event loop."""
+        if len(content) <= FINGERPRINT_INLINE_MAX_BYTES:
+            return fingerprint(kind, src, content)
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=FINGERPRINT_WORKERS,
+                                                mp_context=multiprocessing.get_context(POOL_START_METHOD))
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fingerprint, kind, src, content)
+
+    def open_site(self, url: str, log):
+        """Wraps a site's change log so the scripts and stylesheets appended to it are fingerprinted."""
+        return SiteFingerprints(self, url, log)
+
+    def record_site(self, url: str, fingerprints):
+        """Stores the fingerprints seen on a site during this run in one transaction."""
+        site = normalize_url(url)
+        now = time.time()
+        with self.conn:
+            self.conn.execute('BEGIN')
+            for fp in fingerprints:
+                value = to_signed(fp["simhash"])
+                self.conn.execute(
+                    f'INSERT OR IGNORE INTO fingerprints (hash, kind, src, simhash, '
+                    f'{", ".join(f"band{i}" for i in range(SIMHASH_BANDS))}, sample, first_seen) '
+                    f'VALUES (?, ?, ?, ?, {", ".join("?" * SIMHASH_BANDS)}, ?, ?)',
+                    (fp["hash"], fp["kind"], fp["src"], value, *bands(fp["simhash"]), fp["sample"], now)
+                )
+                self.conn.execute(
+                    'INSERT INTO occurrences (site, hash, first_run, last_run, first_seen, last_seen) '
+                    'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (site, hash) DO UPDATE SET last_run = ?, last_seen = ?',
+                    (site, fp["hash"], self.run_id, self.run_id, now, now, self.run_id, now)
+                )
+            self.conn.execute('INSERT OR REPLACE INTO runs (site, run, seen_at) VALUES (?, ?, ?)',
+                              (site, self.run_id, now))
+
+    def resolve(self, query: str):
+        """Returns the fingerprint hashes matching an exact hash, or a src substring."""
+        if re.fullmatch(r'[0-9a-f]{32}', query):
+            return [query]
+        return [row[0] for row in self.conn.execute(
+            'SELECT hash FROM fingerprints WHERE src LIKE ?', (f"%{query}%",)
+        )]
+
+    def similar(self, hash_: str, max_distance: int = FUZZY_MAX_DISTANCE):
+        """Returns the hashes of fingerprints within max_distance bits of the given one, itself included."""
+        row = self.conn.execute('SELECT simhash FROM fingerprints WHERE hash = ?', (hash_,)).fetchone()
+        if row is None:
+            return []
+        value = row[0] % (1 << 64)
+        where = ' OR '.join(f'band{i} = ?' for i in range(SIMHASH_BANDS))
+        matches = []
+        for other, other_value in self.conn.execute(f'SELECT hash, simhash FROM fingerprints WHERE {where}', bands(value)):
+            if bin(value ^ (other_value % (1 << 64))).count('1') <= max_distance:
+                matches.append(other)
+        return matches
+
+    def sites_for(self, query: str, fuzzy: bool = False):
+        """Answers "which sites load this script": sites per matching fingerprint."""
+        hashes = self.resolve(query)
+        if fuzzy:
+            hashes = sorted({similar for h in hashes for similar in self.similar(h)})
+        results = []
+        for h in hashes:
+            fp = self.conn.execute('SELECT kind, src, sample FROM fingerprints WHERE hash = ?', (h,)).fetchone()
+            sites = [row[0] for row in self.conn.execute(
+                'SELECT site FROM occurrences WHERE hash = ? ORDER BY site', (h,)
+            )]
+            results.append({"hash": h, "kind": fp[0] if fp else None, "src": fp[1] if fp else None,
+                            "sample": fp[2] if fp else None, "sites": sites})
+        return results
+
+    def changes_since_last_run(self, url: str):
+        """Answers "what's new on this site since last run": added and removed fingerprints between its last two runs."""
+        site = normalize_url(url)
+        runs = [row[0] for row in self.conn.execute(
+            'SELECT run FROM runs WHERE site = ? ORDER BY seen_at DESC LIMIT 2', (site,)
+        )]
+        if not runs:
+            return {"site": site, "runs": [], "added": [], "removed": []}
+        latest = runs[0]
+        previous = runs[1] if len(runs) > 1 else None
+        query = ('SELECT o.hash, f.kind, f.src, f.sample FROM occurrences o JOIN fingerprints f ON f.hash = o.hash '
+                 'WHERE o.site = ? AND ')
+        describe = lambda rows: [{"hash": h, "kind": k, "src": s, "sample": sample} for h, k, s, sample in rows]
+        added = self.conn.execute(query + 'o.first_run = ?', (site, latest)).fetchall()
+        removed = self.conn.execute(query + 'o.last_run = ?', (site, previous)).fetchall() if previous else []
+        return {"site": site, "runs": runs, "added": describe(added), "removed": describe(removed)}
+
+    def top(self, limit: int = 20):
+        """Returns the fingerprints seen on the most sites."""
+        rows = self.conn.execute(
+            'SELECT f.hash, f.kind, f.src, COUNT(*) AS sites FROM occurrences o JOIN fingerprints f ON f.hash = o.hash '
+            'GROUP BY o.hash ORDER BY sites DESC LIMIT ?', (limit,)
+        ).fetchall()
+        return [{"hash": h, "kind": k, "src": s, "sites": n} for h, k, s, n in rows]
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+        self.conn.close()
+
+class SiteFingerprints:
+    """List-like wrapper of a site's change log that fingerprints every script and stylesheet appended to it."""
+
+    def __init__(self, index: FingerprintIndex, url: str, log):
+        self.index = index
+        self.url = url
+        self.log = log
+        self.fingerprints = {}
+
+    def append(self, record: dict):
+        for key in RESOURCE_KEYS:
+            for resource in record.get(key) or ():
+                # Without content the recorder already sent this resource earlier on the same page
+                if 'content' not in resource:
+                    continue
+                fp = resource.get('fingerprint')
+                if fp is None:
+                    kind = 'script' if resource.get('type') == 'script' else 'stylesheet'
+                    fp = fingerprint(kind, resource.get('src'), resource['content'])
+                self.fingerprints.setdefault(fp["hash"], fp)
+        self.log.append(record)
+
+    def __len__(self):
+        return len(self.log)
+
+    def commit(self):
+        """Stores the site's fingerprints for this run."""
+        try:
+            self.index.record_site(self.url, self.fingerprints.values())
+        except sqlite3.Error as e:
+            error_logger.error(f"Failed to index fingerprints for {self.url}: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the script/stylesheet fingerprint index.")
+    parser.add_argument('--db', default=FINGERPRINT_DB, help="Fingerprint database")
+    commands = parser.add_subparsers(dest='command', required=True)
+    sites_parser = commands.add_parser('sites', help="Sites that load a script or stylesheet")
+    sites_parser.add_argument('query', help="Fingerprint hash or a substring of the resource URL")
+    sites_parser.add_argument('--fuzzy', action='store_true', help="Include near-duplicate fingerprints")
+    new_parser = commands.add_parser('new', help="Scripts and stylesheets added or removed since the site's last run")
+    new_parser.add_argument('url')
+    top_parser = commands.add_parser('top', help="Fingerprints seen on the most sites")
+    top_parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    index = FingerprintIndex(args.db)
+    try:
+        if args.command == 'sites':
+            result = index.sites_for(args.query, args.fuzzy)
+        elif args.command == 'new':
+            result = index.changes_since_last_run(args.url)
+        else:
+            result = index.top(args.limit)
+        print(json.dumps(result, indent=4))
+    finally:
+        index.close()
@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+from se_crawler.crawl_state import normalize_url
+from se_crawler.metrics import metrics
+
+logger = logging.getLogger(__name__)
+error_logger = logging.getLogger('error_logger')
+
+# Sites of the same host monitored at once
+MAX_SITES_PER_HOST = 2
+# Minimum time between two navigations to the same host, in seconds
+HOST_MIN_INTERVAL = 1.0
+# URLs of a busy host set aside to wait for its slot; beyond this the worker waits itself, pushing back on the queue
+MAX_DEFERRED_PER_HOST = 50
+# Navigation attempts per URL before it is given up
+MAX_NAVIGATION_ATTEMPTS = 3
+# Exponential backoff between attempts: base * 2^(attempt - 1), capped, with up to 25% jitter
+RETRY_BASE_DELAY = 10.0
+RETRY_MAX_DELAY = 300.0
+# Consecutive connection failures after which a host is considered down
+HOST_FAILURE_LIMIT = 3
+
+# Playwright/Chromium error fragments mapped to failure reasons, checked in order
+FAILURE_PATTERNS = (
+    ('ERR_NAME_NOT_RESOLVED', 'dns'),
+    ('ERR_NAME_RESOLUTION_FAILED', 'dns'),
+    ('ERR_CONNECTION_REFUSED', 'connection_refused'),
+    ('ERR_ADDRESS_UNREACHABLE', 'unreachable'),
+    ('ERR_CONNECTION_TIMED_OUT', 'connect_timeout'),
+    ('ERR_CONNECTION_RESET', 'connection_reset'),
+    ('ERR_CONNECTION_CLOSED', 'connection_reset'),
+    ('ERR_EMPTY_RESPONSE', 'connection_reset'),
+    ('ERR_CERT_', 'tls'),
+    ('ERR_SSL_', 'tls'),
+    ('ERR_TOO_MANY_REDIRECTS', 'redirect_loop'),
+    ('ERR_INTERNET_DISCONNECTED', 'network_down'),
+    ('ERR_NETWORK_CHANGED', 'network_down'),
+    ('ERR_ABORTED', 'aborted'),
+    # The network policy aborted the document itself, e.g. for being too large; another attempt would be too
+    ('ERR_BLOCKED_BY_CLIENT', 'blocked'),
+    ('Timeout', 'timeout'),
+)
+# Reasons after which the whole host is skipped straight away
+DEAD_HOST_REASONS = {'dns'}
+# Reasons that count towards HOST_FAILURE_LIMIT
+CONNECTION_FAILURE_REASONS = {'connection_refused', 'unreachable', 'connect_timeout'}
+# Reasons worth another attempt later; anything else fails the URL at once
+RETRYABLE_REASONS = {'timeout', 'connect_timeout', 'connection_reset', 'network_down', 'other'}
+
+navigation_failures = metrics.counter('crawler_navigation_failures_total', "Failed navigations by reason")
+retries_scheduled = metrics.counter('crawler_navigation_retries_total', "Navigations scheduled for another attempt")
+dead_host_skips = metrics.counter('crawler_dead_host_skips_total', "URLs skipped because their host is down")
+deferred_urls = metrics.counter('crawler_deferred_urls_total', "URLs set aside until their busy host has a free slot")
+
+def classify_failure(error) -> str:
+    """Maps a navigation error (exception or message) to a short failure reason."""
+    message = str(error)
+    for fragment, reason in FAILURE_PATTERNS:
+        if fragment in message:
+            return reason
+    if type(error).__name__ == 'TimeoutError':
+        return 'timeout'
+    return 'other'
+
+def host_of(url: str) -> str:
+    return urlsplit(normalize_url(url)).hostname or ''
+
+def retry_delay(attempt: int) -> float:
+    """Returns the backoff before the next attempt after the given failed attempt."""
+    delay = min(RETRY_BASE_DELAY * 2 ** (attempt - 1), RETRY_MAX_DELAY)
+    return delay * (1 + random.random() * 0.25)
+
+class _Host:
+    def __init__(self, max_sites: int):
+        self.semaphore = asyncio.Semaphore(max_sites)
+        self.next_start = 0.0
+        self.consecutive_failures = 0
+        self.dead_reason = None
+        self.deferred = 0
+
+class HostScheduler:
+    """Per-host politeness (concurrency cap and rate limit), dead-host short-circuiting and navigation retries."""
+
+    def __init__(self, max_sites_per_host: int = MAX_SITES_PER_HOST, min_interval: float = HOST_MIN_INTERVAL,
+                 max_attempts: int = MAX_NAVIGATION_ATTEMPTS, max_deferred: int = MAX_DEFERRED_PER_HOST):
+        self.max_sites_per_host = max_sites_per_host
+        self.min_interval = min_interval
+        self.max_attempts = max_attempts
+        self.max_deferred = max_deferred
+        self.hosts = {}
+        self.attempts = {}
+        self.pending = set()
+
+    def _host(self, url: str) -> _Host:
+        host = host_of(url)
+        if host not in self.hosts:
+            self.hosts[host] = _Host(self.max_sites_per_host)
+        return self.hosts[host]
+
+    def dead_reason(self, url: str):
+        """Returns why the URL's host is considered down, or None."""
+        host = self.hosts.get(host_of(url))
+        if host is None or host.dead_reason is None:
+            return None
+        dead_host_skips.inc()
+        return host.dead_reason
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        """Holds one of the host's slots, starting no sooner than the host's rate limit allows."""
+        host = self._host(url)
+        async with host.semaphore:
+            now = time.monotonic()
+            start = max(now, host.next_start)
+            host.next_start = start + self.min_interval
+            if start > now:
+                await asyncio.sleep(start - now)
+            yield
+
+    def available(self, url: str) -> bool:
+        """Checks whether slot(url) would be entered at once: a slot is free and the rate limit allows a start."""
+        host = self._host(url)
+        return not host.semaphore.locked() and host.next_start <= time.monotonic()
+
+    def defer(self, url: str, coroutine_function) -> bool:
+        """Awaits coroutine_function() inside slot(url) in the background, tracked until it finishes, so the caller
+        can move on to another host. Returns False if the host already has max_deferred URLs waiting.
+        """
+        host = self._host(url)
+        if host.deferred >= self.max_deferred:
+            return False
+        host.deferred += 1
+        deferred_urls.inc()
+
+        async def run():
+            waiting = True
+            try:
+                async with self.slot(url):
+                    waiting = False
+                    host.deferred -= 1
+                    await coroutine_function()
+            except Exception as e:
+                error_logger.error(f"Deferred URL {url} failed: {e}")
+            finally:
+                if waiting:
+                    host.deferred -= 1
+
+        self._track(run())
+        return True
+
+    def mark_dead(self, url: str, reason: str):
+        """Marks the URL's host as down, e.g. after a failed pre-flight check."""
+        self._host(url).dead_reason = reason
+
+    def record_success(self, url: str):
+        self._host(url).consecutive_failures = 0
+        self.attempts.pop(url, None)
+
+    def record_failure(self, url: str, reason: str):
+        """Records a failed navigation. Returns the delay before the next attempt, or None to give up."""
+        navigation_failures.inc(reason=reason)
+        host = self._host(url)
+        if reason in DEAD_HOST_REASONS:
+            host.dead_reason = reason
+        elif reason in CONNECTION_FAILURE_REASONS:
+            host.consecutive_failures += 1
+            if host.consecutive_failures >= HOST_FAILURE_LIMIT:
+                host.dead_reason = reason
+        if host.dead_reason is not None:
+            logger.info(f"Host {host_of(url)} looks down ({host.dead_reason}); skipping its remaining URLs.")
+
+        attempt = self.attempts.get(url, 0) + 1
+        self.attempts[url] = attempt
+        if host.dead_reason is not None or reason not in RETRYABLE_REASONS or attempt >= self.max_attempts:
+            self.attempts.pop(url, None)
+            return None
+        retries_scheduled.inc(reason=reason)
+        return retry_delay(attempt)
+
+    def retry_later(self, delay: float, coroutine_function):
+        """Awaits coroutine_function() after the delay, tracked until it finishes."""
+        async def retry():
+            await asyncio.sleep(delay)
+            try:
+                await coroutine_function()
+            except Exception as e:
+                error_logger.error(f"Retry failed: {e}")
+
+        return self._track(retry())
+
+    def _track(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+        return task
+
+    async def drain(self):
+        """Waits for every scheduled retry and deferred URL, including those scheduled by them."""
+        while self.pending:
+            await asyncio.gather(*list(self.pending), return_exceptions=True)
@@ -0,0 +1,281 @@
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+error_logger = logging.getLogger('error_logger')
+
+# Latency buckets in seconds, from fast DOM evaluations up to long navigations
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+# How often the JSON metrics file is rewritten
+METRICS_INTERVAL = 10
+
+# Trace of the site being monitored by the current task, if tracing is on
+current_trace = contextvars.ContextVar('current_trace', default=None)
+
+def _label_key(labels: dict):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key, extra: dict = None) -> str:
+    items = list(key) + list((extra or {}).items())
+    if not items:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in items) + '}'
+
+class Counter:
+    """Monotonically increasing value per label set."""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, None, value) for key, value in self.values.items()]
+
+    def snapshot(self):
+        with self.lock:
+            return {_format_labels(key) or 'total': value for key, value in self.values.items()}
+
+class Gauge(Counter):
+    """Value that can go up and down, or be read from a callback at export time."""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, description: str, callback=None):
+        super().__init__(name, description)
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[_label_key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self.callback is not None:
+            try:
+                self.set(self.callback())
+            except Exception:
+                pass
+        return super().samples()
+
+    def snapshot(self):
+        self.samples()
+        return super().snapshot()
+
+class Histogram:
+    """Distribution of observed values in cumulative buckets per label set."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, description: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            counts, total, count = self.values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value, count + 1)
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                for bound, bucket_count in zip(self.buckets, counts):
+                    samples.append((f"{self.name}_bucket", key, {'le': bound}, bucket_count))
+                samples.append((f"{self.name}_bucket", key, {'le': '+Inf'}, count))
+                samples.append((f"{self.name}_sum", key, None, total))
+                samples.append((f"{self.name}_count", key, None, count))
+        return samples
+
+    def quantile(self, q: float, **labels):
+        """Estimates a quantile from the buckets (upper bound of the bucket that contains it)."""
+        with self.lock:
+            counts, _, count = self.values.get(_label_key(labels), (None, 0, 0))
+        if not count:
+            return None
+        rank = q * count
+        for bound, bucket_count in zip(self.buckets, counts):
+            if bucket_count >= rank:
+                return bound
+        return float('inf')
+
+    def snapshot(self):
+        with self.lock:
+            keys = list(self.values)
+        result = {}
+        for key in keys:
+            labels = dict(key)
+            counts, total, count = self.values[key]
+            result[_format_labels(key) or 'total'] = {
+                "count": count,
+                "sum": round(total, 3),
+                "p50": self.quantile(0.5, **labels),
+                "p95": self.quantile(0.95, **labels),
+            }
+        return result
+
+class MetricsRegistry:
+    """Holds the crawler's metrics and renders them for export."""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def _register(self, metric):
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, description: str) -> Counter:
+        return self._register(Counter(name, description))
+
+    def gauge(self, name: str, description: str, callback=None) -> Gauge:
+        gauge = self._register(Gauge(name, description))
+        if callback is not None:
+            gauge.callback = callback
+        return gauge
+
+    def histogram(self, name: str, description: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, description, buckets))
+
+    def render_prometheus(self) -> str:
+        """Renders every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, extra, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key, extra)} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> dict:
+        """Returns every metric as plain JSON-serializable data."""
+        return {"timestamp": time.time(), "metrics": {name: m.snapshot() for name, m in self.metrics.items()}}
+
+metrics = MetricsRegistry()
+phase_seconds = metrics.histogram('crawler_phase_seconds', "Time spent per crawl phase")
+sites_total = metrics.counter('crawler_sites_total', "Sites processed by outcome")
+clicks_total = metrics.counter('crawler_clicks_total', "Clicks performed")
+screenshots_total = metrics.counter('crawler_screenshots_total', "Screenshots by outcome")
+active_pages = metrics.gauge('crawler_active_pages', "Sites currently holding a browser page")
+queue_depth = metrics.gauge('crawler_queue_depth', "URLs waiting in the work queue")
+
+@contextmanager
+def timed(phase: str):
+    """Times a block as one crawl phase and adds it to the current site trace."""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        elapsed = time.monotonic() - start
+        phase_seconds.observe(elapsed, phase=phase)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.append({"phase": phase, "start": round(start - trace.started, 3), "seconds": round(elapsed, 3)})
+
+class SiteTrace(list):
+    """Spans of the phases of one site, relative to when monitoring of the site started."""
+
+    def __init__(self):
+        super().__init__()
+        self.started = time.monotonic()
+
+def start_trace():
+    """Starts collecting a trace for the site handled by the current task."""
+    trace = SiteTrace()
+    current_trace.set(trace)
+    return trace
+
+async def _handle_http(reader, writer):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()).strip():
+            pass
+        path = request_line.split()[1].decode() if len(request_line.split()) > 1 else '/'
+        if path.startswith('/metrics.json'):
+            body, content_type = json.dumps(metrics.snapshot()).encode(), 'application/json'
+        else:
+            body, content_type = metrics.render_prometheus().encode(), 'text/plain; version=0.0.4'
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: ' + content_type.encode() +
+                     b'\r\nContent-Length: ' + str(len(body)).encode() + b'\r\nConnection: close\r\n\r\n' + body)
+        await writer.drain()
+    except Exception as e:
+        logger.debug(f"Metrics request failed: {e}")
+    finally:
+        writer.close()
+
+def write_metrics_file(filename: str):
+    """Writes a JSON snapshot of the metrics, replacing the previous one atomically."""
+    tmp_name = f"{filename}.tmp"
+    with open(tmp_name, 'w') as f:
+        json.dump(metrics.snapshot(), f, indent=2)
+    os.replace(tmp_name, filename)
+
+class MetricsExporter:
+    """Serves metrics over HTTP (/metrics, /metrics.json) and/or rewrites a JSON file periodically."""
+
+    def __init__(self, port: int = None, filename: str = None, interval: float = METRICS_INTERVAL):
+        self.port = port
+        self.filename = filename
+        self.interval = interval
+        self.server = None
+        self.task = None
+
+    async def start(self):
+        if self.port:
+            self.server = await asyncio.start_server(_handle_http, '127.0.0.1', self.port)
+            logger.info(f"Serving metrics on http://127.0.0.1:{self.port}/metrics")
+        if self.filename:
+            self.task = asyncio.create_task(self._write_periodically())
+
+    async def _write_periodically(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(write_metrics_file, self.filename)
+            except OSError as e:
+                error_logger.error(f"Failed to write metrics file: {e}")
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+        if self.filename:
+            try:
+                write_metrics_file(self.filename)
+            except OSError as e:
+                error_logger.error(f"Failed to write metrics file: {e}")
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+def instrumented(phase: str):
+    """Decorates a coroutine function so every call is timed as the given phase."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with timed(phase):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
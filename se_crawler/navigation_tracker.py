@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import time
+from urllib.parse import urljoin
+
+logger = logging.getLogger(__name__)
+error_logger = logging.getLogger('error_logger')
+
+# New tabs processed at once per site; further tabs are recorded and closed straight away
+MAX_OPEN_TABS = 5
+# How long the end of a site waits for new tabs that are still being processed
+TAB_DRAIN_CAP_MS = 30000
+
+class NavigationTracker:
+    """Records the redirect and popup graph of a site's pages from browser events as they happen.
+
+    Every navigation, HTTP redirect hop (with status code), popup and tab close is attributed to the
+    click that was in progress, with its time in ms since that click. New tabs are handed to on_new_tab
+    in their own task, so they are captured while the click loop carries on.
+    """
+
+    def __init__(self, page, on_new_tab=None, max_open_tabs: int = MAX_OPEN_TABS):
+        self.page = page
+        self.context = page.context
+        self.loop = asyncio.get_running_loop()
+        self.on_new_tab = on_new_tab
+        self.max_open_tabs = max_open_tabs
+        self.page_ids = {}
+        self.handled = {page}
+        self.page_urls = {}
+        self.opened_at = {}
+        self.tasks = set()
+        self.listeners = []
+        self._reset(None)
+        self._track(page)
+        self._listen(self.context, 'page', self._on_page)
+        self._listen(self.context, 'response', self._on_response)
+
+    def _listen(self, emitter, event, handler):
+        emitter.on(event, handler)
+        self.listeners.append((emitter, event, handler))
+
+    def detach(self):
+        """Unsubscribes from every page and the context."""
+        for emitter, event, handler in self.listeners:
+            try:
+                emitter.remove_listener(event, handler)
+            except Exception:
+                pass
+        self.listeners = []
+
+    def _reset(self, label):
+        self.click = label
+        self.click_started = self.loop.time()
+        self.edges = []
+        self.pages = {}
+
+    def begin_click(self, label: str):
+        """Starts attributing events to a new click. Events not taken yet stay with it."""
+        self.click = label
+        self.click_started = self.loop.time()
+
+    def take_graph(self) -> dict:
+        """Returns the graph recorded since it was last taken and starts a new, unlabelled one."""
+        nodes = sorted({url for edge in self.edges for url in (edge["from"], edge["to"]) if url})
+        graph = {"click": self.click, "nodes": nodes, "edges": self.edges, "pages": self.pages}
+        self._reset(None)
+        return graph
+
+    def _ms(self) -> int:
+        return int((self.loop.time() - self.click_started) * 1000)
+
+    def _edge(self, kind: str, page_id: int, from_url, to_url, status=None):
+        self.edges.append({"type": kind, "page": page_id, "from": from_url, "to": to_url, "status": status, "t": self._ms()})
+
+    def _track(self, page) -> int:
+        if page in self.page_ids:
+            return self.page_ids[page]
+        page_id = len(self.page_ids)
+        self.page_ids[page] = page_id
+        self.page_urls[page_id] = page.url
+        self.opened_at[page_id] = self.loop.time()
+        self._listen(page, 'framenavigated', lambda frame: self._on_frame_navigated(page_id, frame))
+        self._listen(page, 'popup', lambda popup: self._on_popup(page_id, popup))
+        self._listen(page, 'close', lambda _: self._on_close(page_id))
+        return page_id
+
+    def _on_page(self, page):
+        if page in self.handled:
+            return
+        self.handled.add(page)
+        page_id = self._track(page)
+        self.pages[page_id] = {"opened": self._ms(), "url": page.url}
+        logger.info(f"New tab detected: {page.url or 'about:blank'}")
+        if self.on_new_tab is None:
+            return
+        if len(self.tasks) >= self.max_open_tabs:
+            logger.info("Too many tabs open; closing the new one without capturing it.")
+            self._spawn(page.close())
+            return
+        self._spawn(self.on_new_tab(page, self.click))
+
+    def _spawn(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            error_logger.error(f"Error while capturing a new tab: {task.exception()}")
+
+    def _on_popup(self, opener_id: int, popup):
+        popup_id = self._track(popup)
+        self._edge('popup', popup_id, self.page_urls.get(opener_id), popup.url)
+
+    def _on_close(self, page_id: int):
+        lifetime = int((self.loop.time() - self.opened_at[page_id]) * 1000)
+        self.pages.setdefault(page_id, {})["closed"] = self._ms()
+        self.pages[page_id]["lifetime_ms"] = lifetime
+
+    def _on_response(self, response):
+        try:
+            request = response.request
+            if not request.is_navigation_request() or request.frame.parent_frame is not None:
+                return
+            page_id = self.page_ids.get(request.frame.page)
+        except Exception:
+            return  # Service workers and detached frames have no page
+        if page_id is None:
+            return
+        status = response.status
+        if request.redirected_from is None:
+            # First hop of a navigation: link it to where the page was
+            self._edge('navigation', page_id, self.page_urls.get(page_id), request.url, None if 300 <= status < 400 else status)
+        if 300 <= status < 400:
+            location = response.headers.get('location')
+            self._edge('redirect', page_id, request.url, urljoin(request.url, location) if location else None, status)
+        elif request.redirected_from is not None:
+            self._edge('document', page_id, None, request.url, status)
+        self.page_urls[page_id] = request.url
+
+    def _on_frame_navigated(self, page_id: int, frame):
+        if frame.parent_frame is not None:
+            return
+        if frame.url != self.page_urls.get(page_id):
+            # No network response for this one: same-document, history API or about:blank navigations
+            self._edge('navigation', page_id, self.page_urls.get(page_id), frame.url)
+            self.page_urls[page_id] = frame.url
+
+    async def drain(self, max_wait_ms: int = TAB_DRAIN_CAP_MS):
+        """Waits for new tabs still being captured, cancelling them after max_wait_ms."""
+        if not self.tasks:
+            return
+        deadline = time.monotonic() + max_wait_ms / 1000
+        while self.tasks and time.monotonic() < deadline:
+            await asyncio.wait(list(self.tasks), timeout=deadline - time.monotonic())
+        for task in list(self.tasks):
+            task.cancel()
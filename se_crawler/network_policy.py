@@ -0,0 +1,288 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+error_logger = logging.getLogger('error_logger')
+
+# Resource types that are never fetched
+BLOCKED_RESOURCE_TYPES = {'font', 'media', 'ping'}
+# Hosts (or parent domains) of tracking beacons. Ad-network hosts are deliberately not listed,
+# since their scripts are what the crawler is looking for.
+TRACKING_HOSTS = {
+    'google-analytics.com', 'analytics.google.com', 'stats.g.doubleclick.net', 'connect.facebook.net',
+    'bat.bing.com', 'hotjar.com', 'mc.yandex.ru', 'scorecardresearch.com', 'quantserve.com',
+}
+# Responses larger than this are not delivered to the page
+MAX_RESPONSE_BYTES = 10 * 1024 * 1024
+# Uncached resource types whose responses are fetched here so MAX_RESPONSE_BYTES applies to them too
+SIZE_CAPPED_RESOURCE_TYPES = {'document', 'xhr', 'fetch'}
+
+# On-disk HTTP cache shared by every context and run
+HTTP_CACHE_DIR = 'http_cache'
+CACHEABLE_RESOURCE_TYPES = {'script', 'stylesheet', 'image'}
+# Without max-age or Expires, a response with Last-Modified is kept for this share of its age, up to the cap.
+# Responses without either are not cached.
+HTTP_CACHE_HEURISTIC_RATIO = 0.1
+HTTP_CACHE_HEURISTIC_MAX_TTL = 3600
+HTTP_CACHE_MAX_ENTRY_BYTES = 2 * 1024 * 1024
+# Total size the cache is pruned down to: expired entries go first, then those expiring soonest
+HTTP_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# The cache is pruned on startup and again whenever this many bytes were written since the last pruning
+HTTP_CACHE_PRUNE_EVERY_BYTES = 64 * 1024 * 1024
+# Request headers that can change the response body and therefore belong in the cache key
+CACHE_KEY_HEADERS = ('accept', 'accept-language')
+# Vary may only name these for a response to be cached; bodies are stored decoded, so accept-encoding is harmless
+CACHE_VARY_HEADERS = set(CACHE_KEY_HEADERS) | {'accept-encoding'}
+# Response headers that must not be replayed with a decoded body
+DROPPED_RESPONSE_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'set-cookie'}
+
+MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+def host_matches(host: str, domains) -> bool:
+    """Checks whether the host is one of the domains or a subdomain of one."""
+    parts = host.split('.')
+    return any('.'.join(parts[i:]) in domains for i in range(len(parts)))
+
+def cache_key(request_url: str, headers: dict) -> str:
+    """Builds the cache key for a request from its URL and the headers that select a representation."""
+    key = request_url + ''.join(f"\n{name}:{headers.get(name, '')}" for name in CACHE_KEY_HEADERS)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+def http_date(value):
+    """Parses an HTTP date header to a timestamp, or None if it is missing or invalid."""
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+def cache_ttl(headers: dict):
+    """Returns how long a response may be cached, or None if it must not be.
+
+    Responses are never revalidated, so no-cache counts as not cacheable. Freshness comes from max-age, then
+    Expires, then a short heuristic based on Last-Modified. Responses that vary on request headers outside the
+    cache key are not cached.
+    """
+    cache_control = headers.get('cache-control', '').lower()
+    if any(directive in cache_control for directive in ('no-store', 'no-cache', 'private')):
+        return None
+    vary = {name.strip().lower() for name in headers.get('vary', '').split(',') if name.strip()}
+    if not vary <= CACHE_VARY_HEADERS:
+        return None
+    match = MAX_AGE_RE.search(cache_control)
+    if match:
+        return int(match.group(1)) or None
+    date = http_date(headers.get('date')) or time.time()
+    if 'expires' in headers:
+        # An invalid Expires means already expired
+        expires = http_date(headers['expires'])
+        return expires - date if expires is not None and expires > date else None
+    last_modified = http_date(headers.get('last-modified'))
+    if last_modified is not None and last_modified < date:
+        return min((date - last_modified) * HTTP_CACHE_HEURISTIC_RATIO, HTTP_CACHE_HEURISTIC_MAX_TTL)
+    return None
+
+class HttpCache:
+    """Stores response bodies and metadata on disk, keyed by request URL and headers."""
+
+    def __init__(self, cache_dir: str = HTTP_CACHE_DIR, max_bytes: int = HTTP_CACHE_MAX_BYTES,
+                 prune_every: int = HTTP_CACHE_PRUNE_EVERY_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.prune_every = prune_every
+        self.hits = 0
+        self.misses = 0
+        self.written = 0
+        self.prune_lock = threading.Lock()
+
+    def _paths(self, key: str):
+        directory = os.path.join(self.cache_dir, key[:2])
+        return os.path.join(directory, f"{key}.json"), os.path.join(directory, f"{key}.body")
+
+    def get(self, key: str):
+        """Returns (meta, body) for a fresh entry, or None."""
+        meta_path, body_path = self._paths(key)
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            if meta['expires'] < time.time():
+                return None
+            with open(body_path, 'rb') as f:
+                return meta, f.read()
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, key: str, meta: dict, body: bytes):
+        """Writes an entry, replacing any previous one atomically."""
+        meta_path, body_path = self._paths(key)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        suffix = f".{os.getpid()}.tmp"
+        with open(body_path + suffix, 'wb') as f:
+            f.write(body)
+        with open(meta_path + suffix, 'w') as f:
+            json.dump(meta, f)
+        os.replace(body_path + suffix, body_path)
+        os.replace(meta_path + suffix, meta_path)
+        self.written += len(body)
+        if self.written >= self.prune_every:
+            self.prune()
+
+    def prune(self) -> int:
+        """Removes expired and unreadable entries, then those expiring soonest until the cache fits in max_bytes.
+        Returns the number of entries removed. Only one thread prunes at a time; others return at once.
+        """
+        if not self.prune_lock.acquire(blocking=False):
+            return 0
+        try:
+            self.written = 0
+            entries = []
+            for directory, _, names in os.walk(self.cache_dir):
+                for name in names:
+                    if not name.endswith('.json'):
+                        continue
+                    meta_path = os.path.join(directory, name)
+                    body_path = f"{meta_path[:-len('.json')]}.body"
+                    try:
+                        with open(meta_path, 'r') as f:
+                            expires = json.load(f)['expires']
+                        size = os.path.getsize(meta_path) + os.path.getsize(body_path)
+                    except (OSError, ValueError, KeyError):
+                        expires, size = 0, 0
+                    entries.append((expires, size, meta_path, body_path))
+            entries.sort()
+            total = sum(size for _, size, _, _ in entries)
+            now = time.time()
+            removed = 0
+            for expires, size, meta_path, body_path in entries:
+                if expires >= now and total <= self.max_bytes:
+                    break
+                for path in (meta_path, body_path):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                total -= size
+                removed += 1
+            if removed:
+                logger.info(f"Pruned {removed} HTTP cache entries; {total} bytes left.")
+            return removed
+        finally:
+            self.prune_lock.release()
+
+class NetworkPolicy:
+    """Routes every request of a browser context through blocking rules and the shared HTTP cache."""
+
+    def __init__(self, blocked_types=BLOCKED_RESOURCE_TYPES, tracking_hosts=TRACKING_HOSTS,
+                 max_response_bytes: int = MAX_RESPONSE_BYTES, cache: HttpCache = None,
+                 cacheable_types=CACHEABLE_RESOURCE_TYPES, size_capped_types=SIZE_CAPPED_RESOURCE_TYPES):
+        self.blocked_types = set(blocked_types)
+        self.tracking_hosts = set(tracking_hosts)
+        self.max_response_bytes = max_response_bytes
+        self.cache = cache
+        self.cacheable_types = set(cacheable_types)
+        self.size_capped_types = set(size_capped_types)
+        # Blocked requests per context, collected for the site currently using it
+        self.logs = {}
+
+    async def attach(self, context):
+        """Installs the routing handler on a new browser context."""
+        self.logs[context] = []
+        await context.route('**/*', lambda route, request: self._handle(context, route, request))
+        context.on('close', lambda _: self.logs.pop(context, None))
+
+    def take_log(self, context):
+        """Returns and clears the requests blocked in the context so far."""
+        log = self.logs.get(context, [])
+        self.logs[context] = []
+        return log
+
+    def block_reason(self, request):
+        """Returns why a request should be blocked, or None."""
+        if request.resource_type in self.blocked_types:
+            return f"resource_type:{request.resource_type}"
+        host = (urlsplit(request.url).hostname or '').lower()
+        if host and host_matches(host, self.tracking_hosts):
+            return "tracking"
+        return None
+
+    def _record(self, context, request, reason):
+        self.logs.setdefault(context, []).append({
+            "url": request.url,
+            "resource_type": request.resource_type,
+            "reason": reason,
+            "timestamp": time.time(),
+        })
+
+    async def _handle(self, context, route, request):
+        try:
+            reason = self.block_reason(request)
+            if reason:
+                self._record(context, request, reason)
+                await route.abort('blockedbyclient')
+                return
+            if self.cache is not None and request.method == 'GET' and request.resource_type in self.cacheable_types:
+                await self._handle_cached(context, route, request)
+                return
+            if request.resource_type in self.size_capped_types:
+                fetched = await self._fetch(context, route, request)
+                if fetched is not None:
+                    response, body, headers = fetched
+                    await route.fulfill(status=response.status, headers=headers, body=body)
+                return
+            await route.continue_()
+        except Exception as e:
+            logger.debug(f"Routing failed for {request.url}: {e}")
+            try:
+                await route.continue_()
+            except Exception:
+                pass
+
+    async def _handle_cached(self, context, route, request):
+        key = cache_key(request.url, request.headers)
+        entry = await asyncio.to_thread(self.cache.get, key)
+        if entry is not None:
+            meta, body = entry
+            self.cache.hits += 1
+            await route.fulfill(status=meta['status'], headers=meta['headers'], body=body)
+            return
+
+        self.cache.misses += 1
+        fetched = await self._fetch(context, route, request)
+        if fetched is None:
+            return
+        response, body, headers = fetched
+        ttl = cache_ttl({k.lower(): v for k, v in response.headers.items()})
+        if response.status == 200 and ttl and len(body) <= HTTP_CACHE_MAX_ENTRY_BYTES:
+            meta = {"url": request.url, "status": response.status, "headers": headers, "expires": time.time() + ttl}
+            try:
+                await asyncio.to_thread(self.cache.put, key, meta, body)
+            except OSError as e:
+                error_logger.error(f"Failed to cache {request.url}: {e}")
+        await route.fulfill(status=response.status, headers=headers, body=body)
+
+    async def _fetch(self, context, route, request):
+        """Fetches the response in place of the browser. Returns (response, body, headers to replay), or None if
+        the body was too large and the request was aborted instead.
+        """
+        # Redirects are handed back to the browser, so the page ends up at the right URL
+        response = await route.fetch(max_redirects=0)
+        # A declared length over the cap is rejected without reading the body at all
+        length = response.headers.get('content-length', '')
+        size = int(length) if length.isdigit() else None
+        if size is None or size <= self.max_response_bytes:
+            body = await response.body()
+            size = len(body)
+        if size > self.max_response_bytes:
+            await response.dispose()
+            self._record(context, request, f"too_large:{size}")
+            await route.abort('blockedbyclient')
+            return None
+        headers = {k.lower(): v for k, v in response.headers.items() if k.lower() not in DROPPED_RESPONSE_HEADERS}
+        return response, body, headers
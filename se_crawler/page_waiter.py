@@ -0,0 +1,137 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# The page counts as settled after this long without network, navigation or DOM activity
+QUIET_WINDOW_MS = 1500
+# Requests still in flight that are tolerated when deciding the network is idle (long polls, beacons)
+MAX_IDLE_INFLIGHT = 2
+# Hard cap on waiting for redirections or new tabs after a click
+REDIRECT_WAIT_CAP_MS = 10000
+# Hard cap on waiting for the page to settle before the next click
+CLICK_SETTLE_CAP_MS = 5000
+# Final observation window after the clicks, for ads that appear late
+FINAL_QUIET_WINDOW_MS = 5000
+FINAL_WAIT_CAP_MS = 120000
+
+MUTATION_BINDING = '__crawlerActivity'
+
+# Reports DOM mutations to Python, coalesced so busy pages do not flood the binding
+MUTATION_OBSERVER_JS = """
+(() => {
+    if (window.__crawlerActivityInstalled) return;
+    window.__crawlerActivityInstalled = true;
+    let pending = false;
+    const notify = () => {
+        if (pending) return;
+        pending = true;
+        setTimeout(() => {
+            pending = false;
+            try { window.%(binding)s(); } catch (e) {}
+        }, 50);
+    };
+    const start = () => {
+        new MutationObserver(notify).observe(document, {
+            childList: true, subtree: true, attributes: true, characterData: true
+        });
+    };
+    if (document.documentElement) start();
+    else document.addEventListener('DOMContentLoaded', start);
+})();
+""" % {'binding': MUTATION_BINDING}
+
+class ActivityTracker:
+    """Tracks network, navigation, popup and DOM activity on a page to detect when it settles."""
+
+    def __init__(self, page):
+        self.page = page
+        self.loop = asyncio.get_running_loop()
+        self.inflight = set()
+        self.last_activity = self.loop.time()
+        self.activity = asyncio.Event()
+        # Bumped on every DOM mutation batch and main-frame navigation, so callers can cache DOM queries
+        self.dom_version = 0
+        self._listeners = [
+            (page, 'request', self._on_request),
+            (page, 'requestfinished', self._on_request_done),
+            (page, 'requestfailed', self._on_request_done),
+            (page, 'framenavigated', self._on_navigated),
+            (page, 'popup', self._on_new_page),
+            (page.context, 'page', self._on_new_page),
+        ]
+
+    @classmethod
+    async def attach(cls, page):
+        """Creates a tracker and subscribes it to the page's events."""
+        tracker = cls(page)
+        for emitter, event, handler in tracker._listeners:
+            emitter.on(event, handler)
+        try:
+            await page.expose_binding(MUTATION_BINDING, lambda source: tracker._on_dom_mutation())
+            await page.add_init_script(MUTATION_OBSERVER_JS)
+            await page.evaluate(MUTATION_OBSERVER_JS)
+        except Exception as e:
+            logger.debug(f"DOM mutation tracking unavailable: {e}")
+        return tracker
+
+    def detach(self):
+        """Unsubscribes the tracker from the page's events."""
+        for emitter, event, handler in self._listeners:
+            try:
+                emitter.remove_listener(event, handler)
+            except Exception:
+                pass
+
+    def touch(self):
+        """Records activity now and wakes up any waiter."""
+        self.last_activity = self.loop.time()
+        self.activity.set()
+
+    def _on_dom_mutation(self):
+        self.dom_version += 1
+        self.touch()
+
+    def _on_navigated(self, frame):
+        if frame == self.page.main_frame:
+            self.dom_version += 1
+        self.touch()
+
+    def _on_request(self, request):
+        self.inflight.add(request)
+        self.touch()
+
+    def _on_request_done(self, request):
+        self.inflight.discard(request)
+        self.touch()
+
+    def _on_new_page(self, page):
+        # Only the activity matters here; NavigationTracker handles the new tab itself
+        self.touch()
+
+    def is_network_idle(self) -> bool:
+        """Checks whether at most MAX_IDLE_INFLIGHT requests are still running."""
+        return len(self.inflight) <= MAX_IDLE_INFLIGHT
+
+    async def wait_for_quiet(self, quiet_ms: int = QUIET_WINDOW_MS, max_wait_ms: int = REDIRECT_WAIT_CAP_MS) -> float:
+        """Waits until the page has been quiet for quiet_ms, or max_wait_ms has passed. Returns seconds waited."""
+        start = self.loop.time()
+        deadline = start + max_wait_ms / 1000
+        quiet = quiet_ms / 1000
+        # Start counting quiet time from the moment we began waiting
+        self.last_activity = max(self.last_activity, start)
+        while True:
+            now = self.loop.time()
+            if now >= deadline:
+                logger.debug(f"Page did not settle within {max_wait_ms} ms.")
+                break
+            quiet_until = self.last_activity + quiet
+            if now >= quiet_until and self.is_network_idle():
+                break
+            self.activity.clear()
+            timeout = min(deadline, max(quiet_until, now + quiet / 4)) - now
+            try:
+                await asyncio.wait_for(self.activity.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.loop.time() - start
@@ -0,0 +1,198 @@
+import logging
+import re
+import sqlite3
+import time
+from urllib.parse import urlsplit
+
+from se_crawler.crawl_state import normalize_url
+from se_crawler.metrics import metrics
+from se_crawler.network_policy import host_matches
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import h2  # noqa: F401  (httpx only speaks HTTP/2 when this is installed)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# SQLite database caching pre-flight verdicts across runs
+PREFLIGHT_CACHE_DB = 'preflight_cache.db'
+# How long verdicts are trusted, in seconds
+PREFLIGHT_DEAD_TTL = 3 * 24 * 3600
+PREFLIGHT_VIABLE_TTL = 6 * 3600
+# A refused connection is often a restart or a single port being down, so it is trusted briefly
+PREFLIGHT_REFUSED_TTL = 3600
+PREFLIGHT_TIMEOUT = 10.0
+PREFLIGHT_MAX_CONNECTIONS = 100
+PREFLIGHT_MAX_KEEPALIVE = 20
+PREFLIGHT_MAX_REDIRECTS = 10
+# Bytes of an HTML body read to recognize parking pages
+PREFLIGHT_SNIFF_BYTES = 64 * 1024
+PREFLIGHT_USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                        '(KHTML, like Gecko) Chrome/120.0 Safari/537.36')
+# Skip domains that redirect to or serve a domain-parking page
+SKIP_PARKED = True
+
+# Statuses that mean the page is gone; anything else (403, 5xx, ...) is left for the browser to judge
+DEAD_STATUSES = {404, 410}
+# Content types the browser would render as a page
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+# Landing hosts of domain-parking services
+PARKING_HOSTS = {
+    'sedoparking.com', 'parkingcrew.net', 'bodis.com', 'above.com', 'dan.com', 'afternic.com',
+    'hugedomains.com', 'parklogic.com', 'domainmarket.com', 'undeveloped.com',
+}
+PARKED_RE = re.compile(
+    rb'this domain (?:name )?(?:is|may be) for sale|buy this domain|domain is parked|parked free|'
+    rb'parkingcrew|sedoparking|bodis\.com',
+    re.IGNORECASE
+)
+# Resolver messages meaning the name does not exist, as opposed to a temporary resolver failure
+DNS_FAILURE_MESSAGES = ('Name or service not known', 'nodename nor servname', 'No address associated with hostname',
+                        'getaddrinfo failed')
+# Verdicts that apply to every URL of the host
+HOST_LEVEL_REASONS = {'dns', 'parked'}
+
+preflight_total = metrics.counter('crawler_preflight_total', "Pre-flight checks by verdict")
+
+class PreflightCache:
+    """Pre-flight verdicts in SQLite, per host for host-wide failures and per URL otherwise."""
+
+    def __init__(self, db_path: str = PREFLIGHT_CACHE_DB):
+        self.conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS verdicts ('
+            'key TEXT PRIMARY KEY, viable INTEGER, reason TEXT, status INTEGER, final_url TEXT, expires REAL)'
+        )
+
+    def get(self, url: str):
+        """Returns the cached verdict for the URL or its host, or None."""
+        now = time.time()
+        for key in (f"host:{urlsplit(url).hostname or ''}", f"url:{url}"):
+            row = self.conn.execute(
+                'SELECT viable, reason, status, final_url FROM verdicts WHERE key = ? AND expires > ?', (key, now)
+            ).fetchone()
+            if row is not None:
+                return {"viable": bool(row[0]), "reason": row[1], "status": row[2], "final_url": row[3], "cached": True}
+        return None
+
+    def put(self, url: str, verdict: dict):
+        if verdict["reason"] in HOST_LEVEL_REASONS:
+            key = f"host:{urlsplit(url).hostname or ''}"
+        else:
+            key = f"url:{url}"
+        if verdict["viable"]:
+            ttl = PREFLIGHT_VIABLE_TTL
+        elif verdict["reason"] == 'connection_refused':
+            ttl = PREFLIGHT_REFUSED_TTL
+        else:
+            ttl = PREFLIGHT_DEAD_TTL
+        self.conn.execute(
+            'INSERT OR REPLACE INTO verdicts (key, viable, reason, status, final_url, expires) VALUES (?, ?, ?, ?, ?, ?)',
+            (key, int(verdict["viable"]), verdict["reason"], verdict["status"], verdict["final_url"], time.time() + ttl)
+        )
+
+    def close(self):
+        self.conn.close()
+
+def _verdict(viable: bool, reason: str = None, status: int = None, final_url: str = None) -> dict:
+    return {"viable": viable, "reason": reason, "status": status, "final_url": final_url, "cached": False}
+
+def classify_transport_error(error) -> str:
+    """Maps an httpx transport error to a failure reason, or None if the browser should still try."""
+    if isinstance(error, httpx.ConnectTimeout):
+        return None  # Slow to connect is not dead; the browser's longer timeout decides
+    if isinstance(error, httpx.TooManyRedirects):
+        return 'redirect_loop'
+    if isinstance(error, httpx.ConnectError):
+        message = str(error)
+        if any(text in message for text in DNS_FAILURE_MESSAGES):
+            return 'dns'
+        if 'Connection refused' in message:
+            return 'connection_refused'
+    return None
+
+class Preflight:
+    """Cheap HTTP check of a URL before a browser page is spent on it.
+
+    Follows redirects on a pooled keep-alive client (HTTP/2 when available) and rejects URLs whose host
+    does not resolve or refuses connections, that are gone (404/410), that are not HTML, or that land on
+    a parking page. Anything inconclusive is passed on to the browser.
+    """
+
+    def __init__(self, cache: PreflightCache = None, skip_parked: bool = SKIP_PARKED):
+        self.cache = cache
+        self.skip_parked = skip_parked
+        self.client = None
+        if httpx is None:
+            logger.warning("httpx is not installed; pre-flight checks are disabled.")
+            return
+        self.client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            follow_redirects=True,
+            max_redirects=PREFLIGHT_MAX_REDIRECTS,
+            timeout=PREFLIGHT_TIMEOUT,
+            limits=httpx.Limits(max_connections=PREFLIGHT_MAX_CONNECTIONS,
+                                max_keepalive_connections=PREFLIGHT_MAX_KEEPALIVE),
+            headers={'User-Agent': PREFLIGHT_USER_AGENT, 'Accept': 'text/html,application/xhtml+xml,*/*;q=0.8'},
+        )
+
+    async def check(self, url: str) -> dict:
+        """Returns the verdict for a URL: viable, reason, status and final_url after redirects."""
+        url = normalize_url(url)
+        if self.client is None:
+            return _verdict(True, 'unchecked')
+        if self.cache is not None:
+            cached = self.cache.get(url)
+            if cached is not None:
+                preflight_total.inc(verdict=cached["reason"] or 'viable', cached='yes')
+                return cached
+
+        verdict = await self._fetch(url)
+        preflight_total.inc(verdict=verdict["reason"] or 'viable', cached='no')
+        if self.cache is not None and verdict["reason"] != 'inconclusive':
+            self.cache.put(url, verdict)
+        return verdict
+
+    async def _fetch(self, url: str) -> dict:
+        try:
+            async with self.client.stream('GET', url) as response:
+                final_url = str(response.url)
+                if response.status_code in DEAD_STATUSES:
+                    return _verdict(False, f"http_{response.status_code}", response.status_code, final_url)
+                if self.skip_parked and host_matches(response.url.host, PARKING_HOSTS):
+                    return _verdict(False, 'parked', response.status_code, final_url)
+                content_type = response.headers.get('content-type', '').lower()
+                if content_type and not content_type.startswith(HTML_CONTENT_TYPES):
+                    return _verdict(False, 'not_html', response.status_code, final_url)
+                if self.skip_parked and response.status_code < 400:
+                    body = b''
+                    async for chunk in response.aiter_bytes():
+                        body += chunk
+                        if len(body) >= PREFLIGHT_SNIFF_BYTES:
+                            break
+                    if PARKED_RE.search(body[:PREFLIGHT_SNIFF_BYTES]):
+                        return _verdict(False, 'parked', response.status_code, final_url)
+                return _verdict(True, None, response.status_code, final_url)
+        except httpx.HTTPError as e:
+            reason = classify_transport_error(e)
+            if reason is None:
+                logger.debug(f"Inconclusive pre-flight for {url}: {e!r}")
+                return _verdict(True, 'inconclusive')
+            return _verdict(False, reason)
+        except Exception as e:
+            logger.debug(f"Pre-flight failed for {url}: {e!r}")
+            return _verdict(True, 'inconclusive')
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+        if self.cache is not None:
+            self.cache.close()
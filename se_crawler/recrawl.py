@@ -0,0 +1,69 @@
+import logging
+from urllib.parse import urldefrag
+
+logger = logging.getLogger(__name__)
+
+# Revisit intervals in seconds: halved when a site changed, stretched when it did not
+RECRAWL_INITIAL_INTERVAL = 24 * 3600
+RECRAWL_MIN_INTERVAL = 6 * 3600
+RECRAWL_MAX_INTERVAL = 14 * 24 * 3600
+RECRAWL_BACKOFF = 1.5
+# Only the top levels of the DOM count towards its structure hash (taken by the change recorder's
+# snapshot), so rotating ad creatives do not
+STRUCTURE_MAX_DEPTH = 6
+# Script sets at least this similar (Jaccard) count as unchanged
+MIN_SCRIPT_SIMILARITY = 0.9
+
+def redirect_chain(response, final_url: str):
+    """Returns the URLs from the first request of a navigation to the page's final URL."""
+    chain = []
+    request = response.request if response is not None else None
+    while request is not None:
+        chain.append(urldefrag(request.url)[0])
+        request = request.redirected_from
+    chain.reverse()
+    final_url = urldefrag(final_url)[0]
+    if not chain or chain[-1] != final_url:
+        chain.append(final_url)
+    return chain
+
+def take_baseline(snapshot: dict, response, resources: dict) -> dict:
+    """Builds the compact baseline of a freshly loaded page: structure hash, script fingerprints and URL chain.
+
+    snapshot is the recorder's first snapshot, taken with STRUCTURE_MAX_DEPTH, and resources its records as
+    returned by split_records.
+    """
+    scripts = sorted({
+        # Shortened: the baseline only needs to tell sets apart
+        record['fingerprint']["hash"][:16]
+        for record in resources["new_scripts"] if 'fingerprint' in record
+    })
+    return {
+        "structure": snapshot.get("structure"),
+        "scripts": scripts,
+        "chain": redirect_chain(response, snapshot["url"]),
+    }
+
+def script_similarity(old, new) -> float:
+    old, new = set(old), set(new)
+    if not old and not new:
+        return 1.0
+    return len(old & new) / len(old | new)
+
+def diverged(old: dict, new: dict):
+    """Returns what differs between two baselines, or None if the site looks unchanged."""
+    if old.get("chain") != new.get("chain"):
+        return 'redirect_chain'
+    if script_similarity(old.get("scripts", ()), new.get("scripts", ())) < MIN_SCRIPT_SIMILARITY:
+        return 'scripts'
+    if old.get("structure") != new.get("structure"):
+        return 'structure'
+    return None
+
+def next_interval(interval: float, changed: bool) -> float:
+    """Adapts a site's revisit interval to how often it changes."""
+    if interval is None:
+        return RECRAWL_INITIAL_INTERVAL
+    if changed:
+        return max(RECRAWL_MIN_INTERVAL, interval / 2)
+    return min(RECRAWL_MAX_INTERVAL, interval * RECRAWL_BACKOFF)
@@ -0,0 +1,166 @@
+import gzip
+import json
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+from se_crawler.crawl_state import normalize_url
+
+logger = logging.getLogger(__name__)
+error_logger = logging.getLogger('error_logger')
+
+# Directory holding the result segments and their index
+RESULTS_DIR = 'results'
+RESULTS_INDEX = 'index.db'
+# Start a new segment file once the current one grows past this size
+SEGMENT_MAX_BYTES = 256 * 1024 * 1024
+# Flush and fsync at least this often, and after this many records
+SYNC_INTERVAL = 2.0
+SYNC_EVERY_RECORDS = 500
+
+class SiteLog:
+    """List-like handle that streams every appended change record of one site to the sink."""
+
+    def __init__(self, sink, url: str, attempt: int = None):
+        self.sink = sink
+        self.url = url
+        self.attempt = attempt
+        self.count = 0
+
+    def append(self, record: dict):
+        if self.attempt is not None:
+            record = {"attempt": self.attempt, **record}
+        self.sink.submit(self.url, record)
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+class ResultsSink:
+    """Append-only store of change records in rotating gzip JSON Lines segments with a URL index.
+
+    Every record is written as its own gzip member, so a segment is a valid .jsonl.gz file
+    and any record can be read back from its offset without decompressing the rest.
+    """
+
+    def __init__(self, results_dir: str = RESULTS_DIR, segment_max_bytes: int = SEGMENT_MAX_BYTES,
+                 sync_interval: float = SYNC_INTERVAL):
+        self.results_dir = results_dir
+        self.segment_max_bytes = segment_max_bytes
+        self.sync_interval = sync_interval
+        os.makedirs(results_dir, exist_ok=True)
+        self.queue = queue.Queue()
+        self.segment_name = None
+        self.segment = None
+        self.segment_number = 0
+        self.pending_index = []
+        self.written = 0
+        self.thread = threading.Thread(target=self._run, name='results-sink', daemon=True)
+        self.thread.start()
+
+    def open_site(self, url: str, attempt: int = None) -> SiteLog:
+        """Returns a handle that streams the site's change records as they are appended.
+
+        The attempt number tells the records of a resumed site apart from the partial ones of an earlier run.
+        """
+        return SiteLog(self, url, attempt)
+
+    def submit(self, url: str, record: dict):
+        """Queues a record for writing without blocking the caller."""
+        self.queue.put((url, record))
+
+    def close(self):
+        """Writes every queued record, syncs and closes the current segment."""
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        self.index = sqlite3.connect(os.path.join(self.results_dir, RESULTS_INDEX), timeout=30)
+        self.index.execute('PRAGMA journal_mode=WAL')
+        self.index.execute(
+            'CREATE TABLE IF NOT EXISTS records ('
+            'url TEXT, segment TEXT, offset INTEGER, length INTEGER, written_at REAL)'
+        )
+        self.index.execute('CREATE INDEX IF NOT EXISTS records_url ON records (url)')
+        self.index.commit()
+        last_sync = time.monotonic()
+        try:
+            while True:
+                try:
+                    item = self.queue.get(timeout=self.sync_interval)
+                except queue.Empty:
+                    item = False
+                if item is None:
+                    break
+                if item:
+                    try:
+                        self._write(*item)
+                    except Exception as e:
+                        error_logger.error(f"Failed to write result for {item[0]}: {e}")
+                if self.pending_index and (len(self.pending_index) >= SYNC_EVERY_RECORDS
+                                           or time.monotonic() - last_sync >= self.sync_interval):
+                    self._sync()
+                    last_sync = time.monotonic()
+        finally:
+            self._sync()
+            if self.segment is not None:
+                self.segment.close()
+            self.index.close()
+
+    def _open_segment(self):
+        if self.segment is not None:
+            self._sync()
+            self.segment.close()
+        self.segment_number += 1
+        self.segment_name = f"segment-{time.strftime('%Y%m%d_%H%M%S')}-{os.getpid()}-{self.segment_number:06d}.jsonl.gz"
+        self.segment = open(os.path.join(self.results_dir, self.segment_name), 'ab')
+
+    def _write(self, url: str, record: dict):
+        if self.segment is None or self.segment.tell() >= self.segment_max_bytes:
+            self._open_segment()
+        line = json.dumps({"site": url, **record}) + '\n'
+        member = gzip.compress(line.encode('utf-8'))
+        offset = self.segment.tell()
+        self.segment.write(member)
+        self.pending_index.append((normalize_url(url), self.segment_name, offset, len(member), time.time()))
+        self.written += 1
+
+    def _sync(self):
+        """Makes the written records durable, then publishes them in the index."""
+        if self.segment is not None:
+            self.segment.flush()
+            os.fsync(self.segment.fileno())
+        if self.pending_index:
+            with self.index:
+                self.index.executemany(
+                    'INSERT INTO records (url, segment, offset, length, written_at) VALUES (?, ?, ?, ?, ?)',
+                    self.pending_index
+                )
+            self.pending_index = []
+
+def read_results(url: str, results_dir: str = RESULTS_DIR):
+    """Yields the stored change records of a URL in the order they were written."""
+    index = sqlite3.connect(os.path.join(results_dir, RESULTS_INDEX), timeout=30)
+    try:
+        rows = index.execute(
+            'SELECT segment, offset, length FROM records WHERE url = ? ORDER BY written_at, rowid',
+            (normalize_url(url),)
+        ).fetchall()
+    finally:
+        index.close()
+    for segment, offset, length in rows:
+        with open(os.path.join(results_dir, segment), 'rb') as f:
+            f.seek(offset)
+            yield json.loads(gzip.decompress(f.read(length)))
+
+if __name__ == "__main__":
+    # Print the stored records of a URL: python -m se_crawler.results_sink <url>
+    if len(sys.argv) != 2:
+        print("Usage: python -m se_crawler.results_sink <url>")
+        sys.exit(1)
+    for record in read_results(sys.argv[1]):
+        print(json.dumps(record, indent=4))
@@ -0,0 +1,203 @@
+import asyncio
+import hashlib
+import io
+import itertools
+import json
+import logging
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Output format when Pillow is available: 'webp', 'jpeg' or 'png'
+SCREENSHOT_FORMAT = 'webp'
+SCREENSHOT_QUALITY = 80
+# Screenshots wider than this are downscaled before encoding
+SCREENSHOT_MAX_WIDTH = 1280
+# 'full_page' or 'viewport'
+SCREENSHOT_MODE = 'full_page'
+# Optional JSON file mapping hosts to a screenshot mode, e.g. {"example.com": "viewport"}
+SCREENSHOT_MODES_FILE = 'screenshot_modes.json'
+# Frames whose perceptual hashes differ in at most this many bits count as unchanged
+PHASH_THRESHOLD = 0
+SCREENSHOT_TIMEOUT_MS = 60000
+# 'thread' or 'process'
+SCREENSHOT_ENCODER = 'thread'
+SCREENSHOT_ENCODER_WORKERS = 2
+
+MANIFEST_FILE = 'screenshots.jsonl'
+
+def dhash(image, size: int = 8) -> int:
+    """Computes a 64-bit difference hash of an image."""
+    pixels = list(image.convert('L').resize((size + 1, size)).getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+def color_signature(image, size: int = 8) -> str:
+    """Summarizes the colors of an image coarsely, to catch changes a difference hash is blind to."""
+    thumbnail = image.convert('RGB').resize((size, size))
+    return bytes(channel >> 4 for pixel in thumbnail.getdata() for channel in pixel).hex()
+
+def encode_screenshot(png_bytes: bytes, image_format: str = SCREENSHOT_FORMAT, quality: int = SCREENSHOT_QUALITY,
+                      max_width: int = SCREENSHOT_MAX_WIDTH):
+    """Downscales and re-encodes a PNG screenshot. Returns (data, extension, perceptual hash, color signature)."""
+    if Image is None:
+        # Without Pillow the PNG is kept as is and only exact duplicates are detected
+        return png_bytes, 'png', int(hashlib.sha256(png_bytes).hexdigest()[:16], 16), ''
+
+    image = Image.open(io.BytesIO(png_bytes))
+    image.load()
+    phash = dhash(image)
+    colors = color_signature(image)
+    if max_width and image.width > max_width:
+        height = max(1, round(image.height * max_width / image.width))
+        image = image.resize((max_width, height), Image.LANCZOS)
+
+    output = io.BytesIO()
+    if image_format == 'jpeg':
+        image.convert('RGB').save(output, 'JPEG', quality=quality, optimize=True)
+        extension = 'jpg'
+    elif image_format == 'webp':
+        image.save(output, 'WEBP', quality=quality, method=4)
+        extension = 'webp'
+    else:
+        image.save(output, 'PNG', optimize=True)
+        extension = 'png'
+    return output.getvalue(), extension, phash, colors
+
+def write_blob(blobs_dir: str, data: bytes, extension: str) -> str:
+    """Writes data under its SHA-256 digest, once. Returns the blob path."""
+    digest = hashlib.sha256(data).hexdigest()
+    directory = os.path.join(blobs_dir, digest[:2])
+    path = os.path.join(directory, f"{digest}.{extension}")
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return path
+
+def link_into(site_dir: str, blob_path: str, name: str):
+    """Makes the blob visible in the site directory under a readable name, if the filesystem allows it."""
+    target = os.path.join(site_dir, name)
+    try:
+        if not os.path.exists(target):
+            os.link(blob_path, target)
+    except OSError:
+        pass
+    return target
+
+def append_manifest(site_dir: str, entry: dict):
+    """Appends an entry to the site's screenshot manifest."""
+    with open(os.path.join(site_dir, MANIFEST_FILE), 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+
+def load_site_modes(filename: str = SCREENSHOT_MODES_FILE) -> dict:
+    """Loads the per-host screenshot modes, if the file exists."""
+    if not os.path.exists(filename):
+        return {}
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+class ScreenshotStore:
+    """Content-addressed screenshot storage with encoding off the event loop."""
+
+    def __init__(self, base_dir: str, image_format: str = SCREENSHOT_FORMAT, mode: str = SCREENSHOT_MODE,
+                 site_modes: dict = None, encoder: str = SCREENSHOT_ENCODER, workers: int = SCREENSHOT_ENCODER_WORKERS,
+                 limiter=None, differ=None):
+        self.base_dir = base_dir
+        self.blobs_dir = os.path.join(base_dir, 'blobs')
+        self.image_format = image_format
+        self.mode = mode
+        self.site_modes = load_site_modes() if site_modes is None else site_modes
+        executor_class = ProcessPoolExecutor if encoder == 'process' else ThreadPoolExecutor
+        self.executor = executor_class(max_workers=workers)
+        # Optional async context manager bounding how many screenshots are taken and encoded at once
+        self.limiter = limiter
+        # Optional VisualDiffer comparing each site's stored frames
+        self.differ = differ
+        self.saved = 0
+        self.skipped = 0
+
+    def for_site(self, url: str, site_dir: str):
+        """Returns the screenshot session for a site."""
+        host = (urlsplit(url).hostname or '').lower()
+        visual = self.differ.for_site(site_dir) if self.differ is not None else None
+        return SiteScreenshots(self, site_dir, self.site_modes.get(host, self.mode), visual)
+
+    async def run(self, func, *args):
+        """Runs a blocking function on the encoder pool."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def close(self):
+        """Waits for pending encodes and shuts the pool down."""
+        self.executor.shutdown(wait=True)
+
+class SiteScreenshots:
+    """Screenshots of one site, skipping frames that look the same as the previous one of the same page.
+
+    Each page (the site's own, then every tab a click opens) is a separate chain, numbered in the order the
+    pages are first captured, so tab frames are never compared with the site's.
+    """
+
+    def __init__(self, store: ScreenshotStore, site_dir: str, mode: str, visual=None):
+        self.store = store
+        self.site_dir = site_dir
+        self.mode = mode
+        self.visual = visual
+        # Chain number per page, without keeping closed tabs alive
+        self.chains = weakref.WeakKeyDictionary()
+        self.chain_numbers = itertools.count()
+        # (perceptual hash, color signature) of the last stored frame per chain
+        self.last = {}
+
+    async def capture(self, page, name: str):
+        """Captures the page into memory and stores it unless unchanged. Returns the stored path or None."""
+        if self.store.limiter is None:
+            data, extension, phash, colors = await self._grab(page)
+        else:
+            async with self.store.limiter:
+                data, extension, phash, colors = await self._grab(page)
+
+        if page not in self.chains:
+            self.chains[page] = next(self.chain_numbers)
+        chain = self.chains[page]
+        last_hash, last_colors = self.last.get(chain, (None, None))
+        if last_hash is not None and colors == last_colors and bin(last_hash ^ phash).count('1') <= PHASH_THRESHOLD:
+            self.store.skipped += 1
+            await self.store.run(append_manifest, self.site_dir, {"name": name, "phash": f"{phash:016x}", "skipped": True})
+            return None
+
+        self.last[chain] = (phash, colors)
+        blob_path = await self.store.run(write_blob, self.store.blobs_dir, data, extension)
+        path = await self.store.run(link_into, self.site_dir, blob_path, f"{name}.{extension}")
+        await self.store.run(append_manifest, self.site_dir, {"name": name, "blob": blob_path, "phash": f"{phash:016x}",
+                                                              "url": page.url, "mode": self.mode})
+        self.store.saved += 1
+        if self.visual is not None:
+            self.visual.add(name, blob_path, chain)
+        return path
+
+    async def visual_changes(self):
+        """Returns the visual diffs of the frames stored so far, or None if diffing is disabled."""
+        if self.visual is None:
+            return None
+        return await self.visual.results()
+
+    async def _grab(self, page):
+        # The raw frame and its encoding are the memory-heavy part, so this is what the limiter bounds
+        png_bytes = await page.screenshot(full_page=self.mode == 'full_page', timeout=SCREENSHOT_TIMEOUT_MS)
+        return await self.store.run(encode_screenshot, png_bytes, self.store.image_format)
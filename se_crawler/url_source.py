@@ -0,0 +1,81 @@
+import asyncio
+import gzip
+import logging
+import sys
+
+from se_crawler.crawl_state import normalize_url
+
+logger = logging.getLogger(__name__)
+
+def open_source(source: str):
+    """Opens a URL source: a text file, a gzip file (.gz) or stdin ('-')."""
+    if source == '-':
+        return sys.stdin
+    if source.endswith('.gz'):
+        return gzip.open(source, 'rt', encoding='utf-8', errors='replace')
+    return open(source, 'r', encoding='utf-8', errors='replace')
+
+def iter_urls(source: str):
+    """Yields URLs one at a time from the source, skipping blank lines, comments and malformed entries."""
+    file = open_source(source)
+    try:
+        for line in file:
+            url = line.strip()
+            if not url or url.startswith('#'):
+                continue
+            if any(c.isspace() for c in url):
+                logger.warning(f"Skipping malformed URL entry: {url[:100]}")
+                continue
+            yield url
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+def dedup_urls(urls, state, resume: bool = False, recrawl: bool = False, retry_failed: bool = False):
+    """Returns a generator of URLs whose normalized form this run has not queued yet, nor monitored according
+    to the crawl state. Each URL it yields is journaled as queued.
+
+    Duplicates are found through the journal rather than in memory, so arbitrarily long lists dedup in
+    constant memory. When resuming, the URLs a previous run left in flight come first, and every other URL
+    already in the journal (finished or failed) is skipped. With recrawl, monitored sites whose revisit is
+    due pass too. With retry_failed, URLs this run already failed are queued again. Only the state's own intake connection is used while generating, so the generator can run
+    in a reader thread.
+    """
+    in_flight = []
+    due = set()
+    if resume:
+        in_flight = state.in_flight_urls()
+        logger.info(f"Resuming {len(in_flight)} in-flight URLs from the previous run.")
+    if recrawl:
+        due = {normalize_url(url) for url in state.due_urls()}
+    monitored = state.monitored
+
+    def generate():
+        for url in in_flight:
+            if state.claim(url):
+                yield url
+        for url in urls:
+            key = normalize_url(url)
+            if not key:
+                logger.warning(f"Skipping malformed URL entry: {url[:100]}")
+                continue
+            if key in monitored and key not in due:
+                continue
+            if state.claim(url, requeue=not resume or key in due, retry_failed=retry_failed):
+                yield url
+
+    return generate()
+
+async def feed_queue(urls, queue: asyncio.Queue, num_workers: int):
+    """Moves URLs from a (possibly blocking) iterable into a bounded queue, then signals the workers to stop."""
+    iterator = iter(urls)
+    try:
+        while True:
+            # Read in a thread so slow sources like stdin never block the event loop
+            url = await asyncio.to_thread(next, iterator, None)
+            if url is None:
+                break
+            await queue.put(url)
+    finally:
+        for _ in range(num_workers):
+            await queue.put(None)
@@ -0,0 +1,227 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from se_crawler.metrics import metrics
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+error_logger = logging.getLogger('error_logger')
+
+# Frames are compared at this width; regions are reported in pixels of the stored screenshots
+VISUAL_DIFF_WIDTH = 640
+# Rows compared at most, at the working width, so very long pages stay cheap
+VISUAL_DIFF_MAX_HEIGHT = 8192
+# A pixel counts as changed when a channel moved by more than this (0-255)
+PIXEL_THRESHOLD = 32
+# Changed pixels are grouped into square cells of this size (working pixels) before finding regions
+CELL_SIZE = 16
+# Cells with fewer changed pixels than this share are treated as noise (anti-aliasing, carets)
+CELL_MIN_RATIO = 0.05
+MAX_REGIONS = 20
+# Diffs with at least this share of the frame changed are flagged for review
+VISUAL_FLAG_RATIO = 0.01
+VISUAL_DIFF_WORKERS = 2
+# Pool workers are not forked: by the time the first diff runs, the crawler has threads (SQLite writers,
+# asyncio.to_thread) whose locks a forked child could inherit mid-operation
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+# How long the end of a site waits for its diffs to finish
+VISUAL_DIFF_WAIT_CAP_S = 30
+# Per-site file naming the frame the next run is compared against
+VISUAL_BASELINE_FILE = 'visual_baseline.json'
+
+visual_diffs = metrics.counter('crawler_visual_diffs_total', "Screenshot comparisons by outcome")
+
+def load_frame(path: str, width: int = VISUAL_DIFF_WIDTH):
+    """Decodes a screenshot to an RGB array at the working width. Returns (array, scale to stored pixels)."""
+    with Image.open(path) as image:
+        image = image.convert('RGB')
+        scale = image.width / width
+        height = max(1, min(round(image.height / scale), VISUAL_DIFF_MAX_HEIGHT))
+        # Crop before resizing so a tall page is never decoded at full size twice
+        crop = image.crop((0, 0, image.width, min(image.height, round(height * scale))))
+        return np.asarray(crop.resize((width, height), Image.BILINEAR), dtype=np.int16), scale
+
+def label_cells(active):
+    """Labels the 8-connected components of a boolean grid. Inactive cells get the label active.size."""
+    none = active.size
+    labels = np.where(active, np.arange(active.size).reshape(active.shape), none)
+    while True:
+        padded = np.pad(labels, 1, constant_values=none)
+        rows, cols = active.shape
+        neighbours = [padded[1 + dy:1 + dy + rows, 1 + dx:1 + dx + cols] for dy in (-1, 0, 1) for dx in (-1, 0, 1)]
+        merged = np.where(active, np.minimum.reduce(neighbours), none)
+        # Pointer jumping: follow each label to its own label so long components converge quickly
+        flat = np.append(merged.ravel(), none)
+        merged = flat[merged]
+        if np.array_equal(merged, labels):
+            return labels
+        labels = merged
+
+def changed_regions(mask, cell: int = CELL_SIZE):
+    """Groups a changed-pixel mask into bounding boxes of connected changed cells, largest first.
+
+    Returns (y0, x0, y1, x1, changed pixels) tuples in mask coordinates.
+    """
+    rows, cols = -(-mask.shape[0] // cell), -(-mask.shape[1] // cell)
+    padded = np.zeros((rows * cell, cols * cell), dtype=bool)
+    padded[:mask.shape[0], :mask.shape[1]] = mask
+    counts = padded.reshape(rows, cell, cols, cell).sum(axis=(1, 3))
+    active = counts >= CELL_MIN_RATIO * cell * cell
+    if not active.any():
+        return []
+
+    labels = label_cells(active)
+    ys, xs = np.nonzero(active)
+    components, index = np.unique(labels[ys, xs], return_inverse=True)
+    n = len(components)
+    y0 = np.full(n, rows)
+    x0 = np.full(n, cols)
+    y1 = np.zeros(n, dtype=int)
+    x1 = np.zeros(n, dtype=int)
+    np.minimum.at(y0, index, ys)
+    np.minimum.at(x0, index, xs)
+    np.maximum.at(y1, index, ys)
+    np.maximum.at(x1, index, xs)
+    changed = np.bincount(index, weights=counts[ys, xs])
+
+    regions = []
+    for i in range(n):
+        box = (y0[i] * cell, x0[i] * cell, min((y1[i] + 1) * cell, mask.shape[0]), min((x1[i] + 1) * cell, mask.shape[1]))
+        regions.append(tuple(int(v) for v in box) + (int(changed[i]),))
+    regions.sort(key=lambda r: (r[2] - r[0]) * (r[3] - r[1]), reverse=True)
+    return regions
+
+def diff_frames(before_path: str, after_path: str) -> dict:
+    """Compares two stored screenshots: share of changed pixels and bounding boxes of the changed regions.
+
+    Rows only one of the frames has (the page grew or shrank) count as changed.
+    """
+    before, scale = load_frame(before_path)
+    after, _ = load_frame(after_path)
+    height = max(before.shape[0], after.shape[0])
+    common = min(before.shape[0], after.shape[0])
+    mask = np.ones((height, before.shape[1]), dtype=bool)
+    mask[:common] = (np.abs(before[:common] - after[:common]) > PIXEL_THRESHOLD).any(axis=2)
+
+    regions = changed_regions(mask)
+    ratio = float(mask.mean())
+    return {
+        "ratio": round(ratio, 5),
+        "flagged": ratio >= VISUAL_FLAG_RATIO,
+        "regions": [
+            {
+                "x": round(x0 * scale), "y": round(y0 * scale),
+                "width": round((x1 - x0) * scale), "height": round((y1 - y0) * scale),
+                "ratio": round(changed / ((y1 - y0) * (x1 - x0)), 3),
+            }
+            for y0, x0, y1, x1, changed in regions[:MAX_REGIONS]
+        ],
+        "regions_total": len(regions),
+    }
+
+class VisualDiffer:
+    """Compares screenshots in a process pool, so decoding and diffing never hold up the crawl loop."""
+
+    def __init__(self, workers: int = VISUAL_DIFF_WORKERS):
+        self.enabled = np is not None and Image is not None
+        self.executor = None
+        if not self.enabled:
+            logger.warning("NumPy or Pillow is not installed; visual diffing is disabled.")
+            return
+        # Worker processes are only started by the first diff
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(POOL_START_METHOD))
+
+    def diff(self, before_path: str, after_path: str):
+        """Schedules a comparison and returns its future."""
+        return asyncio.get_running_loop().run_in_executor(self.executor, diff_frames, before_path, after_path)
+
+    def for_site(self, site_dir: str):
+        """Returns the diff session for a site, or None if diffing is disabled."""
+        return SiteVisualDiff(self, site_dir) if self.enabled else None
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+class SiteVisualDiff:
+    """Diffs each stored frame of a site against the one before it on the same page, and the site page's first
+    frame against the last run's.
+    """
+
+    def __init__(self, differ: VisualDiffer, site_dir: str):
+        self.differ = differ
+        self.site_dir = site_dir
+        self.first = None
+        # Last frame per chain; chain 0 is the site's own page, others are tabs opened by clicks
+        self.previous = {}
+        self.pending = []
+
+    def add(self, name: str, blob_path: str, chain: int = 0):
+        """Schedules the diff of a newly stored frame against the previous one of its chain."""
+        frame = (name, blob_path)
+        if self.first is None and chain == 0:
+            self.first = frame
+        if chain in self.previous:
+            self._schedule(self.previous[chain], frame)
+        self.previous[chain] = frame
+
+    def _schedule(self, before, after):
+        if before[1] == after[1]:
+            # Blobs are named by content hash, so the frames are identical
+            visual_diffs.inc(outcome='identical')
+            return
+        future = self.differ.diff(before[1], after[1])
+        self.pending.append((before[0], after[0], future))
+
+    async def results(self, max_wait_s: float = VISUAL_DIFF_WAIT_CAP_S):
+        """Waits for the site's diffs, then returns them and stores this run's baseline frame."""
+        baseline_file = os.path.join(self.site_dir, VISUAL_BASELINE_FILE)
+        if self.first is not None:
+            baseline = await asyncio.to_thread(_read_baseline, baseline_file)
+            if baseline is not None and os.path.exists(baseline["blob"]):
+                self._schedule((f"baseline:{baseline['name']}", baseline["blob"]), self.first)
+            await asyncio.to_thread(_write_baseline, baseline_file, {"name": self.first[0], "blob": self.first[1]})
+
+        if self.pending:
+            await asyncio.wait([future for _, _, future in self.pending], timeout=max_wait_s)
+        diffs = []
+        for before, after, future in self.pending:
+            entry = {"before": before, "after": after}
+            if not future.done():
+                future.cancel()
+                entry["error"] = 'timeout'
+                visual_diffs.inc(outcome='timeout')
+            elif future.exception() is not None:
+                error_logger.error(f"Visual diff of {after} failed: {future.exception()}")
+                entry["error"] = str(future.exception())
+                visual_diffs.inc(outcome='failed')
+            else:
+                entry.update(future.result())
+                visual_diffs.inc(outcome='flagged' if entry["flagged"] else 'changed')
+            diffs.append(entry)
+        self.pending = []
+        return diffs
+
+def _read_baseline(filename: str):
+    try:
+        with open(filename, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_baseline(filename: str, baseline: dict):
+    with open(filename, 'w') as f:
+        json.dump(baseline, f)
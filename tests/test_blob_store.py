@@ -0,0 +1,40 @@
+import asyncio
+import hashlib
+
+from se_crawler.blob_store import BlobStore, SiteCapture, SPILL_MIN_BYTES
+
+def test_blobs_are_deduplicated_and_read_back(tmp_path):
+    store = BlobStore(str(tmp_path))
+    digest, written = store.put(b'x' * 1000)
+    assert digest == hashlib.sha256(b'x' * 1000).hexdigest()
+    assert written > 0
+    assert store.put(b'x' * 1000) == (digest, 0)
+    assert store.get(digest) == b'x' * 1000
+
+def test_small_bodies_stay_inline_and_large_ones_spill(tmp_path):
+    store = BlobStore(str(tmp_path))
+    capture = SiteCapture(store, 'a.com', inline_max=100, budget=10_000)
+    record = {"html": 'h' * 50, "content": 'c' * 500, "other": 'o' * 500}
+    asyncio.run(capture.spill_record(record))
+
+    assert record["html"] == 'h' * 50
+    assert record["other"] == 'o' * 500
+    assert record["content"] == {"blob": hashlib.sha256(b'c' * 500).hexdigest(), "bytes": 500}
+    assert store.get(record["content"]["blob"]) == b'c' * 500
+    assert capture.summary()["captured_bytes"] == 550
+    assert capture.summary()["inline_bytes"] == 50
+
+def test_exhausted_budget_spills_everything_above_the_minimum(tmp_path):
+    capture = SiteCapture(BlobStore(str(tmp_path)), 'a.com', inline_max=1000, budget=1000)
+
+    async def spill_all():
+        return [await capture.spill(value) for value in
+                ('a' * 900, 'b' * 500, 'c' * SPILL_MIN_BYTES, 'd' * (SPILL_MIN_BYTES + 1), None)]
+
+    first, over_budget, small, above_minimum, none = asyncio.run(spill_all())
+    assert first == 'a' * 900
+    assert over_budget["bytes"] == 500
+    assert small == 'c' * SPILL_MIN_BYTES
+    assert above_minimum["bytes"] == SPILL_MIN_BYTES + 1
+    assert none is None
+    assert capture.inline == 900 + SPILL_MIN_BYTES
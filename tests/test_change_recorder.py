@@ -0,0 +1,102 @@
+import asyncio
+
+from se_crawler.change_recorder import ChangeRecorder, effective_origin, needs_own_snapshot, place_frame, split_records
+
+class Frame:
+    def __init__(self, url, parent=None, name=''):
+        self.url = url
+        self.parent_frame = parent
+        self.name = name
+
+MAIN = Frame('https://site.com/')
+
+def page_state():
+    return {"url": 'https://site.com/', "frames": [
+        {"path": 'iframe:nth-child(1)', "src": 'https://ads.net/a', "name": None, "crossOrigin": True},
+        {"path": 'iframe:nth-child(2)', "src": 'https://site.com/inner', "name": None, "url": 'https://site.com/inner',
+         "frames": [{"path": 'iframe', "src": 'https://ads.net/nested', "name": 'slot', "crossOrigin": True}]},
+    ]}
+
+def test_frame_origins():
+    blank = Frame('about:blank', parent=MAIN)
+    assert effective_origin(blank) == ('https', 'site.com')
+    assert not needs_own_snapshot(blank)
+    assert not needs_own_snapshot(MAIN)
+    assert needs_own_snapshot(Frame('https://ads.net/a', parent=MAIN))
+
+def test_place_frame_matches_by_src():
+    state = page_state()
+    place_frame(state, Frame('https://ads.net/a', parent=MAIN), {"url": 'https://ads.net/a', "records": []})
+    assert state["frames"][0]["url"] == 'https://ads.net/a'
+    assert len(state["frames"]) == 2
+
+def test_place_frame_matches_nested_frames_by_name_first():
+    state = page_state()
+    frame = Frame('https://ads.net/redirected', parent=MAIN, name='slot')
+    place_frame(state, frame, {"url": frame.url})
+    assert state["frames"][1]["frames"][0]["url"] == 'https://ads.net/redirected'
+    assert 'url' not in state["frames"][0]
+
+def test_place_frame_falls_back_to_origin_then_appends():
+    state = page_state()
+    place_frame(state, Frame('https://ads.net/other', parent=MAIN), {"url": 'https://ads.net/other'})
+    assert sum(1 for entry in (state["frames"][0], state["frames"][1]["frames"][0]) if 'url' in entry) == 1
+
+    place_frame(state, Frame('https://elsewhere.org/', parent=MAIN), {"url": 'https://elsewhere.org/'})
+    assert state["frames"][-1] == {"path": None, "crossOrigin": True, "url": 'https://elsewhere.org/'}
+
+def test_split_records():
+    records = [{"type": 'added'}, {"type": 'script'}, {"type": 'stylesheet'}, {"type": 'text'}]
+    groups = split_records(records)
+    assert [len(groups[key]) for key in ('dom_changes', 'new_scripts', 'new_stylesheets')] == [2, 1, 1]
+
+def test_bodies_are_ingested_once_per_page():
+    recorder = ChangeRecorder(page=None)
+    script = {"type": 'script', "hash": 'h1', "src": None, "content": 'var answer = 42;'}
+
+    async def ingest():
+        await recorder._ingest({"url": 'https://site.com/', "records": [dict(script)]})
+        # The same body sent again by a frame, and referenced without a body after a redirect
+        await recorder._ingest({"url": 'https://site.com/next', "records": [dict(script), {**script, "content": None}]})
+
+    asyncio.run(ingest())
+    first, again, reference = recorder.records
+    assert 'content' in first and 'content' not in again
+    assert again["fingerprint"] == reference["fingerprint"] == first["fingerprint"]
+    assert list(recorder.resources) == ['h1']
+
+class SlowFingerprints:
+    def __init__(self):
+        self.release = asyncio.Event()
+
+    async def fingerprint(self, kind, src, content):
+        await self.release.wait()
+        return {"hash": 'fp', "kind": kind}
+
+class SnapshotFrame(Frame):
+    async def evaluate(self, script, options):
+        return {"url": self.url, "records": [], "cookies": None, "storage": None, "frames": []}
+
+class Page:
+    url = 'https://site.com/'
+    main_frame = SnapshotFrame(url)
+    frames = [main_frame]
+
+def test_snapshot_waits_for_batches_in_flight():
+    fingerprints = SlowFingerprints()
+    recorder = ChangeRecorder(Page(), fingerprints=fingerprints)
+    script = {"type": 'script', "hash": 'h1', "src": None, "content": 'x' * 100}
+
+    async def run():
+        batch = asyncio.create_task(recorder._on_batch(None, {"url": Page.url, "records": [script]}))
+        await asyncio.sleep(0)
+        snapshot = asyncio.create_task(recorder.snapshot())
+        await asyncio.sleep(0)
+        assert not snapshot.done()
+        fingerprints.release.set()
+        await batch
+        return await snapshot
+
+    state = asyncio.run(run())
+    assert [record["fingerprint"] for record in state["records"]] == [{"hash": 'fp', "kind": 'script'}]
+    assert recorder.records == [] and not recorder.ingesting
@@ -0,0 +1,59 @@
+import asyncio
+import random
+
+from se_crawler.click_planner import ClickPlanner, score_candidate
+
+PAGE_URL = 'https://site.com/page'
+
+def candidate(**overrides):
+    values = {"key": 'a', "tag": 'a', "text": '', "href": None, "target": None, "onclick": False,
+              "fixed": False, "z_index": 0, "area_ratio": 0.0, "in_viewport": False}
+    values.update(overrides)
+    return values
+
+def test_plain_candidate_scores_zero():
+    assert score_candidate(candidate(), PAGE_URL) == 0
+
+def test_ad_like_signals_add_up():
+    overlay = candidate(fixed=True, area_ratio=0.5, target='_blank', onclick=True, href='https://ads.net/x',
+                        text='Click here to claim your prize', tag='button', in_viewport=True)
+    assert score_candidate(overlay, PAGE_URL) == 5 + 3 + 3 + 2 + 3 + 2 + 1 + 1
+
+def test_links_within_the_site():
+    assert score_candidate(candidate(href='https://site.com/page#top'), PAGE_URL) == -2
+    assert score_candidate(candidate(href='https://site.com/other'), PAGE_URL) == 0
+    assert score_candidate(candidate(href='javascript:void(0)'), PAGE_URL) == 0
+    assert score_candidate(candidate(z_index=100), PAGE_URL) == 5
+
+class FakePage:
+    url = PAGE_URL
+
+    def __init__(self, candidates):
+        self.candidates = candidates
+        self.evaluations = 0
+
+    async def evaluate(self, script, args):
+        self.evaluations += 1
+        return [dict(c) for c in self.candidates]
+
+class FakeTracker:
+    dom_version = 1
+
+def test_planner_enumerates_once_per_dom_version_and_skips_clicked():
+    page = FakePage([candidate(key='plain'), candidate(key='ad', target='_blank', fixed=True)])
+    tracker = FakeTracker()
+    planner = ClickPlanner(page, tracker, random.Random(1))
+
+    async def run():
+        first = await planner.next_target()
+        planner.clicked.add(first['key'])
+        second = await planner.next_target()
+        planner.clicked.add(second['key'])
+        assert await planner.next_target() is None
+        tracker.dom_version = 2
+        assert await planner.next_target() is None
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert [first['key'], second['key']] == ['ad', 'plain']
+    assert page.evaluations == 2
@@ -0,0 +1,68 @@
+import asyncio
+
+from se_crawler.concurrency import AdaptiveLimiter, ConcurrencyController
+
+def test_limit_is_clamped_to_floor_and_ceiling():
+    async def run():
+        limiter = AdaptiveLimiter('test', 10, 1, 4)
+        assert limiter.limit == 4
+        await limiter.decrease('memory')
+        assert limiter.limit == 2
+        await limiter.decrease('memory')
+        await limiter.decrease('memory')
+        assert limiter.limit == 1
+        await limiter.set_limit(100, 'manual')
+        assert limiter.limit == 4
+
+    asyncio.run(run())
+
+def test_increase_only_when_saturated():
+    async def run():
+        limiter = AdaptiveLimiter('test', 2, 1, 8)
+        await limiter.increase()
+        assert limiter.limit == 2
+        async with limiter:
+            async with limiter:
+                assert limiter.saturated
+                await limiter.increase()
+        assert limiter.limit == 3
+
+    asyncio.run(run())
+
+def test_lowered_limit_waits_for_holders_to_release():
+    async def run():
+        limiter = AdaptiveLimiter('test', 2, 1, 8)
+        await limiter.acquire()
+        await limiter.acquire()
+        await limiter.set_limit(1, 'memory')
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        await limiter.release()
+        await asyncio.sleep(0)
+        # One holder is still over the lowered limit
+        assert not waiter.done()
+        await limiter.release()
+        await asyncio.wait_for(waiter, 1)
+        assert limiter.in_use == 1
+
+    asyncio.run(run())
+
+def test_navigation_latency_only_lowers_the_site_budget(monkeypatch):
+    monkeypatch.setattr('se_crawler.concurrency.available_memory_ratio', lambda: None)
+    monkeypatch.setattr('se_crawler.concurrency.load_per_cpu', lambda: None)
+
+    async def run():
+        controller = ConcurrencyController(max_sites=16, max_screenshots=8)
+        sites, screenshots = controller.sites.limit, controller.screenshots.limit
+        controller.observe_navigation(60.0)
+        assert controller.pressure() == 'navigation_latency'
+        await controller.adjust()
+        assert controller.sites.limit == sites // 2
+        assert controller.screenshots.limit == screenshots
+
+        controller.loop_lag = 1.0
+        assert controller.pressure() == 'loop_lag'
+        await controller.adjust()
+        assert controller.screenshots.limit == screenshots // 2
+
+    asyncio.run(run())
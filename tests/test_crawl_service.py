@@ -0,0 +1,46 @@
+import asyncio
+import json
+
+from se_crawler.crawl_service import ControlServer, parse_urls
+
+def test_parse_urls_skips_blanks_comments_and_malformed():
+    body = b'a.com\r\n\n# comment\n  https://b.com/x  \nnot a url\n\xff.com\n'
+    assert parse_urls(body) == ['a.com', 'https://b.com/x', '\ufffd.com']
+
+def test_control_server_routes():
+    submitted = []
+
+    async def submit(urls):
+        submitted.extend(urls)
+        return len(urls) - 1
+
+    async def request(port, raw):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(raw)
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        head, _, body = response.partition(b'\r\n\r\n')
+        return int(head.split()[1]), json.loads(body)
+
+    async def run():
+        server = ControlServer(submit, lambda: {"queued": len(submitted)}, port=0)
+        await server.start()
+        port = server.server.sockets[0].getsockname()[1]
+        body = b'a.com\nb.com\n'
+        try:
+            crawl = await request(port, b'POST /crawl HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s' % (len(body), body))
+            status = await request(port, b'GET /status HTTP/1.1\r\n\r\n')
+            missing = await request(port, b'GET /nope HTTP/1.1\r\n\r\n')
+            shutdown = await request(port, b'POST /shutdown HTTP/1.1\r\n\r\n')
+            await asyncio.wait_for(server.wait_for_shutdown(), 1)
+        finally:
+            await server.stop()
+        return crawl, status, missing, shutdown
+
+    crawl, status, missing, shutdown = asyncio.run(run())
+    assert crawl == (202, {"received": 2, "queued": 1})
+    assert submitted == ['a.com', 'b.com']
+    assert status == (200, {"queued": 2})
+    assert missing[0] == 404
+    assert shutdown == (202, {"shutting_down": True})
@@ -0,0 +1,100 @@
+import sqlite3
+
+import pytest
+
+from se_crawler.crawl_state import CrawlState, normalize_url, QUEUED, NAVIGATING, DONE, FAILED
+
+@pytest.mark.parametrize('url, expected', [
+    ('example.com', 'http://example.com/'),
+    ('  HTTP://Example.COM/Path?q=1#top ', 'http://example.com/Path?q=1'),
+    ('https://example.com:443/', 'https://example.com/'),
+    ('http://example.com:8080', 'http://example.com:8080/'),
+    ('http://user:pw@example.com/', 'http://user:pw@example.com/'),
+    ('http://[::1]:8080/p', 'http://[::1]:8080/p'),
+    ('https://[2001:DB8::1]:443/', 'https://[2001:db8::1]/'),
+])
+def test_normalize_url(url, expected):
+    assert normalize_url(url) == expected
+
+@pytest.mark.parametrize('url', ['', '   ', 'http://[oops', 'http://[::1/p'])
+def test_normalize_url_rejects_blank_and_malformed(url):
+    assert normalize_url(url) == ''
+
+def test_monitored_urls_persist(tmp_path):
+    db = str(tmp_path / 'state.db')
+    state = CrawlState(db)
+    assert state.mark_monitored('Example.com')
+    assert not state.mark_monitored('http://example.com/')
+    state.close()
+
+    state = CrawlState(db)
+    assert state.is_monitored('http://EXAMPLE.com')
+    assert not state.is_monitored('other.com')
+    state.close()
+
+def test_migrate_text_file_runs_once(tmp_path):
+    legacy = tmp_path / 'monitored.txt'
+    legacy.write_text('a.com\nhttp://a.com/\n\nb.com\n')
+    state = CrawlState(str(tmp_path / 'state.db'))
+    assert state.migrate_text_file(str(legacy)) == 2
+    assert state.migrate_text_file(str(legacy)) == 0
+    assert state.is_monitored('b.com')
+    state.close()
+
+def test_claim_dedups_within_a_run(tmp_path):
+    db = str(tmp_path / 'state.db')
+    state = CrawlState(db)
+    assert state.claim('a.com')
+    assert not state.claim('http://A.com/')
+    assert not state.claim('http://[oops')
+    assert state.get_state('a.com')[0] == QUEUED
+    state.set_state('a.com', DONE)
+    state.close()
+
+    # A new run may queue it again unless it only wants URLs no run has journaled
+    state = CrawlState(db)
+    assert not state.claim('a.com', requeue=False)
+    assert state.claim('a.com')
+    assert state.get_state('a.com')[0] == QUEUED
+    state.close()
+
+def test_old_journal_gets_run_column(tmp_path):
+    db = str(tmp_path / 'state.db')
+    conn = sqlite3.connect(db)
+    conn.execute('CREATE TABLE journal (url TEXT PRIMARY KEY, original_url TEXT, state TEXT, reason TEXT, '
+                 'attempts INTEGER DEFAULT 0, updated_at REAL)')
+    conn.execute("INSERT INTO journal VALUES ('http://a.com/', 'a.com', 'done', NULL, 1, 0)")
+    conn.commit()
+    conn.close()
+
+    state = CrawlState(db)
+    assert state.claim('a.com')
+    assert not state.claim('a.com')
+    state.close()
+
+def test_journal_states_and_attempts(tmp_path):
+    state = CrawlState(str(tmp_path / 'state.db'))
+    state.set_state('a.com', QUEUED)
+    state.set_state('a.com', NAVIGATING)
+    state.set_state('a.com', NAVIGATING)
+    state.set_state('b.com', QUEUED)
+    state.set_state('c.com', DONE)
+    assert state.get_state('http://a.com/') == (NAVIGATING, None, 2)
+    assert state.in_flight_urls() == ['a.com', 'b.com']
+    state.set_state('a.com', FAILED, 'dns')
+    assert state.get_state('a.com') == (FAILED, 'dns', 2)
+    assert state.get_state('unknown.com') is None
+    state.close()
+
+def test_baselines_and_due_urls(tmp_path):
+    state = CrawlState(str(tmp_path / 'state.db'))
+    state.mark_monitored('a.com')
+    state.mark_monitored('b.com')
+    assert state.is_due('a.com')
+    state.save_baseline('a.com', {"structure": 'abc'}, 3600, changed=False)
+    assert state.get_baseline('a.com') == ({"structure": 'abc'}, 3600)
+    assert not state.is_due('a.com')
+    assert state.due_urls() == ['b.com']
+    state.save_baseline('b.com', {}, -1, changed=True)
+    assert state.due_urls() == ['b.com']
+    state.close()
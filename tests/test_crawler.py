@@ -0,0 +1,88 @@
+import asyncio
+import contextlib
+import queue
+from types import SimpleNamespace
+
+from se_crawler.blob_store import BlobStore, SiteCapture
+from se_crawler.crawl_state import CrawlState, FAILED
+from se_crawler.host_scheduler import HostScheduler
+from Crawler import CrawlerConfig, distribute_urls, monitor_changes, monitor_or_fail, shard_index
+
+class CrashingLease:
+    context = None
+
+    async def new_page(self):
+        raise RuntimeError('Browser has been closed')
+
+def fake_crawler(tmp_path, scheduler):
+    async def check(url):
+        return {"viable": True, "reason": None}
+
+    @contextlib.asynccontextmanager
+    async def lease():
+        yield CrashingLease()
+
+    return SimpleNamespace(
+        config=CrawlerConfig(), state=CrawlState(str(tmp_path / 'state.db')), scheduler=scheduler,
+        controller=SimpleNamespace(sites=contextlib.nullcontext()), preflight=SimpleNamespace(check=check),
+        policy=SimpleNamespace(take_log=lambda context: []), lease=lease,
+    )
+
+def test_browser_crash_fails_the_url(tmp_path):
+    crawler = fake_crawler(tmp_path, HostScheduler(min_interval=0))
+    reported = []
+    asyncio.run(monitor_or_fail(crawler, 'a.com', lambda url, status: reported.append(status)))
+    assert reported == ['failed']
+    assert crawler.state.get_state('a.com')[:2] == (FAILED, 'Browser has been closed')
+    crawler.state.close()
+
+def test_deferred_url_failure_is_reported(tmp_path):
+    crawler = fake_crawler(tmp_path, HostScheduler(max_sites_per_host=1, min_interval=0))
+    reported = []
+
+    async def run():
+        async with crawler.scheduler.slot('a.com/1'):
+            await monitor_or_fail(crawler, 'a.com/2', lambda url, status: reported.append((url, status)))
+            assert reported == []
+        await crawler.scheduler.drain()
+
+    asyncio.run(run())
+    assert reported == [('a.com/2', 'failed')]
+    assert crawler.state.get_state('a.com/2')[0] == FAILED
+    crawler.state.close()
+
+class FakeRecorder:
+    def __init__(self, capture):
+        self.capture = capture
+        self.options = None
+
+    async def snapshot(self, html=False):
+        self.options = html
+        state = {"url": 'https://a.com/landing', "records": [], "frames": [], "cookies": None, "storage": None}
+        if html:
+            state["html"] = '<html>' + 'x' * 100 + '</html>'
+        return state
+
+def test_redirect_changes_carry_spilled_html(tmp_path):
+    recorder = FakeRecorder(SiteCapture(BlobStore(str(tmp_path)), 'a.com', inline_max=10))
+    plain = asyncio.run(monitor_changes('click', recorder))
+    assert 'html' not in plain and recorder.options is False
+    changes = asyncio.run(monitor_changes('redirect', recorder, html=True))
+    assert changes["html"]["bytes"] == 113
+    assert recorder.capture.store.get(changes["html"]["blob"]).startswith(b'<html>')
+
+def test_dead_worker_shard_moves_to_live_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr('Crawler.WORKER_PUT_TIMEOUT', 0.01)
+    config = CrawlerConfig(state_db=str(tmp_path / 'state.db'), monitored_file=str(tmp_path / 'none.txt'))
+    urls = [f'site{i}.com' for i in range(20)]
+    # Worker 0 died with a full queue
+    stuck = queue.Queue(maxsize=1)
+    stuck.put('left.com')
+    live = queue.Queue()
+    processes = [SimpleNamespace(name='crawler-worker-0', is_alive=lambda: False),
+                 SimpleNamespace(name='crawler-worker-1', is_alive=lambda: True)]
+    assert any(shard_index(url, 2) == 0 for url in urls)
+
+    distribute_urls(urls, [stuck, live], config, processes)
+    assert [live.get_nowait() for _ in range(live.qsize())] == urls + [None]
+    assert stuck.get_nowait() == 'left.com'
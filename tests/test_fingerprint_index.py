@@ -0,0 +1,73 @@
+from se_crawler.fingerprint_index import FingerprintIndex, fingerprint, normalize_content, normalize_src
+
+SCRIPT = ''.join(f'function f{i}(a) {{ return a * {i} + g{i}(a); }}\n' for i in range(200))
+
+def test_normalization_ignores_comments_whitespace_and_volatile_values():
+    assert normalize_content('a  =  1; // note\n/* block */ b = 1700000000;') == 'a = 1; b = 0;'
+    assert normalize_src('https://CDN.example.com/js/app.0123456789abcdef0123.js?v=3') == 'cdn.example.com/js/app.0.js'
+    assert fingerprint('script', 'https://a.com/x.js?v=1', 'var a = 1;')["hash"] == \
+        fingerprint('script', 'https://a.com/x.js?v=2', 'var a  =  1; // build 1234567')["hash"]
+    assert fingerprint('script', None, 'var a = 1;')["hash"] != fingerprint('stylesheet', None, 'var a = 1;')["hash"]
+
+def record_run(db, run_id, site, resources):
+    index = FingerprintIndex(db, run_id)
+    log = []
+    fingerprints = index.open_site(site, log)
+    fingerprints.append({"initial_js": resources})
+    fingerprints.commit()
+    index.close()
+    return log
+
+def test_sites_for_exact_and_src_queries(tmp_path):
+    db = str(tmp_path / 'fp.db')
+    script = {"type": 'script', "src": 'https://cdn.example.com/track.js', "content": SCRIPT}
+    log = record_run(db, 'run1', 'a.com', [script])
+    record_run(db, 'run1', 'b.com', [script])
+    assert len(log) == 1
+
+    index = FingerprintIndex(db)
+    [result] = index.sites_for('track.js')
+    assert result["sites"] == ['http://a.com/', 'http://b.com/']
+    assert result["src"] == 'cdn.example.com/track.js'
+    assert index.sites_for(result["hash"])[0]["sites"] == result["sites"]
+    assert index.top() == [{"hash": result["hash"], "kind": 'script', "src": 'cdn.example.com/track.js', "sites": 2}]
+    index.close()
+
+def test_fuzzy_query_finds_near_duplicates(tmp_path):
+    db = str(tmp_path / 'fp.db')
+    original = {"type": 'script', "src": 'https://a.com/t.js', "content": SCRIPT}
+    edited = {"type": 'script', "src": 'https://a.com/t.js', "content": SCRIPT + 'f1(2);'}
+    record_run(db, 'run1', 'a.com', [original])
+    record_run(db, 'run1', 'b.com', [edited])
+
+    index = FingerprintIndex(db)
+    [exact] = index.sites_for(fingerprint('script', original["src"], SCRIPT)["hash"])
+    assert exact["sites"] == ['http://a.com/']
+    fuzzy = index.sites_for(exact["hash"], fuzzy=True)
+    assert sorted(site for result in fuzzy for site in result["sites"]) == ['http://a.com/', 'http://b.com/']
+    index.close()
+
+def test_changes_since_last_run(tmp_path, monkeypatch):
+    db = str(tmp_path / 'fp.db')
+    old = {"type": 'script', "src": 'https://a.com/old.js', "content": 'old();'}
+    kept = {"type": 'script', "src": 'https://a.com/kept.js', "content": 'kept();'}
+    new = {"type": 'script', "src": 'https://a.com/new.js', "content": 'fresh();'}
+    clock = iter([100.0, 200.0])
+    monkeypatch.setattr('se_crawler.fingerprint_index.time.time', lambda: next(clock))
+    record_run(db, 'run1', 'a.com', [old, kept])
+    record_run(db, 'run2', 'a.com', [kept, new])
+
+    index = FingerprintIndex(db)
+    changes = index.changes_since_last_run('A.com')
+    assert changes["runs"] == ['run2', 'run1']
+    assert [fp["src"] for fp in changes["added"]] == ['a.com/new.js']
+    assert [fp["src"] for fp in changes["removed"]] == ['a.com/old.js']
+    assert index.changes_since_last_run('other.com')["runs"] == []
+    index.close()
+
+def test_resources_without_content_are_not_refingerprinted(tmp_path):
+    index = FingerprintIndex(str(tmp_path / 'fp.db'))
+    fingerprints = index.open_site('a.com', [])
+    fingerprints.append({"new_scripts": [{"type": 'script', "src": 'https://a.com/x.js', "hash": 'abc'}]})
+    assert fingerprints.fingerprints == {}
+    index.close()
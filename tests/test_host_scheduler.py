@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from se_crawler.host_scheduler import (HostScheduler, classify_failure, retry_delay, HOST_FAILURE_LIMIT,
+                                       RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+
+class TimeoutError(Exception):
+    """Stands in for Playwright's TimeoutError, which is matched by name."""
+
+@pytest.mark.parametrize('message, reason', [
+    ('net::ERR_NAME_NOT_RESOLVED at http://a.invalid/', 'dns'),
+    ('net::ERR_CONNECTION_REFUSED at http://a.com/', 'connection_refused'),
+    ('net::ERR_CONNECTION_CLOSED', 'connection_reset'),
+    ('net::ERR_CERT_DATE_INVALID', 'tls'),
+    ('net::ERR_TOO_MANY_REDIRECTS', 'redirect_loop'),
+    ('net::ERR_BLOCKED_BY_CLIENT at http://a.com/', 'blocked'),
+    ('Timeout 30000ms exceeded.', 'timeout'),
+    ('Target page, context or browser has been closed', 'other'),
+])
+def test_classify_failure(message, reason):
+    assert classify_failure(Exception(message)) == reason
+    assert classify_failure(message) == reason
+
+def test_classify_failure_by_exception_type():
+    assert classify_failure(TimeoutError('navigation stalled')) == 'timeout'
+
+def test_retry_delay_grows_with_jitter_and_cap():
+    for attempt in (1, 2, 3):
+        base = RETRY_BASE_DELAY * 2 ** (attempt - 1)
+        assert all(base <= retry_delay(attempt) <= base * 1.25 for _ in range(50))
+    assert all(RETRY_MAX_DELAY <= retry_delay(20) <= RETRY_MAX_DELAY * 1.25 for _ in range(50))
+
+def test_record_failure_retries_transient_failures_up_to_the_limit():
+    scheduler = HostScheduler(max_attempts=3)
+    assert scheduler.record_failure('a.com/1', 'timeout') is not None
+    assert scheduler.record_failure('a.com/1', 'timeout') is not None
+    assert scheduler.record_failure('a.com/1', 'timeout') is None
+    assert scheduler.record_failure('a.com/2', 'tls') is None
+    assert scheduler.dead_reason('a.com/3') is None
+
+def test_record_failure_marks_hosts_dead():
+    scheduler = HostScheduler()
+    scheduler.record_failure('gone.invalid/x', 'dns')
+    assert scheduler.dead_reason('http://gone.invalid/y') == 'dns'
+
+    for i in range(HOST_FAILURE_LIMIT - 1):
+        scheduler.record_failure(f'down.com/{i}', 'connection_refused')
+    assert scheduler.dead_reason('down.com') is None
+    scheduler.record_success('down.com/ok')
+    for i in range(HOST_FAILURE_LIMIT):
+        scheduler.record_failure(f'down.com/{i}', 'connection_refused')
+    assert scheduler.dead_reason('down.com') == 'connection_refused'
+
+def test_busy_host_urls_are_deferred_not_waited_for():
+    async def run():
+        scheduler = HostScheduler(max_sites_per_host=1, min_interval=0, max_deferred=1)
+        started = []
+
+        async def visit(url):
+            started.append(url)
+            await asyncio.sleep(0.01)
+
+        async with scheduler.slot('a.com/1'):
+            assert not scheduler.available('a.com/2')
+            assert scheduler.available('b.com/1')
+            assert scheduler.defer('a.com/2', lambda: visit('a.com/2'))
+            # Only max_deferred URLs per host may wait in the background
+            assert not scheduler.defer('a.com/3', lambda: visit('a.com/3'))
+            await asyncio.sleep(0.01)
+            assert started == []
+        await scheduler.drain()
+        return started
+
+    assert asyncio.run(run()) == ['a.com/2']
@@ -0,0 +1,55 @@
+import asyncio
+
+from se_crawler.metrics import MetricsRegistry, current_trace, start_trace, timed
+
+def test_prometheus_rendering():
+    registry = MetricsRegistry()
+    sites = registry.counter('sites_total', "Sites by outcome")
+    sites.inc(outcome='done')
+    sites.inc(2, outcome='done')
+    registry.gauge('queue_depth', "Queued URLs", callback=lambda: 7)
+    latency = registry.histogram('latency_seconds', "Latency", buckets=(1, 5))
+    latency.observe(0.5, phase='nav')
+    latency.observe(3, phase='nav')
+
+    assert registry.render_prometheus().splitlines() == [
+        '# HELP sites_total Sites by outcome',
+        '# TYPE sites_total counter',
+        'sites_total{outcome="done"} 3',
+        '# HELP queue_depth Queued URLs',
+        '# TYPE queue_depth gauge',
+        'queue_depth 7',
+        '# HELP latency_seconds Latency',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{phase="nav",le="1"} 1',
+        'latency_seconds_bucket{phase="nav",le="5"} 2',
+        'latency_seconds_bucket{phase="nav",le="+Inf"} 2',
+        'latency_seconds_sum{phase="nav"} 3.5',
+        'latency_seconds_count{phase="nav"} 2',
+    ]
+
+def test_registering_twice_returns_the_same_metric():
+    registry = MetricsRegistry()
+    assert registry.counter('c', "first") is registry.counter('c', "second")
+
+def test_histogram_quantiles_and_snapshot():
+    registry = MetricsRegistry()
+    latency = registry.histogram('latency_seconds', "Latency", buckets=(1, 5, 10))
+    assert latency.quantile(0.5) is None
+    for value in (0.5, 0.5, 4, 20):
+        latency.observe(value)
+    assert latency.quantile(0.5) == 1
+    assert latency.quantile(0.95) == float('inf')
+    assert registry.snapshot()["metrics"]["latency_seconds"] == {
+        'total': {"count": 4, "sum": 25.0, "p50": 1, "p95": float('inf')}}
+
+def test_timed_phases_are_added_to_the_current_trace():
+    async def run():
+        trace = start_trace()
+        with timed('navigation'):
+            pass
+        return trace
+
+    trace = asyncio.run(run())
+    assert [span["phase"] for span in trace] == ['navigation']
+    assert current_trace.get() is None
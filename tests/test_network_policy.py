@@ -0,0 +1,122 @@
+import asyncio
+from email.utils import formatdate
+from types import SimpleNamespace
+
+import pytest
+
+from se_crawler.network_policy import (NetworkPolicy, HttpCache, cache_key, cache_ttl, host_matches,
+                                       HTTP_CACHE_HEURISTIC_MAX_TTL)
+
+NOW = 1_700_000_000
+
+def http_date(timestamp):
+    return formatdate(timestamp, usegmt=True)
+
+@pytest.mark.parametrize('headers, ttl', [
+    ({'cache-control': 'public, max-age=600'}, 600),
+    ({'cache-control': 'max-age=0'}, None),
+    ({'cache-control': 'no-store'}, None),
+    ({'cache-control': 'no-cache, max-age=600'}, None),
+    ({'cache-control': 'private, max-age=600'}, None),
+    ({'date': http_date(NOW), 'expires': http_date(NOW + 120)}, 120),
+    ({'date': http_date(NOW), 'expires': http_date(NOW - 120)}, None),
+    ({'date': http_date(NOW), 'expires': '0'}, None),
+    # max-age wins over Expires
+    ({'cache-control': 'max-age=60', 'date': http_date(NOW), 'expires': http_date(NOW + 3600)}, 60),
+    ({'date': http_date(NOW), 'last-modified': http_date(NOW - 1000)}, 100),
+    ({'date': http_date(NOW), 'last-modified': http_date(NOW - 365 * 86400)}, HTTP_CACHE_HEURISTIC_MAX_TTL),
+    ({}, None),
+    ({'etag': '"abc"'}, None),
+])
+def test_cache_ttl(headers, ttl):
+    assert cache_ttl(headers) == ttl
+
+@pytest.mark.parametrize('vary, cacheable', [
+    ('Accept-Encoding', True),
+    ('accept, Accept-Language', True),
+    ('Cookie', False),
+    ('User-Agent, Accept', False),
+    ('*', False),
+])
+def test_cache_ttl_honours_vary(vary, cacheable):
+    assert (cache_ttl({'cache-control': 'max-age=60', 'vary': vary}) is not None) == cacheable
+
+def test_cache_key_depends_on_representation_headers():
+    url = 'https://cdn.example.com/app.js'
+    assert cache_key(url, {'accept': '*/*'}) == cache_key(url, {'accept': '*/*', 'cookie': 'a=1'})
+    assert cache_key(url, {'accept-language': 'en'}) != cache_key(url, {'accept-language': 'de'})
+
+def test_http_cache_prunes_expired_entries_then_soonest_expiring(tmp_path, monkeypatch):
+    monkeypatch.setattr('se_crawler.network_policy.time.time', lambda: NOW)
+    cache = HttpCache(str(tmp_path), max_bytes=2500)
+    for key, expires in (('aa01', NOW - 1), ('bb02', NOW + 10), ('cc03', NOW + 20), ('dd04', NOW + 30)):
+        cache.put(key, {"expires": expires}, b'x' * 1000)
+    (tmp_path / 'ee').mkdir()
+    (tmp_path / 'ee' / 'ee05.json').write_text('not json')
+
+    assert cache.prune() == 3
+    assert [key for key in ('aa01', 'bb02', 'cc03', 'dd04') if cache.get(key)] == ['cc03', 'dd04']
+    assert not (tmp_path / 'ee' / 'ee05.json').exists()
+
+def test_http_cache_prunes_as_it_is_written(tmp_path, monkeypatch):
+    monkeypatch.setattr('se_crawler.network_policy.time.time', lambda: NOW)
+    cache = HttpCache(str(tmp_path), max_bytes=1500, prune_every=2000)
+    cache.put('aa01', {"expires": NOW + 10}, b'x' * 1000)
+    cache.put('bb02', {"expires": NOW + 20}, b'x' * 1000)
+    assert cache.get('aa01') is None
+    assert cache.get('bb02') is not None
+
+def test_host_matches_subdomains_only():
+    assert host_matches('www.google-analytics.com', {'google-analytics.com'})
+    assert not host_matches('notgoogle-analytics.com', {'google-analytics.com'})
+
+class FakeResponse:
+    status = 200
+
+    def __init__(self, headers, body):
+        self.headers = headers
+        self.content = body
+        self.body_read = False
+
+    async def body(self):
+        self.body_read = True
+        return self.content
+
+    async def dispose(self):
+        pass
+
+class FakeRoute:
+    def __init__(self, response):
+        self.response = response
+        self.aborted = None
+        self.fulfilled = None
+
+    async def fetch(self, max_redirects=None):
+        return self.response
+
+    async def abort(self, error_code):
+        self.aborted = error_code
+
+    async def fulfill(self, status, headers, body):
+        self.fulfilled = body
+
+def route_document(policy, response):
+    route = FakeRoute(response)
+    request = SimpleNamespace(url='https://a.com/', resource_type='document', method='GET', headers={})
+    asyncio.run(policy._handle('context', route, request))
+    return route
+
+def test_declared_oversized_response_is_aborted_unread():
+    policy = NetworkPolicy(max_response_bytes=100)
+    response = FakeResponse({'content-length': '5000'}, b'x' * 5000)
+    route = route_document(policy, response)
+    assert route.aborted == 'blockedbyclient'
+    assert not response.body_read
+    assert policy.take_log('context')[0]["reason"] == 'too_large:5000'
+
+def test_undeclared_oversized_response_is_aborted_after_reading():
+    policy = NetworkPolicy(max_response_bytes=100)
+    route = route_document(policy, FakeResponse({}, b'x' * 500))
+    assert route.aborted == 'blockedbyclient'
+    assert policy.take_log('context')[0]["reason"] == 'too_large:500'
+    assert route_document(policy, FakeResponse({'content-length': '5'}, b'hello')).fulfilled == b'hello'
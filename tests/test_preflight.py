@@ -0,0 +1,43 @@
+import pytest
+
+from se_crawler.preflight import PreflightCache, PREFLIGHT_DEAD_TTL, PREFLIGHT_REFUSED_TTL, PREFLIGHT_VIABLE_TTL
+
+NOW = 1_700_000_000
+
+def verdict(viable, reason=None, status=None):
+    return {"viable": viable, "reason": reason, "status": status, "final_url": None}
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr('se_crawler.preflight.time.time', lambda: NOW)
+    cache = PreflightCache(str(tmp_path / 'preflight.db'))
+    yield cache
+    cache.close()
+
+def expires(cache, key):
+    return cache.conn.execute('SELECT expires FROM verdicts WHERE key = ?', (key,)).fetchone()[0] - NOW
+
+def test_host_level_verdicts_apply_to_every_url_of_the_host(cache):
+    cache.put('http://parked.com/a', verdict(False, 'parked', 200))
+    assert cache.get('http://parked.com/other')["reason"] == 'parked'
+    assert cache.get('http://parked.com/other')["cached"]
+    assert cache.get('http://www.parked.com/') is None
+    assert expires(cache, 'host:parked.com') == PREFLIGHT_DEAD_TTL
+
+def test_url_level_verdicts_and_ttls(cache):
+    cache.put('http://a.com/', verdict(True, None, 200))
+    cache.put('http://a.com/gone', verdict(False, 'http_404', 404))
+    cache.put('http://b.com/', verdict(False, 'connection_refused'))
+    assert cache.get('http://a.com/')["viable"]
+    assert cache.get('http://a.com/gone')["status"] == 404
+    assert cache.get('http://a.com/other') is None
+    assert expires(cache, 'url:http://a.com/') == PREFLIGHT_VIABLE_TTL
+    assert expires(cache, 'url:http://a.com/gone') == PREFLIGHT_DEAD_TTL
+    # A refused connection is not a host-wide verdict and expires soon
+    assert expires(cache, 'url:http://b.com/') == PREFLIGHT_REFUSED_TTL
+    assert cache.get('http://b.com/other') is None
+
+def test_expired_verdicts_are_ignored(cache, monkeypatch):
+    cache.put('http://b.com/', verdict(False, 'connection_refused'))
+    monkeypatch.setattr('se_crawler.preflight.time.time', lambda: NOW + PREFLIGHT_REFUSED_TTL + 1)
+    assert cache.get('http://b.com/') is None
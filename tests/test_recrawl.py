@@ -0,0 +1,26 @@
+from se_crawler.recrawl import (diverged, next_interval, script_similarity, RECRAWL_INITIAL_INTERVAL,
+                                RECRAWL_MAX_INTERVAL, RECRAWL_MIN_INTERVAL)
+
+BASELINE = {"structure": 'abc', "scripts": [f's{i}' for i in range(20)], "chain": ['http://a.com/']}
+
+def test_unchanged_site_has_not_diverged():
+    assert diverged(BASELINE, dict(BASELINE)) is None
+
+def test_diverged_reports_the_first_difference():
+    assert diverged(BASELINE, {**BASELINE, "chain": ['http://a.com/', 'http://b.com/']}) == 'redirect_chain'
+    assert diverged(BASELINE, {**BASELINE, "scripts": BASELINE["scripts"][:10]}) == 'scripts'
+    assert diverged(BASELINE, {**BASELINE, "structure": 'xyz'}) == 'structure'
+
+def test_small_script_churn_is_tolerated():
+    # One rotated script out of twenty keeps the Jaccard similarity above the threshold
+    scripts = BASELINE["scripts"][:-1] + ['rotated']
+    assert script_similarity(BASELINE["scripts"], scripts) < 1
+    assert diverged(BASELINE, {**BASELINE, "scripts": scripts}) is None
+    assert script_similarity([], []) == 1.0
+
+def test_next_interval():
+    assert next_interval(None, changed=False) == RECRAWL_INITIAL_INTERVAL
+    assert next_interval(RECRAWL_INITIAL_INTERVAL, changed=True) == RECRAWL_INITIAL_INTERVAL / 2
+    assert next_interval(RECRAWL_MIN_INTERVAL, changed=True) == RECRAWL_MIN_INTERVAL
+    assert next_interval(RECRAWL_INITIAL_INTERVAL, changed=False) > RECRAWL_INITIAL_INTERVAL
+    assert next_interval(RECRAWL_MAX_INTERVAL, changed=False) == RECRAWL_MAX_INTERVAL
@@ -0,0 +1,39 @@
+import gzip
+import json
+import os
+
+from se_crawler.results_sink import ResultsSink, read_results, RESULTS_INDEX
+
+def test_records_are_read_back_per_site_in_order(tmp_path):
+    sink = ResultsSink(str(tmp_path), sync_interval=0.05)
+    first = sink.open_site('Example.com')
+    other = sink.open_site('other.com')
+    first.append({"n": 1})
+    other.append({"n": 'x'})
+    first.append({"n": 2})
+    sink.close()
+
+    assert len(first) == 2
+    assert list(read_results('http://example.com/', str(tmp_path))) == [
+        {"site": 'Example.com', "n": 1}, {"site": 'Example.com', "n": 2}]
+    assert [r["n"] for r in read_results('other.com', str(tmp_path))] == ['x']
+    assert list(read_results('missing.com', str(tmp_path))) == []
+
+def test_attempt_is_stamped_on_records(tmp_path):
+    sink = ResultsSink(str(tmp_path))
+    sink.open_site('a.com', attempt=3).append({"n": 1})
+    sink.close()
+    assert list(read_results('a.com', str(tmp_path))) == [{"site": 'a.com', "attempt": 3, "n": 1}]
+
+def test_segments_rotate_and_stay_valid_gzip(tmp_path):
+    sink = ResultsSink(str(tmp_path), segment_max_bytes=1)
+    log = sink.open_site('a.com')
+    for n in range(3):
+        log.append({"n": n})
+    sink.close()
+
+    segments = sorted(name for name in os.listdir(tmp_path) if name != RESULTS_INDEX and name.endswith('.gz'))
+    assert len(segments) == 3
+    lines = [json.loads(gzip.open(os.path.join(tmp_path, name)).read()) for name in segments]
+    assert sorted(line["n"] for line in lines) == [0, 1, 2]
+    assert [r["n"] for r in read_results('a.com', str(tmp_path))] == [0, 1, 2]
@@ -0,0 +1,73 @@
+import asyncio
+
+from se_crawler.crawl_state import CrawlState, NAVIGATING, DONE, FAILED
+from se_crawler.url_source import dedup_urls, feed_queue, iter_urls
+
+def test_iter_urls_skips_comments_and_blanks(tmp_path):
+    source = tmp_path / 'urls.txt'
+    source.write_text('# sites\n\na.com\nnot a url\n  b.com  \n')
+    assert list(iter_urls(str(source))) == ['a.com', 'b.com']
+
+def test_dedup_urls_skips_duplicates_malformed_and_monitored(tmp_path):
+    state = CrawlState(str(tmp_path / 'state.db'))
+    state.mark_monitored('done.com')
+    urls = ['a.com', 'http://A.com/', 'http://[oops', 'done.com', 'b.com', 'a.com#x']
+    assert list(dedup_urls(urls, state)) == ['a.com', 'b.com']
+    state.close()
+
+def test_dedup_urls_resume(tmp_path):
+    db = str(tmp_path / 'state.db')
+    state = CrawlState(db)
+    list(dedup_urls(['a.com', 'b.com', 'c.com', 'd.com'], state))
+    state.set_state('a.com', DONE)
+    state.set_state('b.com', FAILED, 'dns')
+    state.set_state('c.com', NAVIGATING)
+    state.close()
+
+    # The interrupted run left c.com navigating and d.com queued: those come first, finished ones are skipped
+    state = CrawlState(db)
+    urls = list(dedup_urls(['a.com', 'b.com', 'c.com', 'd.com', 'e.com', 'e.com'], state, resume=True))
+    assert urls == ['d.com', 'c.com', 'e.com']
+    state.close()
+
+def test_dedup_urls_without_resume_retries_failed(tmp_path):
+    db = str(tmp_path / 'state.db')
+    state = CrawlState(db)
+    list(dedup_urls(['a.com'], state))
+    state.set_state('a.com', FAILED, 'timeout')
+    state.close()
+
+    state = CrawlState(db)
+    assert list(dedup_urls(['a.com', 'a.com'], state)) == ['a.com']
+    state.close()
+
+def test_dedup_urls_retry_failed_within_a_run(tmp_path):
+    state = CrawlState(str(tmp_path / 'state.db'))
+    assert list(dedup_urls(['a.com', 'b.com'], state)) == ['a.com', 'b.com']
+    state.set_state('a.com', FAILED, 'timeout')
+    state.set_state('b.com', NAVIGATING)
+    assert list(dedup_urls(['a.com', 'b.com'], state)) == []
+    # Posted again to the service: the failed URL is queued once more, the one in flight is not
+    assert list(dedup_urls(['a.com', 'a.com', 'b.com'], state, retry_failed=True)) == ['a.com']
+    state.close()
+
+def test_dedup_urls_recrawl(tmp_path):
+    state = CrawlState(str(tmp_path / 'state.db'))
+    for url in ('due.com', 'fresh.com'):
+        state.mark_monitored(url)
+    state.save_baseline('due.com', {}, -1, changed=False)
+    state.save_baseline('fresh.com', {}, 3600, changed=False)
+    urls = ['due.com', 'fresh.com', 'due.com', 'new.com']
+    assert list(dedup_urls(urls, state, recrawl=True)) == ['due.com', 'new.com']
+    state.close()
+
+def test_feed_queue_runs_dedup_in_a_reader_thread(tmp_path):
+    state = CrawlState(str(tmp_path / 'state.db'))
+
+    async def feed():
+        queue = asyncio.Queue()
+        await feed_queue(dedup_urls(['a.com', 'a.com', 'b.com'], state), queue, num_workers=2)
+        return [queue.get_nowait() for _ in range(queue.qsize())]
+
+    assert asyncio.run(feed()) == ['a.com', 'b.com', None, None]
+    state.close()
@@ -0,0 +1,33 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from se_crawler.visual_diff import changed_regions, CELL_SIZE
+
+def test_unchanged_mask_has_no_regions():
+    assert changed_regions(np.zeros((64, 64), dtype=bool)) == []
+
+def test_separate_blocks_become_separate_regions_largest_first():
+    mask = np.zeros((128, 128), dtype=bool)
+    mask[0:16, 0:16] = True
+    mask[64:112, 64:128] = True
+    regions = changed_regions(mask)
+    assert regions == [(64, 64, 112, 128, 48 * 64), (0, 0, 16, 16, 16 * 16)]
+    assert all(type(value) is int for region in regions for value in region)
+
+def test_touching_cells_merge_including_diagonals():
+    mask = np.zeros((64, 64), dtype=bool)
+    mask[0:16, 0:16] = True
+    mask[16:32, 16:32] = True
+    assert changed_regions(mask) == [(0, 0, 32, 32, 2 * 16 * 16)]
+
+def test_sparse_noise_is_ignored():
+    mask = np.zeros((64, 64), dtype=bool)
+    # A few scattered pixels per cell stay below CELL_MIN_RATIO
+    mask[::CELL_SIZE, ::CELL_SIZE] = True
+    assert changed_regions(mask) == []
+
+def test_regions_are_clipped_to_the_mask():
+    mask = np.zeros((20, 20), dtype=bool)
+    mask[16:20, 16:20] = True
+    assert changed_regions(mask) == [(16, 16, 20, 20, 16)]